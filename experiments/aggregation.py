@@ -0,0 +1,70 @@
+import click
+
+import numpy as np
+
+from time import perf_counter
+from typing import List, Dict
+
+from generic_vectorizer.log import logger
+from generic_vectorizer.codec import aggregate_dense
+from generic_vectorizer.grpc_server.interfaces.strategies_pb2 import DenseAggregation
+
+from numpy.typing import NDArray
+
+# dense aggregation of the chunks of a batch of texts, measured on its own (no model)
+# loop : previous implementation, one cosine matrix per text in a python loop
+# vectorised : codec.aggregate_dense, segment sums over the whole batch, one numpy pass per chunk position
+# usage : PYTHONPATH=. python experiments/aggregation.py --nb_texts 4096 --max_chunks 4
+
+def aggregate_embeddings(embeddings:NDArray) -> NDArray:
+    if embeddings.shape[0] == 1:
+        return embeddings[0]
+
+    dot_scores = embeddings @ embeddings.T
+    embedding_norms = np.linalg.norm(embeddings, axis=1)
+    cosine_similarity_scores = dot_scores / (embedding_norms[None, :] * embedding_norms[:, None] + 1e-8)
+    node_centrality_scores = np.sum(cosine_similarity_scores, axis=1, keepdims=True)
+    text_embedding:NDArray = np.mean(node_centrality_scores * embeddings, axis=0)
+    return text_embedding
+
+def loop_aggregation(dense_embeddings:NDArray, nb_chunks:List[int]) -> NDArray:
+    text_dense_embeddings = np.empty((len(nb_chunks), dense_embeddings.shape[1]), dtype=np.float32)
+    counter = 0
+    for index, nb_text_chunks in enumerate(nb_chunks):
+        text_dense_embeddings[index] = aggregate_embeddings(dense_embeddings[counter:counter+nb_text_chunks, :])
+        counter = counter + nb_text_chunks
+    return text_dense_embeddings
+
+def summarize(durations:List[float]) -> Dict[str, float]:
+    values = np.asarray(durations) * 1e3
+    return {'p50_ms': float(np.percentile(values, 50)), 'p99_ms': float(np.percentile(values, 99))}
+
+@click.command()
+@click.option('--nb_texts', default='64,1024,4096', help='comma separated batch sizes in texts')
+@click.option('--max_chunks', default=4, help='every text has between 1 and max_chunks chunks')
+@click.option('--dimension', default=1024)
+@click.option('--nb_iterations', default=20)
+def benchmark(nb_texts:str, max_chunks:int, dimension:int, nb_iterations:int):
+    rng = np.random.default_rng(0)
+    for batch_size in [ int(size) for size in nb_texts.split(',') ]:
+        nb_chunks = rng.integers(1, max_chunks + 1, size=batch_size)
+        dense_embeddings = rng.standard_normal((int(nb_chunks.sum()), dimension)).astype(np.float32)
+        dense_embeddings /= np.linalg.norm(dense_embeddings, axis=1, keepdims=True)
+        reference = loop_aggregation(dense_embeddings, nb_chunks.tolist())
+        assert np.allclose(aggregate_dense(dense_embeddings, nb_chunks, DenseAggregation.CENTRALITY_AGGREGATION), reference, atol=1e-4)
+
+        candidates = [
+            ('loop', lambda: loop_aggregation(dense_embeddings, nb_chunks.tolist())),
+            *[ (DenseAggregation.Name(mode).lower(), lambda mode=mode: aggregate_dense(dense_embeddings, nb_chunks, mode)) for mode in DenseAggregation.values() ]
+        ]
+        for name, aggregate in candidates:
+            durations:List[float] = []
+            for _ in range(nb_iterations):
+                start = perf_counter()
+                aggregate()
+                durations.append(perf_counter() - start)
+            stats = summarize(durations)
+            logger.info(f'{batch_size:>6d} texts | {len(dense_embeddings):>6d} chunks | {name:<23} | p50 {stats["p50_ms"]:9.3f}ms | p99 {stats["p99_ms"]:9.3f}ms')
+
+if __name__ == '__main__':
+    benchmark()
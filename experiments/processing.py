@@ -1,34 +1,49 @@
-import click 
+import click
 import asyncio
 
-from os import path 
-from glob import glob 
+from os import path
+from glob import glob
+from time import perf_counter
 
-from typing import List, Dict 
-from generic_vectorizer.log import logger 
+from typing import List, Dict
+from generic_vectorizer.log import logger
 from generic_vectorizer.client import AsyncEmbeddingClient
 
 from tqdm import tqdm
 
+def read_file(path2file:str) -> str:
+    with open(file=path2file, mode='r') as file_pointer:
+        return file_pointer.read()
+
+async def read_batch(file_paths:List[str]) -> List[str]:
+    return await asyncio.gather(*[ asyncio.to_thread(read_file, path2file) for path2file in file_paths ])
+
 async def batch_processing(path2corpus:str, grpc_server_address:str, batch_size:int, target_topic:str):
     file_paths:List[str] = sorted(glob(path.join(path2corpus, '*.txt')))
     client = AsyncEmbeddingClient(grpc_server_address=grpc_server_address)
     logger.info(f'{len(file_paths)} files were found')
-
-    accumulator:List[str] = []
-    for counter in tqdm(range(0, len(file_paths), batch_size)):
-        for index in range(counter, counter + batch_size):
-            path2file = file_paths[index]
-            with open(file=path2file, mode='r') as file_pointer:
-                content = file_pointer.read()
-                accumulator.append(content)
-        
-        batch_embedding_response = await client.get_batch_embedding(
-            texts=accumulator,
+    if len(file_paths) == 0:
+        return
+
+    batches = [ file_paths[counter:counter+batch_size] for counter in range(0, len(file_paths), batch_size) ]  # the last batch may be shorter
+    start = perf_counter()
+    nb_texts = 0
+    next_texts = asyncio.create_task(read_batch(batches[0]))
+    for index in tqdm(range(len(batches))):
+        texts = await next_texts
+        if index + 1 < len(batches):
+            next_texts = asyncio.create_task(read_batch(batches[index + 1]))  # the next batch is read while this one is embedded
+
+        await client.get_batch_embedding(
+            texts=texts,
             target_topic=target_topic,
             return_dense=True,
             return_sparse=True
         )
+        nb_texts += len(texts)
+
+    duration = perf_counter() - start
+    logger.info(f'{nb_texts} texts embedded in {duration:.2f}s : {nb_texts / duration:.2f} texts/s')
 
 @click.command()
 @click.option('--path2corpus', type=click.Path(exists=True, file_okay=False), required=True)
@@ -40,4 +55,4 @@ def process_files(path2corpus:str, grpc_server_address:str, batch_size:int, targ
 
 
 if __name__ == '__main__':
-    process_files()
\ No newline at end of file
+    process_files()
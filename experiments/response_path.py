@@ -0,0 +1,96 @@
+import click
+import asyncio
+
+import zmq
+import zmq.asyncio as aiozmq
+
+import numpy as np
+
+from time import perf_counter
+from typing import List, Dict, Tuple, Union
+
+from generic_vectorizer.log import logger
+
+# router -> broker -> client response hop, measured in isolation on inproc sockets
+# pickle : send_pyobj / recv_pyobj (previous implementation), the payload is pickled and unpickled
+# multipart : send_multipart / recv_multipart with copy=False, the payload buffer is handed over to zmq
+# direct : the router writes on the client facing ROUTER socket, the PUSH/PULL hop disappears
+# zero copy is measured : the received buffer must point to the memory of the sent payload
+# pyzmq still copies frames smaller than zmq.COPY_THRESHOLD even with copy=False
+# usage : PYTHONPATH=. python experiments/response_path.py --nb_iterations 200
+
+def buffer_address(buffer:Union[bytes, memoryview]) -> int:
+    return np.frombuffer(buffer, dtype=np.uint8).ctypes.data
+
+async def pickle_hop(ctx:aiozmq.Context, client_id:bytes, payload:bytes, nb_iterations:int) -> Tuple[List[float], bool]:
+    pusher_socket = ctx.socket(zmq.PUSH)
+    puller_socket = ctx.socket(zmq.PULL)
+    puller_socket.bind('inproc://pickle_hop')
+    pusher_socket.connect('inproc://pickle_hop')
+    durations:List[float] = []
+    for _ in range(nb_iterations):
+        start = perf_counter()
+        await pusher_socket.send_pyobj((client_id, payload))
+        target_client_id, encoded_message = await puller_socket.recv_pyobj()
+        durations.append(perf_counter() - start)
+    pusher_socket.close(linger=0)
+    puller_socket.close(linger=0)
+    return durations, buffer_address(encoded_message) == buffer_address(payload)
+
+async def multipart_hop(ctx:aiozmq.Context, client_id:bytes, payload:bytes, nb_iterations:int) -> Tuple[List[float], bool]:
+    pusher_socket = ctx.socket(zmq.PUSH)
+    puller_socket = ctx.socket(zmq.PULL)
+    puller_socket.bind('inproc://multipart_hop')
+    pusher_socket.connect('inproc://multipart_hop')
+    durations:List[float] = []
+    for _ in range(nb_iterations):
+        start = perf_counter()
+        await pusher_socket.send_multipart([client_id, payload], copy=False)
+        target_client_id, encoded_message = await puller_socket.recv_multipart(copy=False)
+        durations.append(perf_counter() - start)
+    pusher_socket.close(linger=0)
+    puller_socket.close(linger=0)
+    return durations, buffer_address(encoded_message.buffer) == buffer_address(payload)
+
+async def direct_hop(ctx:aiozmq.Context, client_id:bytes, payload:bytes, nb_iterations:int) -> Tuple[List[float], bool]:
+    # only the final send on the client facing socket remains, measured against a dealer reading the reply
+    router_socket = ctx.socket(zmq.ROUTER)
+    dealer_socket = ctx.socket(zmq.DEALER)
+    dealer_socket.setsockopt(zmq.IDENTITY, client_id)
+    router_socket.bind('inproc://direct_hop')
+    dealer_socket.connect('inproc://direct_hop')
+    await dealer_socket.send_multipart([b'', b'HELLO'])
+    await router_socket.recv_multipart()
+    durations:List[float] = []
+    for _ in range(nb_iterations):
+        start = perf_counter()
+        await router_socket.send_multipart([client_id, b'', payload], copy=False)
+        _, encoded_message = await dealer_socket.recv_multipart(copy=False)
+        durations.append(perf_counter() - start)
+    router_socket.close(linger=0)
+    dealer_socket.close(linger=0)
+    return durations, buffer_address(encoded_message.buffer) == buffer_address(payload)
+
+def summarize(durations:List[float]) -> Dict[str, float]:
+    values = np.asarray(durations) * 1e6
+    return {'p50_us': float(np.percentile(values, 50)), 'p99_us': float(np.percentile(values, 99))}
+
+async def run_benchmark(payload_sizes:List[int], nb_iterations:int):
+    ctx = aiozmq.Context()
+    client_id = b'\x00' * 13  # routing id + correlation id
+    for payload_size in payload_sizes:
+        payload = np.random.bytes(payload_size)
+        for name, hop in [('pickle', pickle_hop), ('multipart', multipart_hop), ('direct', direct_hop)]:
+            durations, zero_copy = await hop(ctx, client_id, payload, nb_iterations)
+            stats = summarize(durations)
+            logger.info(f'{payload_size:>10d} bytes | {name:<9} | p50 {stats["p50_us"]:9.1f}us | p99 {stats["p99_us"]:9.1f}us | zero copy {"yes" if zero_copy else "no"}')
+    ctx.term()
+
+@click.command()
+@click.option('--payload_sizes', default='1024,65536,1048576,8388608', help='comma separated payload sizes in bytes')
+@click.option('--nb_iterations', default=200, help='number of messages per payload size')
+def benchmark(payload_sizes:str, nb_iterations:int):
+    asyncio.run(run_benchmark([ int(size) for size in payload_sizes.split(',') ], nb_iterations))
+
+if __name__ == '__main__':
+    benchmark()
@@ -1,11 +1,12 @@
 import click 
 import asyncio
 import json
-from typing import List, Dict
+from typing import List, Dict, Optional
 
 from .vectorizer import Vectorizer
+from .bench import run_bench
 from .log import logger 
-from .typing import EmbedderModelConfig, EmbedderModelType
+from .typing import EmbedderModelConfig, EmbedderModelType, EmbeddingCacheConfig, TracingConfig, AutoscalerConfig, BenchConfig
 
 @click.group(chain=True, invoke_without_command=True)
 @click.pass_context
@@ -19,15 +20,29 @@ def load_config(config_path: str) -> Dict:
 def create_embedder_model_configs(config: Dict) -> List[EmbedderModelConfig]:
     return [
         EmbedderModelConfig(
-            embedder_model_type=EmbedderModelType[model_config['embedder_model_type']],
-            target_topic=model_config['target_topic'],
-            nb_instances=model_config['nb_instances'],
-            options=model_config['options'],
-            zmq_tcp_address=model_config.get('zmq_tcp_address')
+            **{
+                **model_config,
+                'embedder_model_type': EmbedderModelType[model_config['embedder_model_type']]
+            }
         )
         for model_config in config['embedder_model_configs']
     ]
 
+def create_embedding_cache_config(config: Dict) -> Optional[EmbeddingCacheConfig]:
+    if config.get('embedding_cache') is None:
+        return None
+    return EmbeddingCacheConfig(**config['embedding_cache'])
+
+def create_tracing_config(config: Dict) -> Optional[TracingConfig]:
+    if config.get('tracing') is None:
+        return None
+    return TracingConfig(**config['tracing'])
+
+def create_autoscaler_config(config: Dict) -> Optional[AutoscalerConfig]:
+    if config.get('autoscaler') is None:
+        return None
+    return AutoscalerConfig(**config['autoscaler'])
+
 @handler.command()
 @click.option('--config', type=click.Path(exists=True), required=True, help='Path to the configuration JSON file')
 @click.pass_context
@@ -40,12 +55,81 @@ def launch_engine(ctx: click.core.Context, config: str):
             grpc_server_address=config_data['grpc_server_address'],
             embedder_model_configs=embedder_model_configs,
             max_concurrent_requests=config_data['max_concurrent_requests'],
-            request_timeout=config_data['request_timeout']
+            request_timeout=config_data['request_timeout'],
+            embedding_cache_config=create_embedding_cache_config(config_data),
+            metrics_address=config_data.get('metrics_address'),
+            tracing_config=create_tracing_config(config_data),
+            autoscaler_config=create_autoscaler_config(config_data)
         )
         vectorizer.listen()
     except Exception as e:
         logger.error(f"Error launching engine: {str(e)}")
         raise click.ClickException(str(e))
 
+def parse_mix(mix: str) -> Dict[str, float]:
+    # embed=0.8,batch=0.1,rerank=0.1
+    operation2weight: Dict[str, float] = {}
+    for item in mix.split(','):
+        operation, _, weight = item.partition('=')
+        operation2weight[operation.strip()] = float(weight) if weight else 1.0
+    return operation2weight
+
+@handler.command()
+@click.option('--grpc_server_address', default='localhost:5000', help='Address of a running server, or the address the stub engine binds')
+@click.option('--embedding_topic', default='bge_m3', help='Topic used by embed and batch requests')
+@click.option('--rerank_topic', default=None, help='Topic used by rerank requests')
+@click.option('--mode', type=click.Choice(['open', 'closed']), default='closed', help='open : fixed arrival rate, closed : concurrent clients waiting for their answers')
+@click.option('--rps', type=float, default=50, help='Arrival rate of the open loop')
+@click.option('--arrival', type=click.Choice(['constant', 'poisson']), default='poisson')
+@click.option('--concurrency', type=int, default=16, help='Number of clients of the closed loop')
+@click.option('--duration', type=float, default=30, help='Measured duration in seconds')
+@click.option('--warmup', type=float, default=2, help='Unmeasured duration in seconds before the measure')
+@click.option('--text_length', default='uniform:16:256', help='Words per text : fixed:N, uniform:MIN:MAX or lognormal:MEDIAN:SIGMA')
+@click.option('--mix', default='embed=1', help='Weights of the request types, e.g. embed=0.8,batch=0.1,rerank=0.1')
+@click.option('--batch_size', type=int, default=16, help='Texts per batch request')
+@click.option('--nb_candidates', type=int, default=32, help='Candidates per rerank request')
+@click.option('--return_sparse', is_flag=True, help='Request sparse vectors as well')
+@click.option('--use_cache', is_flag=True, help='Let requests hit the server embedding cache')
+@click.option('--request_timeout', type=float, default=30)
+@click.option('--seed', type=int, default=0)
+@click.option('--stub', 'stub_instances', type=int, default=0, help='Launch a model free engine with this many stub workers instead of targeting a running server')
+@click.option('--stub_max_batch_size', type=int, default=32)
+@click.option('--stub_options', default='{}', help='JSON options of the stub workers, e.g. {"delay_ms": 5, "per_text_delay_ms": 0.5}')
+@click.option('--output', type=click.Path(dir_okay=False), default=None, help='Write the JSON report to this file')
+@click.pass_context
+def bench(ctx: click.core.Context, grpc_server_address: str, embedding_topic: str, rerank_topic: Optional[str], mode: str, rps: float, arrival: str,
+          concurrency: int, duration: float, warmup: float, text_length: str, mix: str, batch_size: int, nb_candidates: int, return_sparse: bool,
+          use_cache: bool, request_timeout: float, seed: int, stub_instances: int, stub_max_batch_size: int, stub_options: str, output: Optional[str]):
+    try:
+        bench_config = BenchConfig(
+            grpc_server_address=grpc_server_address,
+            embedding_topic=embedding_topic,
+            rerank_topic=rerank_topic or ('stub' if stub_instances > 0 else None),
+            mode=mode,
+            rps=rps,
+            arrival=arrival,
+            concurrency=concurrency,
+            duration=duration,
+            warmup=warmup,
+            text_length=text_length,
+            mix=parse_mix(mix),
+            batch_size=batch_size,
+            nb_candidates=nb_candidates,
+            return_sparse=return_sparse,
+            bypass_cache=not use_cache,
+            request_timeout=request_timeout,
+            seed=seed
+        )
+        report = run_bench(bench_config, stub_instances=stub_instances, stub_max_batch_size=stub_max_batch_size, stub_options=json.loads(stub_options))
+    except Exception as e:
+        logger.error(f"Error running bench: {str(e)}")
+        raise click.ClickException(str(e))
+
+    encoded_report = json.dumps(report, indent=2)
+    if output is not None:
+        with open(output, 'w') as output_file:
+            output_file.write(encoded_report)
+    click.echo(encoded_report)
+
 if __name__ == '__main__':
     handler()
\ No newline at end of file
@@ -1,23 +1,53 @@
+import gc 
 import zmq 
+import json 
 import multiprocessing as mp
 from operator import itemgetter, attrgetter
 
 import signal 
 from generic_vectorizer.log import logger 
 
-from time import sleep 
+from time import sleep, time 
+from dataclasses import dataclass
 
-from typing import List, Dict, Type, Any  
+from typing import List, Dict, Type, Any, Optional, Callable, Tuple
 
 from ..strategies.abstract_strategy import ABCStrategy
-from ..typing import EmbedderModelConfig
+from ..typing import EmbedderModelConfig, AutoscalerConfig, Job
+from ..tracing import Trace
 
 import generic_vectorizer.strategies as stratref
 
+def router2worker_address(config:EmbedderModelConfig) -> str:
+    if config.zmq_tcp_address is not None:
+        return config.zmq_tcp_address.replace('*', 'localhost')
+    return f'ipc:///tmp/router2worker_{config.target_topic}.ipc'
+
+@dataclass
+class WorkerHandle:
+    worker_id:str
+    config:EmbedderModelConfig
+    process:Optional[mp.Process]=None
+    started_at:float=0.0
+    restarts:int=0
+    consecutive_crashes:int=0
+    restart_at:Optional[float]=None  # set while a crashed worker waits for its restart
+    retiring:bool=False  # retired by the autoscaler, exits after its current batch and is not restarted
+
 class EmbedderPool:
-    def __init__(self, embedder_model_configs:List[EmbedderModelConfig]) -> None:
+    def __init__(self, embedder_model_configs:List[EmbedderModelConfig], restart_backoff:float=1.0, max_restart_backoff:float=60.0, stable_after:float=60.0, autoscaler_config:Optional[AutoscalerConfig]=None) -> None:
         assert len(embedder_model_configs) > 0, f"embedder_model_configs length must be grater then 0"
         self.embedder_model_configs = embedder_model_configs
+        self.restart_backoff = restart_backoff
+        self.max_restart_backoff = max_restart_backoff
+        self.stable_after = stable_after  # a worker that crashes after running that long restarts without backoff
+        self.autoscaler_config = autoscaler_config
+        self.worker_handles:List[WorkerHandle] = []
+        self.next_worker_id = 0
+        self.topic2notifier:Dict[str, zmq.Socket] = {}
+        self.topic2load_report:Dict[str, Tuple[float, Dict[str, Any]]] = {}  # previous report, the utilisation is measured between two reports
+        self.topic2scaled_at:Dict[str, float] = {}
+        self.topic2shared_strategy:Dict[str, ABCStrategy] = {}  # loaded in the parent, inherited by the forked workers
         for config in embedder_model_configs:
             try:
                 assert attrgetter(config.embedder_model_type)(stratref) is not None, f'{config.embedder_model_type} is not a valid model type'
@@ -25,9 +55,47 @@ class EmbedderPool:
                 logger.error(e)
                 exit(0)
     
+    def __getstate__(self) -> Dict[str, Any]:
+        # workers started with the spawn method receive a pickled pool : supervisor state (processes, zmq sockets) stays in the parent
+        return { key: value for key, value in self.__dict__.items() if key not in ('ctx', 'topic2notifier', 'worker_handles', 'topic2shared_strategy') }
+
     def build_strategy(self, strategy:Type[ABCStrategy], options:Dict[str, Any]) -> ABCStrategy:
         action = strategy(options)
         return action
+
+    def can_share_weights(self, config:EmbedderModelConfig) -> bool:
+        if not config.share_weights:
+            return False
+        if mp.get_start_method() != 'fork':
+            logger.warning(f'{config.target_topic} : share_weights requires the fork start method, each worker loads its own model')
+            return False
+        if str(config.options.get('device', 'cpu')).startswith('cuda'):  # a cuda context does not survive a fork
+            logger.warning(f'{config.target_topic} : share_weights is not supported on cuda devices, each worker loads its own model')
+            return False
+        if config.options.get('backend') == 'onnxruntime':  # the onnxruntime thread pools do not survive a fork either
+            logger.warning(f'{config.target_topic} : share_weights is not supported by the onnxruntime backend, each worker loads its own session')
+            return False
+        return True
+
+    def load_shared_strategies(self) -> None:
+        # the weights are loaded once, forked workers read the same pages until one of them writes (copy on write)
+        for config in self.embedder_model_configs:
+            if not self.can_share_weights(config):
+                continue
+            start = time()
+            strategy = attrgetter(config.embedder_model_type)(stratref)
+            self.topic2shared_strategy[config.target_topic] = self.build_strategy(strategy, config.options)
+            logger.info(f'{config.target_topic} : shared model was loaded in {time() - start:.1f}s | options >> {config.options}')
+        if len(self.topic2shared_strategy) > 0:
+            gc.collect()
+            gc.freeze()  # the collector of the workers must not touch (and copy) the pages of the inherited objects
+
+    def load_strategy(self, config:EmbedderModelConfig) -> ABCStrategy:
+        shared_strategy = self.topic2shared_strategy.get(config.target_topic, None)
+        if shared_strategy is not None:
+            return shared_strategy
+        strategy = attrgetter(config.embedder_model_type)(stratref)
+        return self.build_strategy(strategy, config.options)
     
     def processing(self, worker_id:str, config:EmbedderModelConfig):
         signal.signal(
@@ -36,8 +104,7 @@ class EmbedderPool:
         ) 
 
         try:
-            strategy = attrgetter(config.embedder_model_type)(stratref)
-            action = self.build_strategy(strategy, config.options)
+            action = self.load_strategy(config)
         except KeyboardInterrupt:
             logger.warning(f'{worker_id} cancelled...!')
             exit(-1)
@@ -50,12 +117,9 @@ class EmbedderPool:
         try:
             ctx = zmq.Context()
             dealer_socket:zmq.Socket = ctx.socket(socket_type=zmq.DEALER)
+            dealer_socket.setsockopt(zmq.IDENTITY, worker_id.encode())  # stable across restarts, the router forgets the dead worker by this id
             logger.info(f'{worker_id} socket was created')
-            topic = config.target_topic
-            broker2worker_addr = f'ipc:///tmp/router2worker_{topic}.ipc' 
-            if config.zmq_tcp_address is not None:
-                broker2worker_addr = config.zmq_tcp_address.replace('*', 'localhost')
-            dealer_socket.connect(addr=broker2worker_addr)  # add topics based on the flag_model_type 
+            dealer_socket.connect(addr=router2worker_address(config))
             socket_connected = True 
             logger.info(f'{worker_id} has performed the handshake with backend router')
             dealer_socket.send_multipart([b'', b'HANDSHAKE', b'', b''])
@@ -67,22 +131,56 @@ class EmbedderPool:
             exit(-1)
 
         
+        strategy_stats:Dict[str, int] = action.stats()
         while True:
             try:
                 incoming_signal = dealer_socket.poll(timeout=5000)
                 if incoming_signal != zmq.POLLIN:
                     continue
-                _, target_client_socket_id, encoded_task_type, encoded_client_message = dealer_socket.recv_multipart()
-                try:
-                    plain_worker_message = action.process(encoded_task_type, encoded_client_message)
-                    encoded_worker_message = plain_worker_message.SerializeToString()  # add exception around action.process
-                    dealer_socket.send_multipart([b'', b'RESPONSE', target_client_socket_id], flags=zmq.SNDMORE)
-                    dealer_socket.send(encoded_worker_message)
-                except Exception as e:
-                    logger.warning(e)
-                    dealer_socket.send_multipart([b'', b'RESPONSE', target_client_socket_id], flags=zmq.SNDMORE)
-                    dealer_socket.send_string(f'INTERNAL-ERROR:{str(e)}')  # USE ERROR TOPIC INSTEAD OF RESPONSE
-                logger.info(f'{worker_id} has consumed a message')   
+                _, worker_signal, *job_frames = dealer_socket.recv_multipart()
+                if worker_signal == b'RETIRE':  # the router sends it once the current batch is answered
+                    logger.info(f'{worker_id} was retired by the autoscaler')
+                    break
+                now = time()
+                jobs = Job.from_frames(job_frames)
+                # nobody is waiting for expired jobs anymore, do not spend model time on them
+                encoded_worker_messages = [ b'DEADLINE-EXCEEDED:job expired before processing' ] * len(jobs)
+                live_positions = [ position for position, job in enumerate(jobs) if not job.expired(now) ]
+                if len(live_positions) < len(jobs):
+                    logger.debug(f'{worker_id} has skipped {len(jobs) - len(live_positions)} expired message(s)')
+                nb_failed_jobs = 0
+                start = time()
+                if len(live_positions) > 0:
+                    try:
+                        plain_worker_messages = action.process_batch([ (jobs[position].task_type, jobs[position].message) for position in live_positions ])
+                        with action.stage_timer.stage('serialize'):
+                            live_worker_messages = [ plain_worker_message.SerializeToString() for plain_worker_message in plain_worker_messages ]
+                        nb_failed_jobs = sum(getattr(plain_worker_message, 'status', True) is False for plain_worker_message in plain_worker_messages)
+                    except Exception as e:
+                        logger.warning(e)
+                        live_worker_messages = [ f'INTERNAL-ERROR:{str(e)}'.encode() for _ in live_positions ]  # USE ERROR TOPIC INSTEAD OF RESPONSE
+                        nb_failed_jobs = len(live_positions)
+                    for position, encoded_worker_message in zip(live_positions, live_worker_messages):
+                        encoded_worker_messages[position] = encoded_worker_message
+                
+                stage_durations = action.stage_timer.reset()  # batch level : every traced job of the batch reports the same stages
+                for job, encoded_worker_message in zip(jobs, encoded_worker_messages):
+                    encoded_trace = Trace.annotate(job.trace, marks={'worker_received': now, 'worker_sent': time()}, durations=stage_durations)
+                    dealer_socket.send_multipart([b'', b'RESPONSE', job.client_id, encoded_trace], flags=zmq.SNDMORE)
+                    dealer_socket.send(encoded_worker_message, copy=False)
+                logger.debug(f'{worker_id} has consumed {len(jobs)} message(s)')   
+
+                # counters travel on the same channel as the responses, the grpc server aggregates them for /metrics
+                current_strategy_stats = action.stats()
+                worker_metrics = {
+                    'jobs': len(live_positions),
+                    'skipped_jobs': len(jobs) - len(live_positions),
+                    'failed_jobs': nb_failed_jobs,
+                    'encode_seconds': time() - start if len(live_positions) > 0 else None,
+                    'stats': { key: value - strategy_stats.get(key, 0) for key, value in current_strategy_stats.items() }
+                }
+                strategy_stats = current_strategy_stats
+                dealer_socket.send_multipart([b'', b'METRICS', b'', json.dumps(worker_metrics).encode()])
                 dealer_socket.send_multipart([b'', b'HANDSHAKE', b'', b''])
             except KeyboardInterrupt:
                 logger.warning(f'{worker_id} cancelled...!')
@@ -95,31 +193,175 @@ class EmbedderPool:
         ctx.term()
         logger.info(f'{worker_id} model shutdown')
 
-    def launch_workers(self) -> None:
-        processes:List[mp.Process] = []
-        worker_id = 0
+    def start_worker(self, handle:WorkerHandle) -> None:
+        handle.process = mp.Process(target=self.processing, args=[handle.worker_id, handle.config])
+        handle.process.start()
+        handle.started_at = time()
+        handle.restart_at = None
+
+    def spawn_worker(self, config:EmbedderModelConfig) -> WorkerHandle:
+        handle = WorkerHandle(worker_id=f'worker-{self.next_worker_id:03d}', config=config)
+        self.next_worker_id += 1
+        self.worker_handles.append(handle)
+        self.start_worker(handle)
+        return handle
+
+    def notifier(self, config:EmbedderModelConfig) -> zmq.Socket:
+        # one dealer per topic, connected to the router socket of the workers
+        if config.target_topic not in self.topic2notifier:
+            self.topic2notifier[config.target_topic] = self.ctx.socket(socket_type=zmq.DEALER)
+            self.topic2notifier[config.target_topic].setsockopt(zmq.LINGER, 1000)
+            self.topic2notifier[config.target_topic].connect(addr=router2worker_address(config))
+        return self.topic2notifier[config.target_topic]
+
+    def notify_router(self, handle:WorkerHandle, report:Dict[str, Any]) -> None:
+        # the router drops the dead worker from its idle list and fails the jobs it was processing
+        try:
+            self.notifier(handle.config).send_multipart([b'', b'WORKER-DEAD', handle.worker_id.encode(), json.dumps(report).encode()], flags=zmq.NOBLOCK)
+        except zmq.ZMQError as e:
+            logger.warning(f'{handle.worker_id} : the router of {handle.config.target_topic} could not be notified : {e}')
+
+    def retire_worker(self, handle:WorkerHandle) -> None:
+        # the router sends RETIRE to the worker once it is idle : in-flight jobs are answered before the worker exits
+        handle.retiring = True
+        if handle.process is None:  # crashed and waiting for its restart : it is simply not restarted
+            return
+        try:
+            self.notifier(handle.config).send_multipart([b'', b'RETIRE', handle.worker_id.encode(), b''], flags=zmq.NOBLOCK)
+        except zmq.ZMQError as e:
+            logger.warning(f'{handle.worker_id} : the router of {handle.config.target_topic} could not be notified : {e}')
+            handle.retiring = False
+
+    def supervise_workers(self, now:float) -> None:
+        for handle in list(self.worker_handles):
+            if handle.retiring and (handle.process is None or handle.process.exitcode is not None):
+                exitcode = handle.process.exitcode if handle.process is not None else None
+                if exitcode not in (0, None):  # crashed before leaving, its in-flight jobs must be failed
+                    self.notify_router(handle, {'exitcode': exitcode, 'restarts': handle.restarts, 'restart_in': None})
+                self.worker_handles.remove(handle)
+                logger.info(f'{handle.worker_id} ({handle.config.target_topic}) has left the pool (exitcode : {exitcode})')
+                continue
+
+            if handle.process is not None and handle.process.exitcode is not None:
+                exitcode = handle.process.exitcode
+                handle.process = None
+                handle.consecutive_crashes = 1 if now - handle.started_at > self.stable_after else handle.consecutive_crashes + 1
+                backoff = min(self.restart_backoff * 2 ** (handle.consecutive_crashes - 1), self.max_restart_backoff)
+                handle.restart_at = now + backoff
+                logger.warning(f'{handle.worker_id} ({handle.config.target_topic}) exited with code {exitcode}, restarting in {backoff:.1f}s')
+                self.notify_router(handle, {'exitcode': exitcode, 'restarts': handle.restarts, 'restart_in': backoff})
+                continue
+
+            if handle.process is None and handle.restart_at is not None and handle.restart_at <= now:
+                handle.restarts += 1
+                self.start_worker(handle)
+                logger.info(f'{handle.worker_id} ({handle.config.target_topic}) was restarted, {handle.restarts} restart(s) so far')
+
+    def collect_load_reports(self, timeout:float=1.0) -> Dict[str, Dict[str, Any]]:
+        # every router answers on the notifier dealer : queue depth, idle and busy workers, cumulated batch time
+        poller = zmq.Poller()
+        for config in self.embedder_model_configs:
+            notifier_socket = self.notifier(config)
+            try:
+                notifier_socket.send_multipart([b'', b'LOAD-REPORT', b'', b''], flags=zmq.NOBLOCK)
+            except zmq.ZMQError as e:
+                logger.warning(f'the router of {config.target_topic} could not be polled : {e}')
+                continue
+            poller.register(notifier_socket, zmq.POLLIN)
+
+        topic2notifier = { id(notifier_socket): topic for topic, notifier_socket in self.topic2notifier.items() }
+        topic2load_report:Dict[str, Dict[str, Any]] = {}
+        deadline = time() + timeout
+        while len(topic2load_report) < len(poller.sockets) and time() < deadline:
+            for notifier_socket, _ in poller.poll(timeout=max(0, deadline - time()) * 1000):
+                while notifier_socket.poll(timeout=0) == zmq.POLLIN:  # late answers of a previous poll are overwritten
+                    _, _, encoded_load_report = notifier_socket.recv_multipart()
+                    topic2load_report[topic2notifier[id(notifier_socket)]] = json.loads(encoded_load_report)
+        return topic2load_report
+
+    def plan_scaling(self, now:float, topic2load_report:Dict[str, Dict[str, Any]]) -> Dict[str, int]:
+        # +1 / -1 worker per topic and per round, scale ups of the most loaded topics go first within the budget
+        autoscaler_config = self.autoscaler_config
+        topic2config = { config.target_topic: config for config in self.embedder_model_configs }
+        topic2pressure:Dict[str, float] = {}
+        topic2delta:Dict[str, int] = {}
+        for topic, load_report in topic2load_report.items():
+            config = topic2config[topic]
+            previous = self.topic2load_report.get(topic, None)
+            self.topic2load_report[topic] = (now, load_report)
+            nb_workers = sum(1 for handle in self.worker_handles if handle.config.target_topic == topic and not handle.retiring)
+            min_instances, max_instances = config.min_instances or config.nb_instances, config.max_instances or config.nb_instances
+            if now - self.topic2scaled_at.get(topic, float('-inf')) < autoscaler_config.cooldown:
+                continue
+
+            utilisation:Optional[float] = None
+            nb_connected_workers = load_report['idle'] + load_report['busy']
+            if previous is not None and nb_connected_workers > 0 and now > previous[0]:
+                utilisation = (load_report['busy_seconds'] - previous[1]['busy_seconds']) / ((now - previous[0]) * nb_connected_workers)
+            pressure = load_report['queue_depth'] / max(1, nb_workers)
+
+            if nb_workers < max_instances and (pressure >= autoscaler_config.scale_up_queue_depth or (utilisation or 0) >= autoscaler_config.scale_up_utilisation):
+                topic2pressure[topic] = pressure
+            elif nb_workers > min_instances and load_report['queue_depth'] == 0 and utilisation is not None and utilisation <= autoscaler_config.scale_down_utilisation:
+                topic2delta[topic] = -1
+
+        used_budget = sum(handle.config.instance_cost for handle in self.worker_handles)  # retiring workers hold their resources until they exit
+        for topic in sorted(topic2pressure, key=topic2pressure.get, reverse=True):
+            if autoscaler_config.budget is not None and used_budget + topic2config[topic].instance_cost > autoscaler_config.budget:
+                logger.warning(f'{topic} is under pressure but the autoscaler budget is exhausted ({used_budget}/{autoscaler_config.budget})')
+                continue
+            used_budget += topic2config[topic].instance_cost
+            topic2delta[topic] = 1
+        return topic2delta
+
+    def autoscale(self, now:float) -> None:
+        topic2config = { config.target_topic: config for config in self.embedder_model_configs }
+        for topic, delta in self.plan_scaling(now, self.collect_load_reports()).items():
+            self.topic2scaled_at[topic] = now
+            if delta > 0:
+                handle = self.spawn_worker(topic2config[topic])
+                logger.info(f'autoscaler : {topic} scaled up with {handle.worker_id}')
+                continue
+            handle = [ handle for handle in self.worker_handles if handle.config.target_topic == topic and not handle.retiring ][-1]  # the most recent worker
+            self.retire_worker(handle)
+            logger.info(f'autoscaler : {topic} scaled down, {handle.worker_id} is retiring')
+
+    def restart_counts(self) -> Dict[str, int]:
+        return { handle.worker_id: handle.restarts for handle in self.worker_handles }
+
+    def launch_workers(self, is_running:Callable[[], bool]=lambda: True) -> None:
+        # crashed workers are restarted with an exponential backoff while the others keep serving
+        self.load_shared_strategies()
+        self.ctx = zmq.Context()
         for config in self.embedder_model_configs:
             for _ in range(config.nb_instances):
-                process_ = mp.Process(target=self.processing, args=[f'worker-{worker_id:03d}', config])
-                processes.append(process_)
-                processes[-1].start()
-                worker_id += 1 
+                self.spawn_worker(config)
 
+        autoscale_at = time() + (self.autoscaler_config.interval if self.autoscaler_config is not None else 0)
         while True:
             try:
-                exitcodes = [ process_.exitcode is not None for process_ in processes ]
-                if any(exitcodes):
-                    break 
-                sleep(1)  # wait 1 second to keep the loop
+                if not is_running():
+                    logger.warning('the grpc server is down, stopping the workers')
+                    break
+                self.supervise_workers(time())
+                if self.autoscaler_config is not None and time() >= autoscale_at:
+                    self.autoscale(time())
+                    autoscale_at = time() + self.autoscaler_config.interval
+                sleep(0.5)
             except KeyboardInterrupt:
-                for process_ in processes:
-                    process_.join()  # wait for worker to handle the SIGINT
+                for handle in self.worker_handles:
+                    if handle.process is not None:
+                        handle.process.join()  # wait for worker to handle the SIGINT
                 break 
             except Exception as e:
                 logger.error(e)
                 break 
         
-        for process_ in processes:
-            if process_.is_alive():
-                process_.terminate()  # send SIGTERM => SIGINT 
-                process_.join()  # wait for worker to handle the signal 
\ No newline at end of file
+        for handle in self.worker_handles:
+            if handle.process is not None and handle.process.is_alive():
+                handle.process.terminate()  # send SIGTERM => SIGINT 
+                handle.process.join()  # wait for worker to handle the signal 
+        logger.info(f'workers restart counts : {self.restart_counts()}')
+        for notifier_socket in self.topic2notifier.values():
+            notifier_socket.close(linger=0)
+        self.ctx.term()
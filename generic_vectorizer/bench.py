@@ -0,0 +1,186 @@
+import os
+import grpc
+import signal
+import asyncio
+import numpy as np
+import multiprocessing as mp
+
+from time import perf_counter
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from generic_vectorizer.log import logger
+from generic_vectorizer.vectorizer import Vectorizer
+from generic_vectorizer.typing import BenchConfig, EmbedderModelConfig, EmbedderModelType
+from generic_vectorizer.grpc_server.interfaces import strategies_pb2, strategies_pb2_grpc
+
+class TextSampler:
+    def __init__(self, text_length:str, seed:int, vocabulary_size:int=4096):
+        self.rng = np.random.default_rng(seed)
+        self.distribution, *parameters = text_length.split(':')
+        self.parameters = [ float(parameter) for parameter in parameters ]
+        letters = np.array(list('abcdefghijklmnopqrstuvwxyz'))
+        self.vocabulary = [ ''.join(self.rng.choice(letters, size=self.rng.integers(2, 10))) for _ in range(vocabulary_size) ]
+
+    def nb_words(self) -> int:
+        if self.distribution == 'fixed':
+            return int(self.parameters[0])
+        if self.distribution == 'uniform':
+            return int(self.rng.integers(int(self.parameters[0]), int(self.parameters[1]) + 1))
+        median, sigma = self.parameters
+        return max(1, int(self.rng.lognormal(np.log(median), sigma)))
+
+    def sample(self) -> str:
+        return ' '.join(self.vocabulary[index] for index in self.rng.integers(0, len(self.vocabulary), size=self.nb_words()))
+
+class LoadGenerator:
+    def __init__(self, config:BenchConfig):
+        self.config = config
+        self.text_sampler = TextSampler(config.text_length, config.seed)
+        self.operations = list(config.mix.keys())
+        weights = np.array([ config.mix[operation] for operation in self.operations ], dtype=np.float64)
+        self.probabilities = weights / weights.sum()
+        # (operation, scheduled start, latency, number of texts, grpc status name)
+        self.samples:List[Tuple[str, float, float, int, str]] = []
+
+    def _build_request(self, operation:str) -> Tuple[str, Any, int]:
+        config = self.config
+        if operation == 'embed':
+            request = strategies_pb2.TextEmbeddingRequest(target_topic=config.embedding_topic, text=self.text_sampler.sample(), chunk_size=512, return_dense=True, return_sparse=config.return_sparse, bypass_cache=config.bypass_cache)
+            return 'getTextEmbedding', request, 1
+        if operation == 'batch':
+            request = strategies_pb2.TextBatchEmbeddingRequest(target_topic=config.embedding_topic, texts=[ self.text_sampler.sample() for _ in range(config.batch_size) ], chunk_size=512, return_dense=True, return_sparse=config.return_sparse, bypass_cache=config.bypass_cache)
+            return 'getTextBatchEmbedding', request, config.batch_size
+        request = strategies_pb2.TextRerankScoresRequest(target_topic=config.rerank_topic, query=self.text_sampler.sample(), corpus=[ self.text_sampler.sample() for _ in range(config.nb_candidates) ])
+        return 'getTextRerankScores', request, config.nb_candidates
+
+    async def _call(self, stub:strategies_pb2_grpc.TextEmbeddingStub, operation:str, scheduled_at:float) -> None:
+        method_name, request, nb_texts = self._build_request(operation)
+        try:
+            response = await getattr(stub, method_name)(request, timeout=self.config.request_timeout)
+            status = 'OK' if response.status else 'APPLICATION_ERROR'  # the worker answered with status=False
+        except grpc.aio.AioRpcError as e:
+            status = e.code().name
+        except Exception as e:
+            logger.warning(e)
+            status = 'UNKNOWN'
+        # open loop latencies start at the scheduled arrival : a slow server cannot hide its queueing delay (coordinated omission)
+        self.samples.append((operation, scheduled_at, perf_counter() - scheduled_at, nb_texts, status))
+
+    def _next_operation(self) -> str:
+        return self.operations[self.text_sampler.rng.choice(len(self.operations), p=self.probabilities)]
+
+    async def _open_loop(self, stub:strategies_pb2_grpc.TextEmbeddingStub, start:float, end:float) -> None:
+        pending_tasks:Set[asyncio.Task] = set()
+        scheduled_at = start
+        while scheduled_at < end:
+            delay = scheduled_at - perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            task = asyncio.create_task(self._call(stub, self._next_operation(), scheduled_at))
+            pending_tasks.add(task)
+            task.add_done_callback(pending_tasks.discard)
+            interval = 1 / self.config.rps
+            scheduled_at += self.text_sampler.rng.exponential(interval) if self.config.arrival == 'poisson' else interval
+        if len(pending_tasks) > 0:
+            await asyncio.gather(*pending_tasks)
+
+    async def _closed_loop(self, stub:strategies_pb2_grpc.TextEmbeddingStub, start:float, end:float) -> None:
+        async def client() -> None:
+            while perf_counter() < end:
+                await self._call(stub, self._next_operation(), perf_counter())
+        await asyncio.gather(*[ client() for _ in range(self.config.concurrency) ])
+
+    async def run(self) -> Dict[str, Any]:
+        async with grpc.aio.insecure_channel(target=self.config.grpc_server_address) as channel:
+            stub = strategies_pb2_grpc.TextEmbeddingStub(channel=channel)
+            start = perf_counter()
+            end = start + self.config.warmup + self.config.duration
+            if self.config.mode == 'open':
+                await self._open_loop(stub, start, end)
+            else:
+                await self._closed_loop(stub, start, end)
+        return self.report(start + self.config.warmup, perf_counter())
+
+    def report(self, measure_start:float, measure_end:float) -> Dict[str, Any]:
+        samples = [ sample for sample in self.samples if sample[1] >= measure_start ]  # warmup requests are not measured
+        elapsed = measure_end - measure_start
+        report:Dict[str, Any] = {
+            'mode': self.config.mode,
+            'duration_s': round(elapsed, 3),
+            **({'offered_rps': self.config.rps, 'arrival': self.config.arrival} if self.config.mode == 'open' else {'concurrency': self.config.concurrency}),
+            **summarize(samples, elapsed),
+            'operations': { operation: summarize([ sample for sample in samples if sample[0] == operation ], elapsed) for operation in self.operations }
+        }
+        return report
+
+def summarize(samples:List[Tuple[str, float, float, int, str]], elapsed:float) -> Dict[str, Any]:
+    successes = [ sample for sample in samples if sample[4] == 'OK' ]
+    errors:Dict[str, int] = {}
+    for sample in samples:
+        if sample[4] != 'OK':
+            errors[sample[4]] = errors.get(sample[4], 0) + 1
+
+    latency_ms:Dict[str, Optional[float]] = dict.fromkeys(['p50', 'p95', 'p99', 'mean', 'max'])
+    if len(successes) > 0:
+        latencies = np.array([ sample[2] for sample in successes ]) * 1000
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        latency_ms = {'p50': p50, 'p95': p95, 'p99': p99, 'mean': latencies.mean(), 'max': latencies.max()}
+        latency_ms = { key: round(float(value), 3) for key, value in latency_ms.items() }
+
+    return {
+        'requests': len(samples),
+        'throughput_rps': round(len(successes) / elapsed, 3) if elapsed > 0 else 0.0,
+        'texts_per_s': round(sum(sample[3] for sample in successes) / elapsed, 3) if elapsed > 0 else 0.0,
+        'error_rate': round(1 - len(successes) / len(samples), 6) if len(samples) > 0 else 0.0,
+        'errors': errors,
+        'latency_ms': latency_ms
+    }
+
+def serve_stub_engine(grpc_server_address:str, nb_instances:int, max_batch_size:int, stub_options:Dict[str, Any]) -> None:
+    os.setpgrp()  # the whole engine (grpc server and workers) is stopped with a single killpg
+    embedder_model_configs = [
+        EmbedderModelConfig(embedder_model_type=EmbedderModelType.STUB_MODEL, target_topic='stub', nb_instances=nb_instances, max_batch_size=max_batch_size, options=stub_options)
+    ]
+    vectorizer = Vectorizer(grpc_server_address=grpc_server_address, embedder_model_configs=embedder_model_configs, max_concurrent_requests=4096, request_timeout=30)
+    vectorizer.listen()
+
+async def wait_until_ready(grpc_server_address:str, target_topic:str, timeout:float) -> None:
+    deadline = perf_counter() + timeout
+    async with grpc.aio.insecure_channel(target=grpc_server_address) as channel:
+        stub = strategies_pb2_grpc.TextEmbeddingStub(channel=channel)
+        while True:
+            try:
+                response = await stub.getTextEmbedding(strategies_pb2.TextEmbeddingRequest(target_topic=target_topic, text='ready', return_dense=True), timeout=1)
+                if response.status:
+                    return
+            except grpc.aio.AioRpcError:
+                pass
+            if perf_counter() > deadline:
+                raise TimeoutError(f'{grpc_server_address} was not ready after {timeout}s')
+            await asyncio.sleep(0.5)
+
+def run_bench(config:BenchConfig, stub_instances:int=0, stub_max_batch_size:int=32, stub_options:Optional[Dict[str, Any]]=None, startup_timeout:float=60) -> Dict[str, Any]:
+    if stub_instances == 0:
+        return asyncio.run(LoadGenerator(config).run())
+
+    # model free engine : measures the grpc -> broker -> router -> worker overhead on its own
+    config = config.model_copy(update={'embedding_topic': 'stub', 'rerank_topic': 'stub'})
+    engine_process = mp.Process(target=serve_stub_engine, args=[config.grpc_server_address, stub_instances, stub_max_batch_size, stub_options or {}])
+    engine_process.start()
+    try:
+        asyncio.run(wait_until_ready(config.grpc_server_address, 'stub', startup_timeout))
+        report = asyncio.run(LoadGenerator(config).run())
+        report['stub'] = {'nb_instances': stub_instances, 'max_batch_size': stub_max_batch_size, 'options': stub_options or {}}
+        return report
+    finally:
+        stop_engine(engine_process)
+
+def stop_engine(engine_process:mp.Process) -> None:
+    for signal_number in [signal.SIGINT, signal.SIGKILL]:
+        try:
+            os.killpg(engine_process.pid, signal_number)
+        except ProcessLookupError:  # the engine exited before creating its process group
+            engine_process.terminate()
+        engine_process.join(timeout=10)
+        if not engine_process.is_alive():
+            return
@@ -2,16 +2,21 @@
 
 import asyncio
 import grpc
-from typing import List, Dict, AsyncGenerator
+import numpy as np
+from typing import List, Dict, Tuple, Union, Iterable, AsyncIterable, AsyncGenerator
 from operator import attrgetter
 from contextlib import asynccontextmanager
 from generic_vectorizer.grpc_server.interfaces.strategies_pb2 import (
+    Embedding, DenseEncoding, DenseAggregation, SparseFormat, SparsePooling, Priority,
     TextEmbeddingRequest, TextEmbeddingResponse,
+    TextStreamEmbeddingRequest, TextStreamEmbeddingResponse,
     TextBatchEmbeddingRequest, TextBatchEmbeddingResponse,
-    TextRerankScoresRequest, TextRerankScoresResponse
+    TextRerankScoresRequest, TextRerankScoresResponse,
+    TextBatchRerankScoresRequest, TextBatchRerankScoresResponse, RerankGroup, RerankScores
 )
 from generic_vectorizer.grpc_server.interfaces import strategies_pb2_grpc
 from generic_vectorizer.log import logger 
+from generic_vectorizer.codec import decode_dense, decode_sparse
 
 class AsyncGRPCEmbeddingClient:
     def __init__(self, grpc_server_address: str):
@@ -31,59 +36,187 @@ class AsyncEmbeddingClient:
     def __init__(self, grpc_server_address: str):
         self.quick_embed_client = AsyncGRPCEmbeddingClient(grpc_server_address)
 
+    def _dense_values(self, embedding: Embedding) -> Union[List[float], np.ndarray]:
+        if embedding.dense_encoding == DenseEncoding.FLOAT_LIST:
+            return list(embedding.dense_values)
+        return decode_dense(embedding)  # numpy view over the raw protobuf buffer
+
+    def _sparse_values(self, embedding: Embedding, sparse_format: int) -> Union[Dict[str, float], Tuple[np.ndarray, np.ndarray]]:
+        # the requested format decides the output type, an empty embedding carries no hint about it
+        if sparse_format == SparseFormat.TOKEN_ID_ARRAYS:
+            return decode_sparse(embedding)  # (token ids, weights), see generic_vectorizer.codec.to_csr
+        return dict(embedding.sparse_values)
+
+    def _embedding_to_dict(self, embedding: Embedding, return_dense: bool, return_sparse: bool, sparse_format: int) -> Dict:
+        return {
+            "dense": self._dense_values(embedding) if return_dense else None,
+            "sparse": self._sparse_values(embedding, sparse_format) if return_sparse else None
+        }
+
     async def get_embedding(self, text: str, target_topic: str, 
                             chunk_size: int = 512, return_dense: bool = True, 
-                            return_sparse: bool = False) -> Dict:
+                            return_sparse: bool = False, bypass_cache: bool = False,
+                            dense_encoding: int = DenseEncoding.FLOAT_LIST,
+                            sparse_format: int = SparseFormat.TOKEN_WEIGHT_MAP, sparse_pooling: int = SparsePooling.MAX_POOLING,
+                            priority: int = Priority.DEFAULT_PRIORITY, return_timings: bool = False,
+                            dense_aggregation: int = DenseAggregation.CENTRALITY_AGGREGATION) -> Dict:
         async with self.quick_embed_client.create_grpc_stub() as stub:
             request = TextEmbeddingRequest(
                 target_topic=target_topic,
                 text=text,
                 chunk_size=chunk_size,
                 return_dense=return_dense,
-                return_sparse=return_sparse
+                return_sparse=return_sparse,
+                bypass_cache=bypass_cache,
+                dense_encoding=dense_encoding,
+                sparse_format=sparse_format,
+                sparse_pooling=sparse_pooling,
+                dense_aggregation=dense_aggregation,
+                priority=priority,
+                return_timings=return_timings
             )
             response: TextEmbeddingResponse = await stub.getTextEmbedding(request)
             if not response.status:
                 raise Exception(f"Embedding failed: {response.error}")
-            return {
-                "dense": list(response.embedding.dense_values) if return_dense else None,
-                "sparse": dict(response.embedding.sparse_values) if return_sparse else None
-            }
+            embedding_dict = self._embedding_to_dict(response.embedding, return_dense, return_sparse, sparse_format)
+            if return_timings:
+                embedding_dict["timings_ms"] = dict(response.timings_ms)  # per stage breakdown of the request latency
+            return embedding_dict
 
     async def get_batch_embedding(self, texts: List[str], 
                                   target_topic: str, chunk_size: int = 512, 
-                                  return_dense: bool = True, return_sparse: bool = False) -> List[Dict]:
+                                  return_dense: bool = True, return_sparse: bool = False, 
+                                  bypass_cache: bool = False, dense_encoding: int = DenseEncoding.FLOAT_LIST,
+                                  sparse_format: int = SparseFormat.TOKEN_WEIGHT_MAP, sparse_pooling: int = SparsePooling.MAX_POOLING,
+                                  priority: int = Priority.DEFAULT_PRIORITY,
+                                  dense_aggregation: int = DenseAggregation.CENTRALITY_AGGREGATION) -> List[Dict]:
         async with self.quick_embed_client.create_grpc_stub() as stub:
             request = TextBatchEmbeddingRequest(
                 target_topic=target_topic,
                 texts=texts,
                 chunk_size=chunk_size,
                 return_dense=return_dense,
-                return_sparse=return_sparse
+                return_sparse=return_sparse,
+                bypass_cache=bypass_cache,
+                dense_encoding=dense_encoding,
+                sparse_format=sparse_format,
+                sparse_pooling=sparse_pooling,
+                dense_aggregation=dense_aggregation,
+                priority=priority
             )
             response: TextBatchEmbeddingResponse = await stub.getTextBatchEmbedding(request)
             if not response.status:
                 raise Exception(f"Batch embedding failed: {response.error}")
             return [
-                {
-                    "dense": list(embedding.dense_values) if return_dense else None,
-                    "sparse": dict(embedding.sparse_values) if return_sparse else None
-                }
+                self._embedding_to_dict(embedding, return_dense, return_sparse, sparse_format)
                 for embedding in response.embeddings
             ]
 
+    async def stream_embeddings(self, texts: Union[Iterable[Tuple[str, str]], AsyncIterable[Tuple[str, str]]],
+                                target_topic: str, chunk_size: int = 512,
+                                return_dense: bool = True, return_sparse: bool = False,
+                                bypass_cache: bool = False, dense_encoding: int = DenseEncoding.FLOAT_LIST,
+                                sparse_format: int = SparseFormat.TOKEN_WEIGHT_MAP, sparse_pooling: int = SparsePooling.MAX_POOLING,
+                                priority: int = Priority.DEFAULT_PRIORITY,
+                                dense_aggregation: int = DenseAggregation.CENTRALITY_AGGREGATION) -> AsyncGenerator[Tuple[str, Dict], None]:
+        async def request_generator() -> AsyncGenerator[TextStreamEmbeddingRequest, None]:
+            if isinstance(texts, AsyncIterable):
+                async for request_id, text in texts:
+                    yield self._stream_request(request_id, text, target_topic, chunk_size, return_dense, return_sparse, bypass_cache, dense_encoding, sparse_format, sparse_pooling, priority, dense_aggregation)
+            else:
+                for request_id, text in texts:
+                    yield self._stream_request(request_id, text, target_topic, chunk_size, return_dense, return_sparse, bypass_cache, dense_encoding, sparse_format, sparse_pooling, priority, dense_aggregation)
+
+        async with self.quick_embed_client.create_grpc_stub() as stub:
+            stream_response: TextStreamEmbeddingResponse
+            async for stream_response in stub.streamTextEmbeddings(request_generator()):
+                if not stream_response.response.status:
+                    raise Exception(f"Embedding failed for {stream_response.request_id}: {stream_response.response.error}")
+                yield stream_response.request_id, self._embedding_to_dict(stream_response.response.embedding, return_dense, return_sparse, sparse_format)
+
+    async def stream_batch_embedding(self, texts: List[str], target_topic: str, chunk_size: int = 512,
+                                     return_dense: bool = True, return_sparse: bool = False,
+                                     bypass_cache: bool = False, dense_encoding: int = DenseEncoding.FLOAT_LIST,
+                                     sparse_format: int = SparseFormat.TOKEN_WEIGHT_MAP, sparse_pooling: int = SparsePooling.MAX_POOLING,
+                                     priority: int = Priority.DEFAULT_PRIORITY,
+                                     dense_aggregation: int = DenseAggregation.CENTRALITY_AGGREGATION) -> AsyncGenerator[Tuple[int, Dict], None]:
+        async with self.quick_embed_client.create_grpc_stub() as stub:
+            request = TextBatchEmbeddingRequest(
+                target_topic=target_topic,
+                texts=texts,
+                chunk_size=chunk_size,
+                return_dense=return_dense,
+                return_sparse=return_sparse,
+                bypass_cache=bypass_cache,
+                dense_encoding=dense_encoding,
+                sparse_format=sparse_format,
+                sparse_pooling=sparse_pooling,
+                dense_aggregation=dense_aggregation,
+                priority=priority
+            )
+            stream_response: TextStreamEmbeddingResponse
+            async for stream_response in stub.streamTextBatchEmbedding(request):
+                if not stream_response.response.status:
+                    raise Exception(f"Embedding failed for text {stream_response.request_id}: {stream_response.response.error}")
+                yield int(stream_response.request_id), self._embedding_to_dict(stream_response.response.embedding, return_dense, return_sparse, sparse_format)
+
+    def _stream_request(self, request_id: str, text: str, target_topic: str, chunk_size: int,
+                        return_dense: bool, return_sparse: bool, bypass_cache: bool, dense_encoding: int,
+                        sparse_format: int, sparse_pooling: int, priority: int, dense_aggregation: int) -> TextStreamEmbeddingRequest:
+        return TextStreamEmbeddingRequest(
+            request_id=request_id,
+            request=TextEmbeddingRequest(
+                target_topic=target_topic,
+                text=text,
+                chunk_size=chunk_size,
+                return_dense=return_dense,
+                return_sparse=return_sparse,
+                bypass_cache=bypass_cache,
+                dense_encoding=dense_encoding,
+                sparse_format=sparse_format,
+                sparse_pooling=sparse_pooling,
+                dense_aggregation=dense_aggregation,
+                priority=priority
+            )
+        )
+
+    def _rerank_result(self, response: Union[TextRerankScoresResponse, RerankScores], top_k: int) -> Union[List[float], List[Tuple[int, float]]]:
+        # with top_k the worker only sends the best (corpus index, score) pairs, best first
+        if top_k > 0:
+            return [(hit.index, hit.score) for hit in response.hits]
+        return list(response.scores)
+
     async def get_rerank_scores(self, query: str, corpus: List[str], 
-                                target_topic: str, normalize: bool = True) -> List[float]:
+                                target_topic: str, normalize: bool = True, 
+                                priority: int = Priority.DEFAULT_PRIORITY, top_k: int = 0) -> Union[List[float], List[Tuple[int, float]]]:
         async with self.quick_embed_client.create_grpc_stub() as stub:
             request = TextRerankScoresRequest(
                 query=query,
                 target_topic=target_topic,
                 corpus=corpus,
-                normalize=normalize
+                normalize=normalize,
+                priority=priority,
+                top_k=top_k
             )
             response: TextRerankScoresResponse = await stub.getTextRerankScores(request)
             if not response.status:
                 raise Exception(f"Reranking failed: {response.error}")
-            return list(response.scores)
+            return self._rerank_result(response, top_k)
 
-    
\ No newline at end of file
+    
+
+    async def get_batch_rerank_scores(self, groups: List[Tuple[str, List[str]]],
+                                      target_topic: str, normalize: bool = True,
+                                      priority: int = Priority.DEFAULT_PRIORITY, top_k: int = 0) -> List[Union[List[float], List[Tuple[int, float]]]]:
+        async with self.quick_embed_client.create_grpc_stub() as stub:
+            request = TextBatchRerankScoresRequest(
+                target_topic=target_topic,
+                groups=[RerankGroup(query=query, corpus=corpus) for query, corpus in groups],
+                normalize=normalize,
+                priority=priority,
+                top_k=top_k
+            )
+            response: TextBatchRerankScoresResponse = await stub.getTextBatchRerankScores(request)
+            if not response.status:
+                raise Exception(f"Reranking failed: {response.error}")
+            return [self._rerank_result(result, top_k) for result in response.results]
@@ -0,0 +1,142 @@
+import numpy as np
+
+from typing import Dict, List, Tuple, Optional
+from numpy.typing import NDArray
+
+from generic_vectorizer.grpc_server.interfaces.strategies_pb2 import Embedding, DenseEncoding, DenseAggregation, SparsePooling, RerankHit
+
+def encode_dense(vector:NDArray, dense_encoding:int) -> Tuple[bytes, float]:
+    if dense_encoding == DenseEncoding.FLOAT32:
+        return np.ascontiguousarray(vector, dtype='<f4').tobytes(), 1.0
+    if dense_encoding == DenseEncoding.FLOAT16:
+        return np.ascontiguousarray(vector, dtype='<f2').tobytes(), 1.0
+    if dense_encoding == DenseEncoding.INT8:
+        max_abs_value = float(np.max(np.abs(vector))) if vector.size > 0 else 0.0
+        scale = max_abs_value / 127 if max_abs_value > 0 else 1.0
+        quantized_vector = np.clip(np.rint(vector / scale), -127, 127).astype(np.int8)
+        return quantized_vector.tobytes(), scale
+    raise ValueError(f'{dense_encoding} is not a binary dense encoding')
+
+def decode_dense(embedding:Embedding) -> NDArray:
+    if embedding.dense_encoding == DenseEncoding.FLOAT_LIST:
+        return np.asarray(embedding.dense_values, dtype=np.float32)
+    if embedding.dense_encoding == DenseEncoding.FLOAT32:
+        return np.frombuffer(embedding.dense_buffer, dtype='<f4')
+    if embedding.dense_encoding == DenseEncoding.FLOAT16:
+        return np.frombuffer(embedding.dense_buffer, dtype='<f2')
+    if embedding.dense_encoding == DenseEncoding.INT8:
+        return np.frombuffer(embedding.dense_buffer, dtype=np.int8).astype(np.float32) * embedding.dense_scale
+    raise ValueError(f'{embedding.dense_encoding} is not a known dense encoding')
+
+def segment_reduce(ufunc:np.ufunc, values:NDArray, offsets:NDArray, nb_chunks:NDArray, weights:Optional[NDArray]=None) -> NDArray:
+    # one vectorised pass per chunk position : ufunc.reduceat is much slower on wide rows
+    # texts are sorted by decreasing number of chunks, the texts having a chunk at a given position are a prefix
+    order = np.argsort(-nb_chunks, kind='stable')
+    sorted_offsets = offsets[order]
+    nb_longer_texts = len(nb_chunks) - np.cumsum(np.bincount(nb_chunks))  # number of texts with more than n chunks
+    reduced_values:Optional[NDArray] = None
+    for position in range(int(nb_chunks.max(initial=1))):
+        nb_texts = len(nb_chunks) if position == 0 else int(nb_longer_texts[position])
+        rows = sorted_offsets[:nb_texts] + position
+        position_values = values[rows].astype(np.float32, copy=False)
+        if weights is not None:
+            position_values *= weights[rows, None]
+        if reduced_values is None:
+            reduced_values = position_values
+            continue
+        ufunc(reduced_values[:nb_texts], position_values, out=reduced_values[:nb_texts])
+    text_values = np.empty_like(reduced_values)
+    text_values[order] = reduced_values
+    return text_values
+
+def aggregate_dense(chunk_embeddings:NDArray, nb_chunks:NDArray, dense_aggregation:int) -> NDArray:
+    # the chunks of a text are contiguous rows, every text has at least one chunk
+    offsets = np.concatenate(([0], np.cumsum(nb_chunks[:-1]))).astype(np.intp)
+    if dense_aggregation == DenseAggregation.FIRST_CHUNK_AGGREGATION:
+        return chunk_embeddings[offsets].astype(np.float32)
+    if dense_aggregation == DenseAggregation.MAX_AGGREGATION:
+        return segment_reduce(np.maximum, chunk_embeddings, offsets, nb_chunks)
+    if dense_aggregation == DenseAggregation.MEAN_AGGREGATION:
+        return segment_reduce(np.add, chunk_embeddings, offsets, nb_chunks) / nb_chunks[:, None].astype(np.float32)
+    if dense_aggregation != DenseAggregation.CENTRALITY_AGGREGATION:
+        raise ValueError(f'{dense_aggregation} is not a known dense aggregation')
+
+    # single chunk texts are copied as is, the centrality weights only matter for the others
+    chunk_embeddings = chunk_embeddings.astype(np.float32, copy=False)
+    text_embeddings = chunk_embeddings[offsets]
+    multi_chunk_texts = np.flatnonzero(nb_chunks > 1)
+    if len(multi_chunk_texts) == 0:
+        return text_embeddings
+    if len(multi_chunk_texts) < len(nb_chunks):
+        chunk_embeddings = chunk_embeddings[np.repeat(nb_chunks > 1, nb_chunks)]
+        nb_chunks = nb_chunks[multi_chunk_texts]
+        offsets = np.concatenate(([0], np.cumsum(nb_chunks[:-1]))).astype(np.intp)
+
+    # the row sums of the cosine matrix of a text are the dot products of its normalized chunks with their sum : no NxN matrix
+    inverse_norms = 1 / (np.sqrt(np.einsum('ij,ij->i', chunk_embeddings, chunk_embeddings)) + 1e-8)
+    normalized_sums = segment_reduce(np.add, chunk_embeddings, offsets, nb_chunks, weights=inverse_norms)
+    centrality_scores = inverse_norms * np.einsum('ij,ij->i', chunk_embeddings, np.repeat(normalized_sums, nb_chunks, axis=0))
+    text_embeddings[multi_chunk_texts] = segment_reduce(np.add, chunk_embeddings, offsets, nb_chunks, weights=centrality_scores) / nb_chunks[:, None].astype(np.float32)
+    return text_embeddings
+
+def merge_sparse_weights(chunk_weights:List[Dict[str, float]], sparse_pooling:int) -> Dict[str, float]:
+    if len(chunk_weights) == 1:
+        return chunk_weights[0]
+    merged_weights:Dict[str, float] = {}
+    for weights in chunk_weights:
+        for token, weight in weights.items():
+            previous_weight = merged_weights.get(token, None)
+            if previous_weight is None:
+                merged_weights[token] = weight
+            elif sparse_pooling == SparsePooling.SUM_POOLING:
+                merged_weights[token] = previous_weight + weight
+            else:
+                merged_weights[token] = max(previous_weight, weight)
+    return merged_weights
+
+def merge_sparse_arrays(chunk_weights:List[Dict[str, float]], sparse_pooling:int) -> Tuple[NDArray, NDArray]:
+    # lexical weights are keyed by the string form of the token ids
+    nb_entries = sum(len(weights) for weights in chunk_weights)
+    token_ids = np.fromiter((int(token) for weights in chunk_weights for token in weights.keys()), dtype=np.uint32, count=nb_entries)
+    token_weights = np.fromiter((weight for weights in chunk_weights for weight in weights.values()), dtype=np.float32, count=nb_entries)
+    unique_token_ids, inverse_indices = np.unique(token_ids, return_inverse=True)
+    if sparse_pooling == SparsePooling.SUM_POOLING:
+        merged_weights = np.bincount(inverse_indices, weights=token_weights, minlength=len(unique_token_ids)).astype(np.float32)
+    else:
+        merged_weights = np.full(len(unique_token_ids), -np.inf, dtype=np.float32)
+        np.maximum.at(merged_weights, inverse_indices, token_weights)
+    return unique_token_ids, merged_weights
+
+def decode_sparse(embedding:Embedding) -> Tuple[NDArray, NDArray]:
+    if len(embedding.sparse_indices) > 0 or len(embedding.sparse_values) == 0:
+        return np.asarray(embedding.sparse_indices, dtype=np.uint32), np.asarray(embedding.sparse_weights, dtype=np.float32)
+    token_ids = np.fromiter((int(token) for token in embedding.sparse_values.keys()), dtype=np.uint32, count=len(embedding.sparse_values))
+    token_weights = np.fromiter(embedding.sparse_values.values(), dtype=np.float32, count=len(embedding.sparse_values))
+    return token_ids, token_weights
+
+def select_top_k(scores:NDArray, top_k:int) -> List[RerankHit]:
+    # best scores first, ties keep the corpus order
+    if top_k < len(scores):
+        candidate_indices = np.argpartition(-scores, top_k - 1)[:top_k]
+        threshold = scores[candidate_indices].min()
+        candidate_indices = np.flatnonzero(scores >= threshold)  # every tie of the k-th score, trimmed after the stable sort
+    else:
+        candidate_indices = np.arange(len(scores))
+    sorted_indices = candidate_indices[np.argsort(-scores[candidate_indices], kind='stable')][:top_k]
+    return [ RerankHit(index=int(index), score=float(scores[index])) for index in sorted_indices ]
+
+def to_csr(sparse_vectors:List[Tuple[NDArray, NDArray]], vocab_size:int=250002):
+    try:
+        from scipy.sparse import csr_matrix
+    except ImportError as e:
+        raise ImportError('scipy is required to build csr matrices : pip install generic_vectorizer[sparse]') from e
+
+    indptr = np.zeros(len(sparse_vectors) + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum([ len(token_ids) for token_ids, _ in sparse_vectors ])
+    if len(sparse_vectors) > 0:
+        indices = np.concatenate([ token_ids for token_ids, _ in sparse_vectors ]).astype(np.int32)
+        data = np.concatenate([ token_weights for _, token_weights in sparse_vectors ]).astype(np.float32)
+    else:
+        indices = np.zeros(0, dtype=np.int32)
+        data = np.zeros(0, dtype=np.float32)
+    return csr_matrix((data, indices, indptr), shape=(len(sparse_vectors), vocab_size))
@@ -0,0 +1,93 @@
+import asyncio
+
+from math import ceil
+from contextlib import asynccontextmanager
+from typing import List, Dict, Any, AsyncGenerator, Optional
+
+from generic_vectorizer.grpc_server.metrics import ExponentialAverage
+from generic_vectorizer.grpc_server.lanes import PriorityLaneQueue
+from generic_vectorizer.typing import EmbedderModelConfig
+
+class AdmissionRejected(Exception):
+    pass
+
+class AdmissionController:
+    def __init__(self, embedder_model_configs:List[EmbedderModelConfig], max_concurrent_requests:int, topic2queue_hmap:Dict[str, PriorityLaneQueue], topic2service_time:Dict[str, ExponentialAverage], topic2nb_workers:Optional[Dict[str, int]]=None):
+        self.topic2config = { cfg.target_topic: cfg for cfg in embedder_model_configs }
+        self.topic2queue_hmap = topic2queue_hmap
+        self.topic2service_time = topic2service_time
+        self.topic2nb_workers = topic2nb_workers if topic2nb_workers is not None else {}
+
+        # each topic gets its own slice of the concurrency budget, a hot topic can not starve the others
+        total_concurrency = max(1, int(0.7 * max_concurrent_requests))
+        total_share = sum(cfg.concurrency_share for cfg in embedder_model_configs)
+        self.topic2semaphore:Dict[str, asyncio.Semaphore] = {
+            cfg.target_topic: asyncio.Semaphore(max(1, int(total_concurrency * cfg.concurrency_share / total_share)))
+            for cfg in embedder_model_configs
+        }
+        self.topic2waiting:Dict[str, int] = { cfg.target_topic: 0 for cfg in embedder_model_configs }
+        self.topic2rejections:Dict[str, int] = { cfg.target_topic: 0 for cfg in embedder_model_configs }
+
+    def queue_depth(self, target_topic:str) -> int:
+        target_queue = self.topic2queue_hmap.get(target_topic, None)
+        queued = target_queue.qsize() if target_queue is not None else 0
+        return self.topic2waiting.get(target_topic, 0) + queued
+
+    def estimated_queue_time(self, target_topic:str) -> float:
+        config = self.topic2config[target_topic]
+        service_time = self.topic2service_time.get(target_topic, None)
+        if service_time is None or service_time.value is None:
+            return 0.0
+        nb_workers = self.topic2nb_workers.get(target_topic, 0) or config.nb_instances  # nb_instances until the workers are connected
+        nb_batches = ceil((self.queue_depth(target_topic) + 1) / (config.max_batch_size * nb_workers))
+        return nb_batches * service_time.value
+
+    def check(self, target_topic:str) -> None:
+        config = self.topic2config.get(target_topic, None)
+        if config is None:  # unknown topics are rejected by the broker
+            return
+
+        depth = self.queue_depth(target_topic)
+        if config.max_queue_depth > 0 and depth >= config.max_queue_depth:
+            self.topic2rejections[target_topic] += 1
+            raise AdmissionRejected(f'{target_topic} has {depth} pending requests (max_queue_depth={config.max_queue_depth})')
+
+        if config.max_queue_time_ms > 0:
+            estimated_ms = self.estimated_queue_time(target_topic) * 1000
+            if estimated_ms > config.max_queue_time_ms:
+                self.topic2rejections[target_topic] += 1
+                raise AdmissionRejected(f'{target_topic} estimated queue time is {estimated_ms:.0f}ms (max_queue_time_ms={config.max_queue_time_ms})')
+
+    async def acquire(self, target_topic:str) -> None:
+        semaphore = self.topic2semaphore.get(target_topic, None)
+        if semaphore is None:
+            return
+        self.topic2waiting[target_topic] += 1
+        try:
+            await semaphore.acquire()
+        finally:
+            self.topic2waiting[target_topic] -= 1
+
+    def release(self, target_topic:str) -> None:
+        semaphore = self.topic2semaphore.get(target_topic, None)
+        if semaphore is not None:
+            semaphore.release()
+
+    @asynccontextmanager
+    async def admit(self, target_topic:str) -> AsyncGenerator[None, None]:
+        self.check(target_topic)
+        await self.acquire(target_topic)
+        try:
+            yield
+        finally:
+            self.release(target_topic)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {
+            topic: {
+                'queue_depth': self.queue_depth(topic),
+                'estimated_queue_time_ms': round(self.estimated_queue_time(topic) * 1000, 3),
+                'rejections': self.topic2rejections[topic]
+            }
+            for topic in self.topic2config
+        }
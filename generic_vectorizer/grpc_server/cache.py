@@ -0,0 +1,206 @@
+import asyncio
+import sqlite3
+
+from time import time
+from hashlib import sha256
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from typing import Dict, List, Optional, Set, Tuple
+
+from generic_vectorizer.log import logger
+from generic_vectorizer.typing import EmbeddingCacheConfig
+
+class EmbeddingCache:
+    _ENTRY_OVERHEAD:int=96  # rough python cost of an OrderedDict entry
+    _WRITE_BATCH_SIZE:int=256
+    _FLUSH_DELAY:float=0.5
+
+    def __init__(self, config:EmbeddingCacheConfig):
+        self.config = config
+        self.memory_tier:OrderedDict[bytes, bytes] = OrderedDict()
+        self.memory_bytes = 0
+        self.counters:Dict[str, int] = {'hits': 0, 'disk_hits': 0, 'misses': 0, 'evictions': 0, 'disk_evictions': 0}
+        # the disk tier is only touched from its own thread : lookups and batched writes never block the event loop
+        self.disk_tier:Optional[sqlite3.Connection] = None
+        self.disk_executor:Optional[ThreadPoolExecutor] = None
+        self.pending_writes:Dict[bytes, bytes] = {}
+        self.pending_touches:Set[bytes] = set()  # disk hits, their access timestamp is refreshed with the next batched write
+        self.disk_bytes = 0
+        self.flush_handle:Optional[asyncio.TimerHandle] = None
+        if config.disk_path is not None:
+            self.disk_tier = sqlite3.connect(config.disk_path, check_same_thread=False)
+            self.disk_tier.execute('PRAGMA journal_mode=WAL')
+            self.disk_tier.execute('PRAGMA synchronous=NORMAL')
+            self.disk_tier.execute('CREATE TABLE IF NOT EXISTS embeddings (key BLOB PRIMARY KEY, value BLOB NOT NULL, accessed_at REAL NOT NULL DEFAULT 0)')
+            columns = [ row[1] for row in self.disk_tier.execute('PRAGMA table_info(embeddings)') ]
+            if 'accessed_at' not in columns:  # files written before the disk tier was bounded
+                self.disk_tier.execute('ALTER TABLE embeddings ADD COLUMN accessed_at REAL NOT NULL DEFAULT 0')
+            self.disk_tier.execute('CREATE INDEX IF NOT EXISTS embeddings_accessed_at ON embeddings (accessed_at)')
+            self.disk_tier.commit()
+            self.disk_bytes = self.disk_tier.execute('SELECT COALESCE(SUM(LENGTH(key) + LENGTH(value)), 0) FROM embeddings').fetchone()[0]
+            self.disk_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='embedding-cache')
+
+    @staticmethod
+    def make_key(topic:str, fingerprint:str, options:List[str], text:str) -> bytes:
+        hasher = sha256()
+        for part in [topic, fingerprint, *options]:
+            hasher.update(part.encode())
+            hasher.update(b'\x00')
+        hasher.update(sha256(text.encode()).digest())
+        return hasher.digest()
+
+    def _insert_in_memory(self, key:bytes, value:bytes) -> None:
+        entry_size = len(key) + len(value) + EmbeddingCache._ENTRY_OVERHEAD
+        if entry_size > self.config.max_memory_bytes:
+            return
+
+        previous_value = self.memory_tier.pop(key, None)
+        if previous_value is not None:
+            self.memory_bytes -= len(key) + len(previous_value) + EmbeddingCache._ENTRY_OVERHEAD
+
+        self.memory_tier[key] = value
+        self.memory_bytes += entry_size
+        while self.memory_bytes > self.config.max_memory_bytes:
+            evicted_key, evicted_value = self.memory_tier.popitem(last=False)
+            self.memory_bytes -= len(evicted_key) + len(evicted_value) + EmbeddingCache._ENTRY_OVERHEAD
+            self.counters['evictions'] += 1
+
+    def _select_many(self, keys:List[bytes]) -> Dict[bytes, bytes]:
+        placeholders = ','.join('?' * len(keys))
+        rows = self.disk_tier.execute(f'SELECT key, value FROM embeddings WHERE key IN ({placeholders})', keys).fetchall()
+        return { bytes(key): value for key, value in rows }
+
+    def _evict_from_disk(self) -> int:
+        # least recently written or hit rows first, one indexed scan per batch of rows
+        nb_evictions = 0
+        while self.disk_bytes > self.config.max_disk_bytes:
+            rows = self.disk_tier.execute(
+                'SELECT key, LENGTH(key) + LENGTH(value) FROM embeddings ORDER BY accessed_at, rowid LIMIT ?', (EmbeddingCache._WRITE_BATCH_SIZE,)
+            ).fetchall()
+            if len(rows) == 0:
+                self.disk_bytes = 0
+                break
+            evicted_keys:List[Tuple[bytes]] = []
+            for key, entry_size in rows:
+                if self.disk_bytes <= self.config.max_disk_bytes:
+                    break
+                evicted_keys.append((key,))
+                self.disk_bytes -= entry_size
+            self.disk_tier.executemany('DELETE FROM embeddings WHERE key = ?', evicted_keys)
+            nb_evictions += len(evicted_keys)
+        return nb_evictions
+
+    def _write_many(self, entries:List[Tuple[bytes, bytes]], touched_keys:List[bytes]) -> None:
+        accessed_at = time()
+        disk_bytes = self.disk_bytes
+        try:
+            keys = [ key for key, _ in entries ]
+            replaced_bytes = self.disk_tier.execute(
+                f'SELECT COALESCE(SUM(LENGTH(key) + LENGTH(value)), 0) FROM embeddings WHERE key IN ({",".join("?" * len(keys))})', keys
+            ).fetchone()[0] if len(keys) > 0 else 0
+            self.disk_tier.executemany('INSERT OR REPLACE INTO embeddings (key, value, accessed_at) VALUES (?, ?, ?)', [ (key, value, accessed_at) for key, value in entries ])
+            self.disk_tier.executemany('UPDATE embeddings SET accessed_at = ? WHERE key = ?', [ (accessed_at, key) for key in touched_keys ])
+            self.disk_bytes += sum(len(key) + len(value) for key, value in entries) - replaced_bytes
+            nb_evictions = self._evict_from_disk()
+            self.disk_tier.commit()
+            self.counters['disk_evictions'] += nb_evictions
+        except sqlite3.Error as e:
+            logger.warning(e)
+            self.disk_tier.rollback()
+            self.disk_bytes = disk_bytes
+
+    def _lookup_in_memory(self, keys:List[bytes]) -> Tuple[Dict[bytes, bytes], List[bytes]]:
+        key2value:Dict[bytes, bytes] = {}
+        missing_keys:List[bytes] = []
+        for key in keys:
+            value = self.memory_tier.get(key, None)
+            if value is not None:
+                self.memory_tier.move_to_end(key)
+            else:
+                value = self.pending_writes.get(key, None)  # evicted from memory before reaching the disk
+            if value is not None:
+                key2value[key] = value
+                self.counters['hits'] += 1
+            else:
+                missing_keys.append(key)
+        return key2value, missing_keys
+
+    def _merge_disk_values(self, key2value:Dict[bytes, bytes], missing_keys:List[bytes], disk_key2value:Dict[bytes, bytes]) -> Dict[bytes, bytes]:
+        for key in missing_keys:
+            value = disk_key2value.get(key, None)
+            if value is None:
+                self.counters['misses'] += 1
+                continue
+            self._insert_in_memory(key, value)
+            key2value[key] = value
+            self.counters['hits'] += 1
+            self.counters['disk_hits'] += 1
+            self.pending_touches.add(key)
+        if len(self.pending_touches) > 0:
+            self._schedule_flush()
+        return key2value
+
+    async def get_many(self, keys:List[bytes]) -> Dict[bytes, bytes]:
+        key2value, missing_keys = self._lookup_in_memory(keys)
+        disk_key2value:Dict[bytes, bytes] = {}
+        if self.disk_executor is not None and len(missing_keys) > 0:
+            loop = asyncio.get_running_loop()
+            disk_key2value = await loop.run_in_executor(self.disk_executor, self._select_many, missing_keys)
+        return self._merge_disk_values(key2value, missing_keys, disk_key2value)
+
+    def get(self, key:bytes) -> Optional[bytes]:
+        # blocking variant, for callers running outside of an event loop
+        key2value, missing_keys = self._lookup_in_memory([key])
+        disk_key2value:Dict[bytes, bytes] = {}
+        if self.disk_executor is not None and len(missing_keys) > 0:
+            disk_key2value = self.disk_executor.submit(self._select_many, missing_keys).result()
+        return self._merge_disk_values(key2value, missing_keys, disk_key2value).get(key, None)
+
+    def put(self, key:bytes, value:bytes) -> None:
+        self._insert_in_memory(key, value)
+        if self.disk_executor is None:
+            return
+        self.pending_writes[key] = value
+        self._schedule_flush()
+
+    def _schedule_flush(self) -> None:
+        if len(self.pending_writes) + len(self.pending_touches) >= EmbeddingCache._WRITE_BATCH_SIZE:
+            self.flush()
+            return
+        if self.flush_handle is None:
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:  # no event loop : nothing would run a delayed flush
+                self.flush()
+                return
+            self.flush_handle = loop.call_later(EmbeddingCache._FLUSH_DELAY, self.flush)
+
+    def flush(self) -> None:
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+        if self.disk_executor is None or len(self.pending_writes) + len(self.pending_touches) == 0:
+            return
+        entries = list(self.pending_writes.items())
+        touched_keys = list(self.pending_touches)
+        self.pending_writes = {}
+        self.pending_touches = set()
+        self.disk_executor.submit(self._write_many, entries, touched_keys)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            **self.counters,
+            'entries': len(self.memory_tier),
+            'memory_bytes': self.memory_bytes,
+            'disk_bytes': self.disk_bytes,
+            'pending_writes': len(self.pending_writes)
+        }
+
+    def close(self) -> None:
+        if self.disk_executor is not None:
+            self.flush()
+            self.disk_executor.submit(self.disk_tier.close).result()
+            self.disk_executor.shutdown(wait=True)
+            self.disk_executor = None
+            self.disk_tier = None
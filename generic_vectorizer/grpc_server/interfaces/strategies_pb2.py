@@ -14,7 +14,7 @@ _sym_db = _symbol_database.Default()
 
 
 
-DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x10strategies.proto\x12\x15TextSemanticEmbedding\"\xa1\x01\n\tEmbedding\x12\x14\n\x0c\x64\x65nse_values\x18\x01 \x03(\x02\x12I\n\rsparse_values\x18\x02 \x03(\x0b\x32\x32.TextSemanticEmbedding.Embedding.SparseValuesEntry\x1a\x33\n\x11SparseValuesEntry\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\r\n\x05value\x18\x02 \x01(\x02:\x02\x38\x01\"{\n\x14TextEmbeddingRequest\x12\x14\n\x0ctarget_topic\x18\x01 \x01(\t\x12\x0c\n\x04text\x18\x02 \x01(\t\x12\x12\n\nchunk_size\x18\x03 \x01(\x05\x12\x14\n\x0creturn_dense\x18\x04 \x01(\x08\x12\x15\n\rreturn_sparse\x18\x05 \x01(\x08\"z\n\x15TextEmbeddingResponse\x12\x0e\n\x06status\x18\x01 \x01(\x08\x12\x12\n\x05\x65rror\x18\x02 \x01(\tH\x00\x88\x01\x01\x12\x33\n\tembedding\x18\x03 \x01(\x0b\x32 .TextSemanticEmbedding.EmbeddingB\x08\n\x06_error\"\x81\x01\n\x19TextBatchEmbeddingRequest\x12\x14\n\x0ctarget_topic\x18\x01 \x01(\t\x12\r\n\x05texts\x18\x02 \x03(\t\x12\x12\n\nchunk_size\x18\x03 \x01(\x05\x12\x14\n\x0creturn_dense\x18\x04 \x01(\x08\x12\x15\n\rreturn_sparse\x18\x05 \x01(\x08\"\x80\x01\n\x1aTextBatchEmbeddingResponse\x12\x0e\n\x06status\x18\x01 \x01(\x08\x12\x12\n\x05\x65rror\x18\x02 \x01(\tH\x00\x88\x01\x01\x12\x34\n\nembeddings\x18\x03 \x03(\x0b\x32 .TextSemanticEmbedding.EmbeddingB\x08\n\x06_error\"a\n\x17TextRerankScoresRequest\x12\r\n\x05query\x18\x01 \x01(\t\x12\x14\n\x0ctarget_topic\x18\x02 \x01(\t\x12\x0e\n\x06\x63orpus\x18\x03 \x03(\t\x12\x11\n\tnormalize\x18\x04 \x01(\x08\"X\n\x18TextRerankScoresResponse\x12\x0e\n\x06status\x18\x01 \x01(\x08\x12\x12\n\x05\x65rror\x18\x02 \x01(\tH\x00\x88\x01\x01\x12\x0e\n\x06scores\x18\x03 \x03(\x02\x42\x08\n\x06_error2\xfa\x02\n\rTextEmbedding\x12o\n\x10getTextEmbedding\x12+.TextSemanticEmbedding.TextEmbeddingRequest\x1a,.TextSemanticEmbedding.TextEmbeddingResponse\"\x00\x12~\n\x15getTextBatchEmbedding\x12\x30.TextSemanticEmbedding.TextBatchEmbeddingRequest\x1a\x31.TextSemanticEmbedding.TextBatchEmbeddingResponse\"\x00\x12x\n\x13getTextRerankScores\x12..TextSemanticEmbedding.TextRerankScoresRequest\x1a/.TextSemanticEmbedding.TextRerankScoresResponse\"\x00\x62\x06proto3')
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x10strategies.proto\x12\x15TextSemanticEmbedding\"\xba\x02\n\tEmbedding\x12\x14\n\x0c\x64\x65nse_values\x18\x01 \x03(\x02\x12I\n\rsparse_values\x18\x02 \x03(\x0b\x32\x32.TextSemanticEmbedding.Embedding.SparseValuesEntry\x12\x14\n\x0c\x64\x65nse_buffer\x18\x03 \x01(\x0c\x12<\n\x0e\x64\x65nse_encoding\x18\x04 \x01(\x0e\x32$.TextSemanticEmbedding.DenseEncoding\x12\x13\n\x0b\x64\x65nse_scale\x18\x05 \x01(\x02\x12\x16\n\x0esparse_indices\x18\x06 \x03(\r\x12\x16\n\x0esparse_weights\x18\x07 \x03(\x02\x1a\x33\n\x11SparseValuesEntry\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\r\n\x05value\x18\x02 \x01(\x02:\x02\x38\x01\"\xd8\x03\n\x14TextEmbeddingRequest\x12\x14\n\x0ctarget_topic\x18\x01 \x01(\t\x12\x0c\n\x04text\x18\x02 \x01(\t\x12\x12\n\nchunk_size\x18\x03 \x01(\x05\x12\x14\n\x0creturn_dense\x18\x04 \x01(\x08\x12\x15\n\rreturn_sparse\x18\x05 \x01(\x08\x12\x14\n\x0c\x62ypass_cache\x18\x06 \x01(\x08\x12<\n\x0e\x64\x65nse_encoding\x18\x07 \x01(\x0e\x32$.TextSemanticEmbedding.DenseEncoding\x12:\n\rsparse_format\x18\x08 \x01(\x0e\x32#.TextSemanticEmbedding.SparseFormat\x12<\n\x0esparse_pooling\x18\t \x01(\x0e\x32$.TextSemanticEmbedding.SparsePooling\x12\x31\n\x08priority\x18\n \x01(\x0e\x32\x1f.TextSemanticEmbedding.Priority\x12\x16\n\x0ereturn_timings\x18\x0b \x01(\x08\x12\x42\n\x11\x64\x65nse_aggregation\x18\x0c \x01(\x0e\x32\'.TextSemanticEmbedding.DenseAggregation\"\xfd\x01\n\x15TextEmbeddingResponse\x12\x0e\n\x06status\x18\x01 \x01(\x08\x12\x12\n\x05\x65rror\x18\x02 \x01(\tH\x00\x88\x01\x01\x12\x33\n\tembedding\x18\x03 \x01(\x0b\x32 .TextSemanticEmbedding.Embedding\x12O\n\ntimings_ms\x18\x04 \x03(\x0b\x32;.TextSemanticEmbedding.TextEmbeddingResponse.TimingsMsEntry\x1a\x30\n\x0eTimingsMsEntry\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\r\n\x05value\x18\x02 \x01(\x01:\x02\x38\x01\x42\x08\n\x06_error\"\xde\x03\n\x19TextBatchEmbeddingRequest\x12\x14\n\x0ctarget_topic\x18\x01 \x01(\t\x12\r\n\x05texts\x18\x02 \x03(\t\x12\x12\n\nchunk_size\x18\x03 \x01(\x05\x12\x14\n\x0creturn_dense\x18\x04 \x01(\x08\x12\x15\n\rreturn_sparse\x18\x05 \x01(\x08\x12\x14\n\x0c\x62ypass_cache\x18\x06 \x01(\x08\x12<\n\x0e\x64\x65nse_encoding\x18\x07 \x01(\x0e\x32$.TextSemanticEmbedding.DenseEncoding\x12:\n\rsparse_format\x18\x08 \x01(\x0e\x32#.TextSemanticEmbedding.SparseFormat\x12<\n\x0esparse_pooling\x18\t \x01(\x0e\x32$.TextSemanticEmbedding.SparsePooling\x12\x31\n\x08priority\x18\n \x01(\x0e\x32\x1f.TextSemanticEmbedding.Priority\x12\x16\n\x0ereturn_timings\x18\x0b \x01(\x08\x12\x42\n\x11\x64\x65nse_aggregation\x18\x0c \x01(\x0e\x32\'.TextSemanticEmbedding.DenseAggregation\"\x88\x02\n\x1aTextBatchEmbeddingResponse\x12\x0e\n\x06status\x18\x01 \x01(\x08\x12\x12\n\x05\x65rror\x18\x02 \x01(\tH\x00\x88\x01\x01\x12\x34\n\nembeddings\x18\x03 \x03(\x0b\x32 .TextSemanticEmbedding.Embedding\x12T\n\ntimings_ms\x18\x04 \x03(\x0b\x32@.TextSemanticEmbedding.TextBatchEmbeddingResponse.TimingsMsEntry\x1a\x30\n\x0eTimingsMsEntry\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\r\n\x05value\x18\x02 \x01(\x01:\x02\x38\x01\x42\x08\n\x06_error\"n\n\x1aTextStreamEmbeddingRequest\x12\x12\n\nrequest_id\x18\x01 \x01(\t\x12<\n\x07request\x18\x02 \x01(\x0b\x32+.TextSemanticEmbedding.TextEmbeddingRequest\"q\n\x1bTextStreamEmbeddingResponse\x12\x12\n\nrequest_id\x18\x01 \x01(\t\x12>\n\x08response\x18\x02 \x01(\x0b\x32,.TextSemanticEmbedding.TextEmbeddingResponse\"\xbb\x01\n\x17TextRerankScoresRequest\x12\r\n\x05query\x18\x01 \x01(\t\x12\x14\n\x0ctarget_topic\x18\x02 \x01(\t\x12\x0e\n\x06\x63orpus\x18\x03 \x03(\t\x12\x11\n\tnormalize\x18\x04 \x01(\x08\x12\x31\n\x08priority\x18\x05 \x01(\x0e\x32\x1f.TextSemanticEmbedding.Priority\x12\x16\n\x0ereturn_timings\x18\x06 \x01(\x08\x12\r\n\x05top_k\x18\x07 \x01(\x05\")\n\tRerankHit\x12\r\n\x05index\x18\x01 \x01(\r\x12\r\n\x05score\x18\x02 \x01(\x02\"\x8e\x02\n\x18TextRerankScoresResponse\x12\x0e\n\x06status\x18\x01 \x01(\x08\x12\x12\n\x05\x65rror\x18\x02 \x01(\tH\x00\x88\x01\x01\x12\x0e\n\x06scores\x18\x03 \x03(\x02\x12R\n\ntimings_ms\x18\x04 \x03(\x0b\x32>.TextSemanticEmbedding.TextRerankScoresResponse.TimingsMsEntry\x12.\n\x04hits\x18\x05 \x03(\x0b\x32 .TextSemanticEmbedding.RerankHit\x1a\x30\n\x0eTimingsMsEntry\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\r\n\x05value\x18\x02 \x01(\x01:\x02\x38\x01\x42\x08\n\x06_error\",\n\x0bRerankGroup\x12\r\n\x05query\x18\x01 \x01(\t\x12\x0e\n\x06\x63orpus\x18\x02 \x03(\t\"N\n\x0cRerankScores\x12\x0e\n\x06scores\x18\x01 \x03(\x02\x12.\n\x04hits\x18\x02 \x03(\x0b\x32 .TextSemanticEmbedding.RerankHit\"\xd5\x01\n\x1cTextBatchRerankScoresRequest\x12\x14\n\x0ctarget_topic\x18\x01 \x01(\t\x12\x32\n\x06groups\x18\x02 \x03(\x0b\x32\".TextSemanticEmbedding.RerankGroup\x12\x11\n\tnormalize\x18\x03 \x01(\x08\x12\x31\n\x08priority\x18\x04 \x01(\x0e\x32\x1f.TextSemanticEmbedding.Priority\x12\x16\n\x0ereturn_timings\x18\x05 \x01(\x08\x12\r\n\x05top_k\x18\x06 \x01(\x05\"\x8e\x02\n\x1dTextBatchRerankScoresResponse\x12\x0e\n\x06status\x18\x01 \x01(\x08\x12\x12\n\x05\x65rror\x18\x02 \x01(\tH\x00\x88\x01\x01\x12\x34\n\x07results\x18\x03 \x03(\x0b\x32#.TextSemanticEmbedding.RerankScores\x12W\n\ntimings_ms\x18\x04 \x03(\x0b\x32\x43.TextSemanticEmbedding.TextBatchRerankScoresResponse.TimingsMsEntry\x1a\x30\n\x0eTimingsMsEntry\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\r\n\x05value\x18\x02 \x01(\x01:\x02\x38\x01\x42\x08\n\x06_error*C\n\rDenseEncoding\x12\x0e\n\nFLOAT_LIST\x10\x00\x12\x0b\n\x07\x46LOAT32\x10\x01\x12\x0b\n\x07\x46LOAT16\x10\x02\x12\x08\n\x04INT8\x10\x03*9\n\x0cSparseFormat\x12\x14\n\x10TOKEN_WEIGHT_MAP\x10\x00\x12\x13\n\x0fTOKEN_ID_ARRAYS\x10\x01*1\n\rSparsePooling\x12\x0f\n\x0bMAX_POOLING\x10\x00\x12\x0f\n\x0bSUM_POOLING\x10\x01*v\n\x10\x44\x65nseAggregation\x12\x1a\n\x16\x43\x45NTRALITY_AGGREGATION\x10\x00\x12\x14\n\x10MEAN_AGGREGATION\x10\x01\x12\x13\n\x0fMAX_AGGREGATION\x10\x02\x12\x1b\n\x17\x46IRST_CHUNK_AGGREGATION\x10\x03*;\n\x08Priority\x12\x14\n\x10\x44\x45\x46\x41ULT_PRIORITY\x10\x00\x12\x0f\n\x0bINTERACTIVE\x10\x01\x12\x08\n\x04\x42ULK\x10\x02\x32\x91\x06\n\rTextEmbedding\x12o\n\x10getTextEmbedding\x12+.TextSemanticEmbedding.TextEmbeddingRequest\x1a,.TextSemanticEmbedding.TextEmbeddingResponse\"\x00\x12~\n\x15getTextBatchEmbedding\x12\x30.TextSemanticEmbedding.TextBatchEmbeddingRequest\x1a\x31.TextSemanticEmbedding.TextBatchEmbeddingResponse\"\x00\x12x\n\x13getTextRerankScores\x12..TextSemanticEmbedding.TextRerankScoresRequest\x1a/.TextSemanticEmbedding.TextRerankScoresResponse\"\x00\x12\x87\x01\n\x18getTextBatchRerankScores\x12\x33.TextSemanticEmbedding.TextBatchRerankScoresRequest\x1a\x34.TextSemanticEmbedding.TextBatchRerankScoresResponse\"\x00\x12\x83\x01\n\x14streamTextEmbeddings\x12\x31.TextSemanticEmbedding.TextStreamEmbeddingRequest\x1a\x32.TextSemanticEmbedding.TextStreamEmbeddingResponse\"\x00(\x01\x30\x01\x12\x84\x01\n\x18streamTextBatchEmbedding\x12\x30.TextSemanticEmbedding.TextBatchEmbeddingRequest\x1a\x32.TextSemanticEmbedding.TextStreamEmbeddingResponse\"\x00\x30\x01\x62\x06proto3')
 
 _globals = globals()
 _builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, _globals)
@@ -23,22 +23,62 @@ if not _descriptor._USE_C_DESCRIPTORS:
   DESCRIPTOR._loaded_options = None
   _globals['_EMBEDDING_SPARSEVALUESENTRY']._loaded_options = None
   _globals['_EMBEDDING_SPARSEVALUESENTRY']._serialized_options = b'8\001'
+  _globals['_TEXTEMBEDDINGRESPONSE_TIMINGSMSENTRY']._loaded_options = None
+  _globals['_TEXTEMBEDDINGRESPONSE_TIMINGSMSENTRY']._serialized_options = b'8\001'
+  _globals['_TEXTBATCHEMBEDDINGRESPONSE_TIMINGSMSENTRY']._loaded_options = None
+  _globals['_TEXTBATCHEMBEDDINGRESPONSE_TIMINGSMSENTRY']._serialized_options = b'8\001'
+  _globals['_TEXTRERANKSCORESRESPONSE_TIMINGSMSENTRY']._loaded_options = None
+  _globals['_TEXTRERANKSCORESRESPONSE_TIMINGSMSENTRY']._serialized_options = b'8\001'
+  _globals['_TEXTBATCHRERANKSCORESRESPONSE_TIMINGSMSENTRY']._loaded_options = None
+  _globals['_TEXTBATCHRERANKSCORESRESPONSE_TIMINGSMSENTRY']._serialized_options = b'8\001'
+  _globals['_DENSEENCODING']._serialized_start=3187
+  _globals['_DENSEENCODING']._serialized_end=3254
+  _globals['_SPARSEFORMAT']._serialized_start=3256
+  _globals['_SPARSEFORMAT']._serialized_end=3313
+  _globals['_SPARSEPOOLING']._serialized_start=3315
+  _globals['_SPARSEPOOLING']._serialized_end=3364
+  _globals['_DENSEAGGREGATION']._serialized_start=3366
+  _globals['_DENSEAGGREGATION']._serialized_end=3484
+  _globals['_PRIORITY']._serialized_start=3486
+  _globals['_PRIORITY']._serialized_end=3545
   _globals['_EMBEDDING']._serialized_start=44
-  _globals['_EMBEDDING']._serialized_end=205
-  _globals['_EMBEDDING_SPARSEVALUESENTRY']._serialized_start=154
-  _globals['_EMBEDDING_SPARSEVALUESENTRY']._serialized_end=205
-  _globals['_TEXTEMBEDDINGREQUEST']._serialized_start=207
-  _globals['_TEXTEMBEDDINGREQUEST']._serialized_end=330
-  _globals['_TEXTEMBEDDINGRESPONSE']._serialized_start=332
-  _globals['_TEXTEMBEDDINGRESPONSE']._serialized_end=454
-  _globals['_TEXTBATCHEMBEDDINGREQUEST']._serialized_start=457
-  _globals['_TEXTBATCHEMBEDDINGREQUEST']._serialized_end=586
-  _globals['_TEXTBATCHEMBEDDINGRESPONSE']._serialized_start=589
-  _globals['_TEXTBATCHEMBEDDINGRESPONSE']._serialized_end=717
-  _globals['_TEXTRERANKSCORESREQUEST']._serialized_start=719
-  _globals['_TEXTRERANKSCORESREQUEST']._serialized_end=816
-  _globals['_TEXTRERANKSCORESRESPONSE']._serialized_start=818
-  _globals['_TEXTRERANKSCORESRESPONSE']._serialized_end=906
-  _globals['_TEXTEMBEDDING']._serialized_start=909
-  _globals['_TEXTEMBEDDING']._serialized_end=1287
+  _globals['_EMBEDDING']._serialized_end=358
+  _globals['_EMBEDDING_SPARSEVALUESENTRY']._serialized_start=307
+  _globals['_EMBEDDING_SPARSEVALUESENTRY']._serialized_end=358
+  _globals['_TEXTEMBEDDINGREQUEST']._serialized_start=361
+  _globals['_TEXTEMBEDDINGREQUEST']._serialized_end=833
+  _globals['_TEXTEMBEDDINGRESPONSE']._serialized_start=836
+  _globals['_TEXTEMBEDDINGRESPONSE']._serialized_end=1089
+  _globals['_TEXTEMBEDDINGRESPONSE_TIMINGSMSENTRY']._serialized_start=1031
+  _globals['_TEXTEMBEDDINGRESPONSE_TIMINGSMSENTRY']._serialized_end=1079
+  _globals['_TEXTBATCHEMBEDDINGREQUEST']._serialized_start=1092
+  _globals['_TEXTBATCHEMBEDDINGREQUEST']._serialized_end=1570
+  _globals['_TEXTBATCHEMBEDDINGRESPONSE']._serialized_start=1573
+  _globals['_TEXTBATCHEMBEDDINGRESPONSE']._serialized_end=1837
+  _globals['_TEXTBATCHEMBEDDINGRESPONSE_TIMINGSMSENTRY']._serialized_start=1031
+  _globals['_TEXTBATCHEMBEDDINGRESPONSE_TIMINGSMSENTRY']._serialized_end=1079
+  _globals['_TEXTSTREAMEMBEDDINGREQUEST']._serialized_start=1839
+  _globals['_TEXTSTREAMEMBEDDINGREQUEST']._serialized_end=1949
+  _globals['_TEXTSTREAMEMBEDDINGRESPONSE']._serialized_start=1951
+  _globals['_TEXTSTREAMEMBEDDINGRESPONSE']._serialized_end=2064
+  _globals['_TEXTRERANKSCORESREQUEST']._serialized_start=2067
+  _globals['_TEXTRERANKSCORESREQUEST']._serialized_end=2254
+  _globals['_RERANKHIT']._serialized_start=2256
+  _globals['_RERANKHIT']._serialized_end=2297
+  _globals['_TEXTRERANKSCORESRESPONSE']._serialized_start=2300
+  _globals['_TEXTRERANKSCORESRESPONSE']._serialized_end=2570
+  _globals['_TEXTRERANKSCORESRESPONSE_TIMINGSMSENTRY']._serialized_start=1031
+  _globals['_TEXTRERANKSCORESRESPONSE_TIMINGSMSENTRY']._serialized_end=1079
+  _globals['_RERANKGROUP']._serialized_start=2572
+  _globals['_RERANKGROUP']._serialized_end=2616
+  _globals['_RERANKSCORES']._serialized_start=2618
+  _globals['_RERANKSCORES']._serialized_end=2696
+  _globals['_TEXTBATCHRERANKSCORESREQUEST']._serialized_start=2699
+  _globals['_TEXTBATCHRERANKSCORESREQUEST']._serialized_end=2912
+  _globals['_TEXTBATCHRERANKSCORESRESPONSE']._serialized_start=2915
+  _globals['_TEXTBATCHRERANKSCORESRESPONSE']._serialized_end=3185
+  _globals['_TEXTBATCHRERANKSCORESRESPONSE_TIMINGSMSENTRY']._serialized_start=1031
+  _globals['_TEXTBATCHRERANKSCORESRESPONSE_TIMINGSMSENTRY']._serialized_end=1079
+  _globals['_TEXTEMBEDDING']._serialized_start=3548
+  _globals['_TEXTEMBEDDING']._serialized_end=4333
 # @@protoc_insertion_point(module_scope)
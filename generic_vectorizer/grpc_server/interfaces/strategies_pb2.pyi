@@ -1,12 +1,58 @@
 from google.protobuf.internal import containers as _containers
+from google.protobuf.internal import enum_type_wrapper as _enum_type_wrapper
 from google.protobuf import descriptor as _descriptor
 from google.protobuf import message as _message
 from typing import ClassVar as _ClassVar, Iterable as _Iterable, Mapping as _Mapping, Optional as _Optional, Union as _Union
 
 DESCRIPTOR: _descriptor.FileDescriptor
 
+class DenseEncoding(int, metaclass=_enum_type_wrapper.EnumTypeWrapper):
+    __slots__ = ()
+    FLOAT_LIST: _ClassVar[DenseEncoding]
+    FLOAT32: _ClassVar[DenseEncoding]
+    FLOAT16: _ClassVar[DenseEncoding]
+    INT8: _ClassVar[DenseEncoding]
+
+class SparseFormat(int, metaclass=_enum_type_wrapper.EnumTypeWrapper):
+    __slots__ = ()
+    TOKEN_WEIGHT_MAP: _ClassVar[SparseFormat]
+    TOKEN_ID_ARRAYS: _ClassVar[SparseFormat]
+
+class SparsePooling(int, metaclass=_enum_type_wrapper.EnumTypeWrapper):
+    __slots__ = ()
+    MAX_POOLING: _ClassVar[SparsePooling]
+    SUM_POOLING: _ClassVar[SparsePooling]
+
+class DenseAggregation(int, metaclass=_enum_type_wrapper.EnumTypeWrapper):
+    __slots__ = ()
+    CENTRALITY_AGGREGATION: _ClassVar[DenseAggregation]
+    MEAN_AGGREGATION: _ClassVar[DenseAggregation]
+    MAX_AGGREGATION: _ClassVar[DenseAggregation]
+    FIRST_CHUNK_AGGREGATION: _ClassVar[DenseAggregation]
+
+class Priority(int, metaclass=_enum_type_wrapper.EnumTypeWrapper):
+    __slots__ = ()
+    DEFAULT_PRIORITY: _ClassVar[Priority]
+    INTERACTIVE: _ClassVar[Priority]
+    BULK: _ClassVar[Priority]
+FLOAT_LIST: DenseEncoding
+FLOAT32: DenseEncoding
+FLOAT16: DenseEncoding
+INT8: DenseEncoding
+TOKEN_WEIGHT_MAP: SparseFormat
+TOKEN_ID_ARRAYS: SparseFormat
+MAX_POOLING: SparsePooling
+SUM_POOLING: SparsePooling
+CENTRALITY_AGGREGATION: DenseAggregation
+MEAN_AGGREGATION: DenseAggregation
+MAX_AGGREGATION: DenseAggregation
+FIRST_CHUNK_AGGREGATION: DenseAggregation
+DEFAULT_PRIORITY: Priority
+INTERACTIVE: Priority
+BULK: Priority
+
 class Embedding(_message.Message):
-    __slots__ = ("dense_values", "sparse_values")
+    __slots__ = ("dense_values", "sparse_values", "dense_buffer", "dense_encoding", "dense_scale", "sparse_indices", "sparse_weights")
     class SparseValuesEntry(_message.Message):
         __slots__ = ("key", "value")
         KEY_FIELD_NUMBER: _ClassVar[int]
@@ -16,76 +62,224 @@ class Embedding(_message.Message):
         def __init__(self, key: _Optional[str] = ..., value: _Optional[float] = ...) -> None: ...
     DENSE_VALUES_FIELD_NUMBER: _ClassVar[int]
     SPARSE_VALUES_FIELD_NUMBER: _ClassVar[int]
+    DENSE_BUFFER_FIELD_NUMBER: _ClassVar[int]
+    DENSE_ENCODING_FIELD_NUMBER: _ClassVar[int]
+    DENSE_SCALE_FIELD_NUMBER: _ClassVar[int]
+    SPARSE_INDICES_FIELD_NUMBER: _ClassVar[int]
+    SPARSE_WEIGHTS_FIELD_NUMBER: _ClassVar[int]
     dense_values: _containers.RepeatedScalarFieldContainer[float]
     sparse_values: _containers.ScalarMap[str, float]
-    def __init__(self, dense_values: _Optional[_Iterable[float]] = ..., sparse_values: _Optional[_Mapping[str, float]] = ...) -> None: ...
+    dense_buffer: bytes
+    dense_encoding: DenseEncoding
+    dense_scale: float
+    sparse_indices: _containers.RepeatedScalarFieldContainer[int]
+    sparse_weights: _containers.RepeatedScalarFieldContainer[float]
+    def __init__(self, dense_values: _Optional[_Iterable[float]] = ..., sparse_values: _Optional[_Mapping[str, float]] = ..., dense_buffer: _Optional[bytes] = ..., dense_encoding: _Optional[_Union[DenseEncoding, str]] = ..., dense_scale: _Optional[float] = ..., sparse_indices: _Optional[_Iterable[int]] = ..., sparse_weights: _Optional[_Iterable[float]] = ...) -> None: ...
 
 class TextEmbeddingRequest(_message.Message):
-    __slots__ = ("target_topic", "text", "chunk_size", "return_dense", "return_sparse")
+    __slots__ = ("target_topic", "text", "chunk_size", "return_dense", "return_sparse", "bypass_cache", "dense_encoding", "sparse_format", "sparse_pooling", "priority", "return_timings", "dense_aggregation")
     TARGET_TOPIC_FIELD_NUMBER: _ClassVar[int]
     TEXT_FIELD_NUMBER: _ClassVar[int]
     CHUNK_SIZE_FIELD_NUMBER: _ClassVar[int]
     RETURN_DENSE_FIELD_NUMBER: _ClassVar[int]
     RETURN_SPARSE_FIELD_NUMBER: _ClassVar[int]
+    BYPASS_CACHE_FIELD_NUMBER: _ClassVar[int]
+    DENSE_ENCODING_FIELD_NUMBER: _ClassVar[int]
+    SPARSE_FORMAT_FIELD_NUMBER: _ClassVar[int]
+    SPARSE_POOLING_FIELD_NUMBER: _ClassVar[int]
+    PRIORITY_FIELD_NUMBER: _ClassVar[int]
+    RETURN_TIMINGS_FIELD_NUMBER: _ClassVar[int]
+    DENSE_AGGREGATION_FIELD_NUMBER: _ClassVar[int]
     target_topic: str
     text: str
     chunk_size: int
     return_dense: bool
     return_sparse: bool
-    def __init__(self, target_topic: _Optional[str] = ..., text: _Optional[str] = ..., chunk_size: _Optional[int] = ..., return_dense: bool = ..., return_sparse: bool = ...) -> None: ...
+    bypass_cache: bool
+    dense_encoding: DenseEncoding
+    sparse_format: SparseFormat
+    sparse_pooling: SparsePooling
+    priority: Priority
+    return_timings: bool
+    dense_aggregation: DenseAggregation
+    def __init__(self, target_topic: _Optional[str] = ..., text: _Optional[str] = ..., chunk_size: _Optional[int] = ..., return_dense: bool = ..., return_sparse: bool = ..., bypass_cache: bool = ..., dense_encoding: _Optional[_Union[DenseEncoding, str]] = ..., sparse_format: _Optional[_Union[SparseFormat, str]] = ..., sparse_pooling: _Optional[_Union[SparsePooling, str]] = ..., priority: _Optional[_Union[Priority, str]] = ..., return_timings: bool = ..., dense_aggregation: _Optional[_Union[DenseAggregation, str]] = ...) -> None: ...
 
 class TextEmbeddingResponse(_message.Message):
-    __slots__ = ("status", "error", "embedding")
+    __slots__ = ("status", "error", "embedding", "timings_ms")
+    class TimingsMsEntry(_message.Message):
+        __slots__ = ("key", "value")
+        KEY_FIELD_NUMBER: _ClassVar[int]
+        VALUE_FIELD_NUMBER: _ClassVar[int]
+        key: str
+        value: float
+        def __init__(self, key: _Optional[str] = ..., value: _Optional[float] = ...) -> None: ...
     STATUS_FIELD_NUMBER: _ClassVar[int]
     ERROR_FIELD_NUMBER: _ClassVar[int]
     EMBEDDING_FIELD_NUMBER: _ClassVar[int]
+    TIMINGS_MS_FIELD_NUMBER: _ClassVar[int]
     status: bool
     error: str
     embedding: Embedding
-    def __init__(self, status: bool = ..., error: _Optional[str] = ..., embedding: _Optional[_Union[Embedding, _Mapping]] = ...) -> None: ...
+    timings_ms: _containers.ScalarMap[str, float]
+    def __init__(self, status: bool = ..., error: _Optional[str] = ..., embedding: _Optional[_Union[Embedding, _Mapping]] = ..., timings_ms: _Optional[_Mapping[str, float]] = ...) -> None: ...
 
 class TextBatchEmbeddingRequest(_message.Message):
-    __slots__ = ("target_topic", "texts", "chunk_size", "return_dense", "return_sparse")
+    __slots__ = ("target_topic", "texts", "chunk_size", "return_dense", "return_sparse", "bypass_cache", "dense_encoding", "sparse_format", "sparse_pooling", "priority", "return_timings", "dense_aggregation")
     TARGET_TOPIC_FIELD_NUMBER: _ClassVar[int]
     TEXTS_FIELD_NUMBER: _ClassVar[int]
     CHUNK_SIZE_FIELD_NUMBER: _ClassVar[int]
     RETURN_DENSE_FIELD_NUMBER: _ClassVar[int]
     RETURN_SPARSE_FIELD_NUMBER: _ClassVar[int]
+    BYPASS_CACHE_FIELD_NUMBER: _ClassVar[int]
+    DENSE_ENCODING_FIELD_NUMBER: _ClassVar[int]
+    SPARSE_FORMAT_FIELD_NUMBER: _ClassVar[int]
+    SPARSE_POOLING_FIELD_NUMBER: _ClassVar[int]
+    PRIORITY_FIELD_NUMBER: _ClassVar[int]
+    RETURN_TIMINGS_FIELD_NUMBER: _ClassVar[int]
+    DENSE_AGGREGATION_FIELD_NUMBER: _ClassVar[int]
     target_topic: str
     texts: _containers.RepeatedScalarFieldContainer[str]
     chunk_size: int
     return_dense: bool
     return_sparse: bool
-    def __init__(self, target_topic: _Optional[str] = ..., texts: _Optional[_Iterable[str]] = ..., chunk_size: _Optional[int] = ..., return_dense: bool = ..., return_sparse: bool = ...) -> None: ...
+    bypass_cache: bool
+    dense_encoding: DenseEncoding
+    sparse_format: SparseFormat
+    sparse_pooling: SparsePooling
+    priority: Priority
+    return_timings: bool
+    dense_aggregation: DenseAggregation
+    def __init__(self, target_topic: _Optional[str] = ..., texts: _Optional[_Iterable[str]] = ..., chunk_size: _Optional[int] = ..., return_dense: bool = ..., return_sparse: bool = ..., bypass_cache: bool = ..., dense_encoding: _Optional[_Union[DenseEncoding, str]] = ..., sparse_format: _Optional[_Union[SparseFormat, str]] = ..., sparse_pooling: _Optional[_Union[SparsePooling, str]] = ..., priority: _Optional[_Union[Priority, str]] = ..., return_timings: bool = ..., dense_aggregation: _Optional[_Union[DenseAggregation, str]] = ...) -> None: ...
 
 class TextBatchEmbeddingResponse(_message.Message):
-    __slots__ = ("status", "error", "embeddings")
+    __slots__ = ("status", "error", "embeddings", "timings_ms")
+    class TimingsMsEntry(_message.Message):
+        __slots__ = ("key", "value")
+        KEY_FIELD_NUMBER: _ClassVar[int]
+        VALUE_FIELD_NUMBER: _ClassVar[int]
+        key: str
+        value: float
+        def __init__(self, key: _Optional[str] = ..., value: _Optional[float] = ...) -> None: ...
     STATUS_FIELD_NUMBER: _ClassVar[int]
     ERROR_FIELD_NUMBER: _ClassVar[int]
     EMBEDDINGS_FIELD_NUMBER: _ClassVar[int]
+    TIMINGS_MS_FIELD_NUMBER: _ClassVar[int]
     status: bool
     error: str
     embeddings: _containers.RepeatedCompositeFieldContainer[Embedding]
-    def __init__(self, status: bool = ..., error: _Optional[str] = ..., embeddings: _Optional[_Iterable[_Union[Embedding, _Mapping]]] = ...) -> None: ...
+    timings_ms: _containers.ScalarMap[str, float]
+    def __init__(self, status: bool = ..., error: _Optional[str] = ..., embeddings: _Optional[_Iterable[_Union[Embedding, _Mapping]]] = ..., timings_ms: _Optional[_Mapping[str, float]] = ...) -> None: ...
+
+class TextStreamEmbeddingRequest(_message.Message):
+    __slots__ = ("request_id", "request")
+    REQUEST_ID_FIELD_NUMBER: _ClassVar[int]
+    REQUEST_FIELD_NUMBER: _ClassVar[int]
+    request_id: str
+    request: TextEmbeddingRequest
+    def __init__(self, request_id: _Optional[str] = ..., request: _Optional[_Union[TextEmbeddingRequest, _Mapping]] = ...) -> None: ...
+
+class TextStreamEmbeddingResponse(_message.Message):
+    __slots__ = ("request_id", "response")
+    REQUEST_ID_FIELD_NUMBER: _ClassVar[int]
+    RESPONSE_FIELD_NUMBER: _ClassVar[int]
+    request_id: str
+    response: TextEmbeddingResponse
+    def __init__(self, request_id: _Optional[str] = ..., response: _Optional[_Union[TextEmbeddingResponse, _Mapping]] = ...) -> None: ...
 
 class TextRerankScoresRequest(_message.Message):
-    __slots__ = ("query", "target_topic", "corpus", "normalize")
+    __slots__ = ("query", "target_topic", "corpus", "normalize", "priority", "return_timings", "top_k")
     QUERY_FIELD_NUMBER: _ClassVar[int]
     TARGET_TOPIC_FIELD_NUMBER: _ClassVar[int]
     CORPUS_FIELD_NUMBER: _ClassVar[int]
     NORMALIZE_FIELD_NUMBER: _ClassVar[int]
+    PRIORITY_FIELD_NUMBER: _ClassVar[int]
+    RETURN_TIMINGS_FIELD_NUMBER: _ClassVar[int]
+    TOP_K_FIELD_NUMBER: _ClassVar[int]
     query: str
     target_topic: str
     corpus: _containers.RepeatedScalarFieldContainer[str]
     normalize: bool
-    def __init__(self, query: _Optional[str] = ..., target_topic: _Optional[str] = ..., corpus: _Optional[_Iterable[str]] = ..., normalize: bool = ...) -> None: ...
+    priority: Priority
+    return_timings: bool
+    top_k: int
+    def __init__(self, query: _Optional[str] = ..., target_topic: _Optional[str] = ..., corpus: _Optional[_Iterable[str]] = ..., normalize: bool = ..., priority: _Optional[_Union[Priority, str]] = ..., return_timings: bool = ..., top_k: _Optional[int] = ...) -> None: ...
+
+class RerankHit(_message.Message):
+    __slots__ = ("index", "score")
+    INDEX_FIELD_NUMBER: _ClassVar[int]
+    SCORE_FIELD_NUMBER: _ClassVar[int]
+    index: int
+    score: float
+    def __init__(self, index: _Optional[int] = ..., score: _Optional[float] = ...) -> None: ...
 
 class TextRerankScoresResponse(_message.Message):
-    __slots__ = ("status", "error", "scores")
+    __slots__ = ("status", "error", "scores", "timings_ms", "hits")
+    class TimingsMsEntry(_message.Message):
+        __slots__ = ("key", "value")
+        KEY_FIELD_NUMBER: _ClassVar[int]
+        VALUE_FIELD_NUMBER: _ClassVar[int]
+        key: str
+        value: float
+        def __init__(self, key: _Optional[str] = ..., value: _Optional[float] = ...) -> None: ...
     STATUS_FIELD_NUMBER: _ClassVar[int]
     ERROR_FIELD_NUMBER: _ClassVar[int]
     SCORES_FIELD_NUMBER: _ClassVar[int]
+    TIMINGS_MS_FIELD_NUMBER: _ClassVar[int]
+    HITS_FIELD_NUMBER: _ClassVar[int]
     status: bool
     error: str
     scores: _containers.RepeatedScalarFieldContainer[float]
-    def __init__(self, status: bool = ..., error: _Optional[str] = ..., scores: _Optional[_Iterable[float]] = ...) -> None: ...
+    timings_ms: _containers.ScalarMap[str, float]
+    hits: _containers.RepeatedCompositeFieldContainer[RerankHit]
+    def __init__(self, status: bool = ..., error: _Optional[str] = ..., scores: _Optional[_Iterable[float]] = ..., timings_ms: _Optional[_Mapping[str, float]] = ..., hits: _Optional[_Iterable[_Union[RerankHit, _Mapping]]] = ...) -> None: ...
+
+class RerankGroup(_message.Message):
+    __slots__ = ("query", "corpus")
+    QUERY_FIELD_NUMBER: _ClassVar[int]
+    CORPUS_FIELD_NUMBER: _ClassVar[int]
+    query: str
+    corpus: _containers.RepeatedScalarFieldContainer[str]
+    def __init__(self, query: _Optional[str] = ..., corpus: _Optional[_Iterable[str]] = ...) -> None: ...
+
+class RerankScores(_message.Message):
+    __slots__ = ("scores", "hits")
+    SCORES_FIELD_NUMBER: _ClassVar[int]
+    HITS_FIELD_NUMBER: _ClassVar[int]
+    scores: _containers.RepeatedScalarFieldContainer[float]
+    hits: _containers.RepeatedCompositeFieldContainer[RerankHit]
+    def __init__(self, scores: _Optional[_Iterable[float]] = ..., hits: _Optional[_Iterable[_Union[RerankHit, _Mapping]]] = ...) -> None: ...
+
+class TextBatchRerankScoresRequest(_message.Message):
+    __slots__ = ("target_topic", "groups", "normalize", "priority", "return_timings", "top_k")
+    TARGET_TOPIC_FIELD_NUMBER: _ClassVar[int]
+    GROUPS_FIELD_NUMBER: _ClassVar[int]
+    NORMALIZE_FIELD_NUMBER: _ClassVar[int]
+    PRIORITY_FIELD_NUMBER: _ClassVar[int]
+    RETURN_TIMINGS_FIELD_NUMBER: _ClassVar[int]
+    TOP_K_FIELD_NUMBER: _ClassVar[int]
+    target_topic: str
+    groups: _containers.RepeatedCompositeFieldContainer[RerankGroup]
+    normalize: bool
+    priority: Priority
+    return_timings: bool
+    top_k: int
+    def __init__(self, target_topic: _Optional[str] = ..., groups: _Optional[_Iterable[_Union[RerankGroup, _Mapping]]] = ..., normalize: bool = ..., priority: _Optional[_Union[Priority, str]] = ..., return_timings: bool = ..., top_k: _Optional[int] = ...) -> None: ...
+
+class TextBatchRerankScoresResponse(_message.Message):
+    __slots__ = ("status", "error", "results", "timings_ms")
+    class TimingsMsEntry(_message.Message):
+        __slots__ = ("key", "value")
+        KEY_FIELD_NUMBER: _ClassVar[int]
+        VALUE_FIELD_NUMBER: _ClassVar[int]
+        key: str
+        value: float
+        def __init__(self, key: _Optional[str] = ..., value: _Optional[float] = ...) -> None: ...
+    STATUS_FIELD_NUMBER: _ClassVar[int]
+    ERROR_FIELD_NUMBER: _ClassVar[int]
+    RESULTS_FIELD_NUMBER: _ClassVar[int]
+    TIMINGS_MS_FIELD_NUMBER: _ClassVar[int]
+    status: bool
+    error: str
+    results: _containers.RepeatedCompositeFieldContainer[RerankScores]
+    timings_ms: _containers.ScalarMap[str, float]
+    def __init__(self, status: bool = ..., error: _Optional[str] = ..., results: _Optional[_Iterable[_Union[RerankScores, _Mapping]]] = ..., timings_ms: _Optional[_Mapping[str, float]] = ...) -> None: ...
@@ -54,6 +54,21 @@ class TextEmbeddingStub(object):
                 request_serializer=strategies__pb2.TextRerankScoresRequest.SerializeToString,
                 response_deserializer=strategies__pb2.TextRerankScoresResponse.FromString,
                 _registered_method=True)
+        self.getTextBatchRerankScores = channel.unary_unary(
+                '/TextSemanticEmbedding.TextEmbedding/getTextBatchRerankScores',
+                request_serializer=strategies__pb2.TextBatchRerankScoresRequest.SerializeToString,
+                response_deserializer=strategies__pb2.TextBatchRerankScoresResponse.FromString,
+                _registered_method=True)
+        self.streamTextEmbeddings = channel.stream_stream(
+                '/TextSemanticEmbedding.TextEmbedding/streamTextEmbeddings',
+                request_serializer=strategies__pb2.TextStreamEmbeddingRequest.SerializeToString,
+                response_deserializer=strategies__pb2.TextStreamEmbeddingResponse.FromString,
+                _registered_method=True)
+        self.streamTextBatchEmbedding = channel.unary_stream(
+                '/TextSemanticEmbedding.TextEmbedding/streamTextBatchEmbedding',
+                request_serializer=strategies__pb2.TextBatchEmbeddingRequest.SerializeToString,
+                response_deserializer=strategies__pb2.TextStreamEmbeddingResponse.FromString,
+                _registered_method=True)
 
 
 class TextEmbeddingServicer(object):
@@ -77,6 +92,24 @@ class TextEmbeddingServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def getTextBatchRerankScores(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def streamTextEmbeddings(self, request_iterator, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def streamTextBatchEmbedding(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
 
 def add_TextEmbeddingServicer_to_server(servicer, server):
     rpc_method_handlers = {
@@ -95,6 +128,21 @@ def add_TextEmbeddingServicer_to_server(servicer, server):
                     request_deserializer=strategies__pb2.TextRerankScoresRequest.FromString,
                     response_serializer=strategies__pb2.TextRerankScoresResponse.SerializeToString,
             ),
+            'getTextBatchRerankScores': grpc.unary_unary_rpc_method_handler(
+                    servicer.getTextBatchRerankScores,
+                    request_deserializer=strategies__pb2.TextBatchRerankScoresRequest.FromString,
+                    response_serializer=strategies__pb2.TextBatchRerankScoresResponse.SerializeToString,
+            ),
+            'streamTextEmbeddings': grpc.stream_stream_rpc_method_handler(
+                    servicer.streamTextEmbeddings,
+                    request_deserializer=strategies__pb2.TextStreamEmbeddingRequest.FromString,
+                    response_serializer=strategies__pb2.TextStreamEmbeddingResponse.SerializeToString,
+            ),
+            'streamTextBatchEmbedding': grpc.unary_stream_rpc_method_handler(
+                    servicer.streamTextBatchEmbedding,
+                    request_deserializer=strategies__pb2.TextBatchEmbeddingRequest.FromString,
+                    response_serializer=strategies__pb2.TextStreamEmbeddingResponse.SerializeToString,
+            ),
     }
     generic_handler = grpc.method_handlers_generic_handler(
             'TextSemanticEmbedding.TextEmbedding', rpc_method_handlers)
@@ -186,3 +234,84 @@ class TextEmbedding(object):
             timeout,
             metadata,
             _registered_method=True)
+
+    @staticmethod
+    def getTextBatchRerankScores(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/TextSemanticEmbedding.TextEmbedding/getTextBatchRerankScores',
+            strategies__pb2.TextBatchRerankScoresRequest.SerializeToString,
+            strategies__pb2.TextBatchRerankScoresResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def streamTextEmbeddings(request_iterator,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.stream_stream(
+            request_iterator,
+            target,
+            '/TextSemanticEmbedding.TextEmbedding/streamTextEmbeddings',
+            strategies__pb2.TextStreamEmbeddingRequest.SerializeToString,
+            strategies__pb2.TextStreamEmbeddingResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def streamTextBatchEmbedding(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_stream(
+            request,
+            target,
+            '/TextSemanticEmbedding.TextEmbedding/streamTextBatchEmbedding',
+            strategies__pb2.TextBatchEmbeddingRequest.SerializeToString,
+            strategies__pb2.TextStreamEmbeddingResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
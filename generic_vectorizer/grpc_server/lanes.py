@@ -0,0 +1,64 @@
+import asyncio
+
+from collections import deque
+from typing import Deque, Dict
+
+from generic_vectorizer.typing import Job
+
+class PriorityLaneQueue:
+    def __init__(self, lane2weight:Dict[int, int], default_lane:int):
+        assert default_lane in lane2weight, f'{default_lane} must be one of the lanes'
+        self.lane2weight = lane2weight
+        self.default_lane = default_lane
+        self.lane2jobs:Dict[int, Deque[Job]] = { lane: deque() for lane in lane2weight }
+        self.lane2credit:Dict[int, int] = { lane: 0 for lane in lane2weight }
+        self.not_empty = asyncio.Event()
+        self.size = 0
+
+    def qsize(self) -> int:
+        return self.size
+
+    def empty(self) -> bool:
+        return self.size == 0
+
+    def lane_sizes(self) -> Dict[int, int]:
+        return { lane: len(jobs) for lane, jobs in self.lane2jobs.items() }
+
+    def put_nowait(self, job:Job) -> None:
+        lane = job.priority if job.priority in self.lane2jobs else self.default_lane
+        job.priority = lane  # the router reports the lane the job was actually queued in
+        self.lane2jobs[lane].append(job)
+        self.size += 1
+        self.not_empty.set()
+
+    async def put(self, job:Job) -> None:
+        self.put_nowait(job)
+
+    def get_nowait(self) -> Job:
+        if self.size == 0:
+            raise asyncio.QueueEmpty()
+
+        # smooth weighted round robin over the non empty lanes : interactive jobs jump ahead, bulk jobs keep their share
+        total_weight = 0
+        selected_lane = None
+        for lane, jobs in self.lane2jobs.items():
+            if len(jobs) == 0:
+                continue
+            self.lane2credit[lane] += self.lane2weight[lane]
+            total_weight += self.lane2weight[lane]
+            if selected_lane is None or self.lane2credit[lane] > self.lane2credit[selected_lane]:
+                selected_lane = lane
+        self.lane2credit[selected_lane] -= total_weight
+
+        job = self.lane2jobs[selected_lane].popleft()
+        if len(self.lane2jobs[selected_lane]) == 0:
+            self.lane2credit[selected_lane] = 0
+        self.size -= 1
+        if self.size == 0:
+            self.not_empty.clear()
+        return job
+
+    async def get(self) -> Job:
+        while self.size == 0:
+            await self.not_empty.wait()
+        return self.get_nowait()
@@ -0,0 +1,141 @@
+import asyncio
+import numpy as np
+
+from bisect import bisect_left
+from collections import deque
+from typing import Deque, Dict, List, Tuple, Callable, Optional, Sequence
+
+from generic_vectorizer.log import logger
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+class LatencyWindow:
+    def __init__(self, max_samples:int=4096):
+        self.samples:Deque[float] = deque(maxlen=max_samples)
+        self.count = 0
+
+    def observe(self, duration:float) -> None:
+        self.samples.append(duration)
+        self.count += 1
+
+    def percentiles(self) -> Dict[str, float]:
+        if len(self.samples) == 0:
+            return {'count': 0, 'p50_ms': 0.0, 'p99_ms': 0.0}
+        p50, p99 = np.percentile(np.asarray(self.samples) * 1000, [50, 99])
+        return {'count': self.count, 'p50_ms': round(float(p50), 3), 'p99_ms': round(float(p99), 3)}
+
+class ExponentialAverage:
+    def __init__(self, alpha:float=0.2):
+        self.alpha = alpha
+        self.value:Optional[float] = None
+
+    def observe(self, value:float) -> None:
+        if self.value is None:
+            self.value = value
+        else:
+            self.value = self.alpha * value + (1 - self.alpha) * self.value
+
+class MetricsRegistry:
+    LATENCY_BUCKETS:Tuple[float, ...] = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+    SIZE_BUCKETS:Tuple[float, ...] = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512)
+
+    def __init__(self):
+        self.name2type:Dict[str, str] = {}
+        self.name2help:Dict[str, str] = {}
+        self.name2buckets:Dict[str, Sequence[float]] = {}
+        self.name2values:Dict[str, Dict[LabelKey, float]] = {}
+        self.name2histograms:Dict[str, Dict[LabelKey, List[float]]] = {}  # bucket counts followed by sum and count
+        self.collectors:List[Callable[['MetricsRegistry'], None]] = []
+
+    def describe(self, name:str, metric_type:str, help:str, buckets:Optional[Sequence[float]]=None) -> None:
+        assert metric_type in ('counter', 'gauge', 'histogram'), f'{metric_type} is not a valid metric type'
+        self.name2type[name] = metric_type
+        self.name2help[name] = help
+        if metric_type == 'histogram':
+            self.name2buckets[name] = buckets or MetricsRegistry.LATENCY_BUCKETS
+            self.name2histograms.setdefault(name, {})
+        else:
+            self.name2values.setdefault(name, {})
+
+    def _label_key(self, labels:Optional[Dict[str, str]]) -> LabelKey:
+        return tuple(sorted((labels or {}).items()))
+
+    def inc(self, name:str, labels:Optional[Dict[str, str]]=None, value:float=1.0) -> None:
+        if name not in self.name2type:  # metrics reported by the workers are counters unless described otherwise
+            self.describe(name, 'counter', name.replace('_', ' '))
+        values = self.name2values[name]
+        label_key = self._label_key(labels)
+        values[label_key] = values.get(label_key, 0.0) + value
+
+    def set(self, name:str, labels:Optional[Dict[str, str]]=None, value:float=0.0) -> None:
+        self.name2values[name][self._label_key(labels)] = value
+
+    def observe(self, name:str, labels:Optional[Dict[str, str]]=None, value:float=0.0) -> None:
+        buckets = self.name2buckets[name]
+        histogram = self.name2histograms[name].setdefault(self._label_key(labels), [0.0] * (len(buckets) + 2))
+        position = bisect_left(buckets, value)
+        if position < len(buckets):
+            histogram[position] += 1
+        histogram[-2] += value
+        histogram[-1] += 1
+
+    def add_collector(self, collector:Callable[['MetricsRegistry'], None]) -> None:
+        # collectors refresh the values that are cheaper to read at scrape time (queue depth, cache stats...)
+        self.collectors.append(collector)
+
+    def _format_labels(self, label_key:LabelKey, extra_label:Optional[Tuple[str, str]]=None) -> str:
+        items = list(label_key) + ([extra_label] if extra_label is not None else [])
+        if len(items) == 0:
+            return ''
+        escaped = [ (key, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')) for key, value in items ]
+        return '{' + ','.join(f'{key}="{value}"' for key, value in escaped) + '}'
+
+    def render(self) -> str:
+        for collector in self.collectors:
+            try:
+                collector(self)
+            except Exception as e:
+                logger.warning(e)
+
+        lines:List[str] = []
+        for name, metric_type in self.name2type.items():
+            lines.append(f'# HELP {name} {self.name2help[name]}')
+            lines.append(f'# TYPE {name} {metric_type}')
+            if metric_type != 'histogram':
+                for label_key, value in self.name2values[name].items():
+                    lines.append(f'{name}{self._format_labels(label_key)} {value:g}')
+                continue
+            buckets = self.name2buckets[name]
+            for label_key, histogram in self.name2histograms[name].items():
+                cumulative = 0.0
+                for bucket, count in zip(buckets, histogram):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{self._format_labels(label_key, ("le", f"{bucket:g}"))} {cumulative:g}')
+                lines.append(f'{name}_bucket{self._format_labels(label_key, ("le", "+Inf"))} {histogram[-1]:g}')
+                lines.append(f'{name}_sum{self._format_labels(label_key)} {histogram[-2]:g}')
+                lines.append(f'{name}_count{self._format_labels(label_key)} {histogram[-1]:g}')
+        return '\n'.join(lines) + '\n'
+
+async def start_metrics_server(registry:MetricsRegistry, metrics_address:str) -> asyncio.AbstractServer:
+    host, port = metrics_address.rsplit(':', 1)
+
+    async def handle_connection(reader:asyncio.StreamReader, writer:asyncio.StreamWriter) -> None:
+        try:
+            request_line = await reader.readline()
+            while (await reader.readline()) not in (b'\r\n', b'\n', b''):  # headers are ignored
+                pass
+            method, path, *_ = request_line.decode().split(' ') + ['', '']
+            if method == 'GET' and path.split('?')[0] == '/metrics':
+                status, content_type, body = '200 OK', 'text/plain; version=0.0.4; charset=utf-8', registry.render().encode()
+            else:
+                status, content_type, body = '404 Not Found', 'text/plain; charset=utf-8', b'not found\n'
+            writer.write(f'HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n'.encode() + body)
+            await writer.drain()
+        except Exception as e:
+            logger.warning(e)
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle_connection, host=host.strip('[]') or None, port=int(port))
+    logger.info(f'metrics are exposed on http://{metrics_address}/metrics')
+    return server
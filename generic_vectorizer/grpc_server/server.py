@@ -1,3 +1,5 @@
+import json 
+import struct 
 import asyncio 
 import grpc 
 
@@ -6,42 +8,106 @@ import zmq.asyncio as aiozmq
 
 from hashlib import sha256
 
-from generic_vectorizer.grpc_server.interfaces import strategies_pb2_grpc
+from generic_vectorizer.grpc_server.interfaces import strategies_pb2, strategies_pb2_grpc
 from generic_vectorizer.grpc_server.servicer.text_embedding import TextEmbeddingServicer
+from generic_vectorizer.grpc_server.servicer.broker_client import BrokerClientPool
+from generic_vectorizer.grpc_server.cache import EmbeddingCache
+from generic_vectorizer.grpc_server.metrics import LatencyWindow, ExponentialAverage, MetricsRegistry, start_metrics_server
+from generic_vectorizer.grpc_server.admission import AdmissionController
+from generic_vectorizer.grpc_server.lanes import PriorityLaneQueue
 
 from generic_vectorizer.log import logger 
+from generic_vectorizer.tracing import Trace, OTLPFileExporter
 
-from generic_vectorizer.typing import EmbedderModelConfig
+from generic_vectorizer.typing import EmbedderModelConfig, EmbeddingCacheConfig, TracingConfig, Job
 
-from typing import List, Dict, Tuple 
+from typing import List, Dict, Set, Tuple, Union, Optional, Deque 
 from typing_extensions import Self 
 
 from time import time 
+from collections import deque
 
 class GRPCServer:
     _CLIENT2BORKER_ADDR:str='inproc://client2broker'
     _BROKER2ROUTER_ADDR:str='inproc://broker2router'
+    LANE2NAME:Dict[int, str] = { lane: name.lower() for name, lane in strategies_pb2.Priority.items() }
 
-    def __init__(self, max_concurrent_requests:int=512, request_timeout:int=30):
+    def __init__(self, max_concurrent_requests:int=512, request_timeout:int=30, embedding_cache_config:Optional[EmbeddingCacheConfig]=None, broker_pool_size:int=4, direct_response_routing:bool=True, metrics_address:Optional[str]=None, tracing_config:Optional[TracingConfig]=None):
         self.max_concurrent_requests = max_concurrent_requests 
+        self.broker_pool_size = broker_pool_size
+        self.direct_response_routing = direct_response_routing
         self.request_timeout = request_timeout
-        self.topic2queue_hmap:Dict[str, asyncio.Queue] = {}
+        self.embedding_cache_config = embedding_cache_config
+        self.tracing_config = tracing_config
+        self.topic2queue_hmap:Dict[str, PriorityLaneQueue] = {}
+        self.topic2queue_latency:Dict[str, Dict[str, LatencyWindow]] = {}  # topic => lane => latency
+        self.topic2service_time:Dict[str, ExponentialAverage] = {}
+        self.topic2nb_workers:Dict[str, int] = {}  # connected workers, changes with restarts and autoscaling
+        self.topic2dropped:Dict[str, int] = {}
+        self.client_id2pending_job:Dict[bytes, Job] = {}
+        self.metrics_address = metrics_address
+        self.metrics = MetricsRegistry()
+        self.metrics.describe('vectorizer_queue_depth', 'gauge', 'jobs waiting in the topic queue')
+        self.metrics.describe('vectorizer_queue_latency_seconds', 'histogram', 'time spent by a job in the topic queue')
+        self.metrics.describe('vectorizer_workers', 'gauge', 'background workers by state')
+        self.metrics.describe('vectorizer_batch_size', 'histogram', 'jobs per dispatched batch', buckets=MetricsRegistry.SIZE_BUCKETS)
+        self.metrics.describe('vectorizer_batch_duration_seconds', 'histogram', 'time between the dispatch of a batch and the worker handshake')
+        self.metrics.describe('vectorizer_worker_encode_seconds', 'histogram', 'model time spent by a worker on a batch')
+        self.metrics.describe('vectorizer_worker_jobs_total', 'counter', 'jobs processed by the workers')
+        self.metrics.describe('vectorizer_worker_skipped_jobs_total', 'counter', 'jobs skipped by the workers because their deadline expired')
+        self.metrics.describe('vectorizer_worker_failed_jobs_total', 'counter', 'jobs answered with an error by the workers')
+        self.metrics.describe('vectorizer_worker_crashes_total', 'counter', 'worker processes that died and were restarted by the supervisor')
+        self.metrics.describe('vectorizer_dropped_jobs_total', 'counter', 'jobs expired or cancelled before dispatch')
+        self.metrics.describe('vectorizer_invalid_topic_requests_total', 'counter', 'requests targeting an unknown topic')
+        self.metrics.describe('vectorizer_malformed_messages_total', 'counter', 'client or router messages the broker could not parse')
+        self.metrics.describe('vectorizer_admission_rejections_total', 'counter', 'requests rejected by the admission control')
 
     async def __aenter__(self) -> Self:
         self.ctx = aiozmq.Context()
-        self.ctx.set(zmq.MAX_SOCKETS, self.max_concurrent_requests)
-        self.shared_semaphore = asyncio.Semaphore(int(0.7 * self.max_concurrent_requests))
+        self.embedding_cache:Optional[EmbeddingCache] = None
+        if self.embedding_cache_config is not None:
+            self.embedding_cache = EmbeddingCache(self.embedding_cache_config)
+        self.trace_exporter:Optional[OTLPFileExporter] = None
+        if self.tracing_config is not None and self.tracing_config.export_path is not None:
+            self.trace_exporter = OTLPFileExporter(self.tracing_config.export_path)
         return self 
     
     async def __aexit__(self, exc_type, exc_value, traceback) -> None:
         if exc_type is not None:
             logger.error(exc_value)
             logger.exception(traceback)
+        if self.embedding_cache is not None:
+            self.embedding_cache.close()
+        if self.trace_exporter is not None:
+            self.trace_exporter.close()
         self.ctx.term()
     
     async def listen(self, embedder_model_configs:List[EmbedderModelConfig], grpc_server_address:str, grace:int=5) -> None:  
+        async with BrokerClientPool(self.ctx, GRPCServer._CLIENT2BORKER_ADDR, self.broker_pool_size) as broker_client:
+            await self._serve(embedder_model_configs, grpc_server_address, broker_client, grace)
+
+    async def _serve(self, embedder_model_configs:List[EmbedderModelConfig], grpc_server_address:str, broker_client:BrokerClientPool, grace:int) -> None:
         server = grpc.aio.server()
-        text_embedding_servicer = TextEmbeddingServicer(ctx=self.ctx, client2broker_addr=GRPCServer._CLIENT2BORKER_ADDR, shared_semaphore=self.shared_semaphore)  #inproc 
+        for cfg in embedder_model_configs:
+            self.topic2queue_hmap[cfg.target_topic] = PriorityLaneQueue(
+                lane2weight={strategies_pb2.Priority.INTERACTIVE: cfg.interactive_weight, strategies_pb2.Priority.BULK: 1},
+                default_lane=strategies_pb2.Priority.BULK
+            )
+        self.admission = AdmissionController(embedder_model_configs, self.max_concurrent_requests, self.topic2queue_hmap, self.topic2service_time, self.topic2nb_workers)
+        metrics_server:Optional[asyncio.AbstractServer] = None
+        if self.metrics_address is not None:
+            self.metrics.add_collector(self.collect_metrics)
+            metrics_server = await start_metrics_server(self.metrics, self.metrics_address)
+        topic2fingerprint = { cfg.target_topic: self.fingerprint(cfg) for cfg in embedder_model_configs }
+        text_embedding_servicer = TextEmbeddingServicer(
+            broker_client=broker_client,  # few long lived dealer sockets multiplexed by correlation id
+            admission=self.admission, 
+            request_timeout=self.request_timeout, 
+            cache=self.embedding_cache, 
+            topic2fingerprint=topic2fingerprint,
+            trace_exporter=self.trace_exporter,
+            trace_sample_ratio=self.tracing_config.sample_ratio if self.tracing_config is not None else 1.0
+        )
         strategies_pb2_grpc.add_TextEmbeddingServicer_to_server(
             servicer=text_embedding_servicer,
             server=server
@@ -49,17 +115,21 @@ class GRPCServer:
         server.add_insecure_port(address=grpc_server_address)
         await server.start()
         
+        client2broker_router_socket:aiozmq.Socket = self.ctx.socket(socket_type=zmq.ROUTER)
+        client2broker_router_socket.bind(addr=GRPCServer._CLIENT2BORKER_ADDR)
         exchange_task = asyncio.create_task(
-            self.broker(GRPCServer._CLIENT2BORKER_ADDR, GRPCServer._BROKER2ROUTER_ADDR)
+            self.broker(client2broker_router_socket, GRPCServer._BROKER2ROUTER_ADDR)
         ) 
         
         proxies:List[asyncio.Task] = []
         for cfg in embedder_model_configs:
-            self.topic2queue_hmap[cfg.target_topic] = asyncio.Queue()
             router2worker_addr = cfg.zmq_tcp_address or f'ipc:///tmp/router2worker_{cfg.target_topic}.ipc'  
             proxies.append(
                 asyncio.create_task(
-                    self.router(cfg.target_topic, GRPCServer._BROKER2ROUTER_ADDR, router2worker_addr)
+                    self.router(
+                        cfg, GRPCServer._BROKER2ROUTER_ADDR, router2worker_addr, 
+                        client2broker_router_socket if self.direct_response_routing else None
+                    )
                 )
             )
         
@@ -74,101 +144,328 @@ class GRPCServer:
             await server.stop(grace=grace)
         except asyncio.CancelledError:
             pass 
+
+        if metrics_server is not None:
+            metrics_server.close()
     
-    async def broker(self, client2broker_addr:str, broker2router_addr:str):
-        client2broker_router_socket:aiozmq.Socket = self.ctx.socket(socket_type=zmq.ROUTER)
-        broker2router_puller_socket:aiozmq.Socket = self.ctx.socket(socket_type=zmq.PULL)
+    def collect_metrics(self, metrics:MetricsRegistry) -> None:
+        # values that are cheaper to read at scrape time than to maintain on the hot path
+        for topic, target_queue in self.topic2queue_hmap.items():
+            for lane, queue_depth in target_queue.lane_sizes().items():
+                metrics.set('vectorizer_queue_depth', {'topic': topic, 'lane': GRPCServer.LANE2NAME[lane]}, queue_depth)
+        for topic, topic_stats in self.admission.stats().items():
+            metrics.set('vectorizer_admission_rejections_total', {'topic': topic}, topic_stats['rejections'])
+        if self.embedding_cache is not None:
+            for key, value in self.embedding_cache.stats().items():
+                is_gauge = key in ('entries', 'memory_bytes', 'disk_bytes', 'pending_writes')
+                name = f'vectorizer_embedding_cache_{key}' if is_gauge else f'vectorizer_embedding_cache_{key}_total'
+                if name not in metrics.name2type:
+                    metrics.describe(name, 'gauge' if is_gauge else 'counter', f'grpc server embedding cache {key}')
+                metrics.set(name, None, value)
+
+    def fingerprint(self, config:EmbedderModelConfig) -> str:
+        # cached embeddings must be invalidated as soon as the model behind a topic changes 
+        serialized_config = json.dumps({'embedder_model_type': config.embedder_model_type.value, 'options': config.options}, sort_keys=True, default=str)
+        return sha256(serialized_config.encode()).hexdigest()
 
-        client2broker_router_socket.bind(addr=client2broker_addr)
+    async def broker(self, client2broker_router_socket:aiozmq.Socket, broker2router_addr:str):
+        broker2router_puller_socket:aiozmq.Socket = self.ctx.socket(socket_type=zmq.PULL)
         broker2router_puller_socket.bind(addr=broker2router_addr)
 
         poller = aiozmq.Poller()
         poller.register(client2broker_router_socket, zmq.POLLIN)
         poller.register(broker2router_puller_socket, zmq.POLLIN)
 
+        marker = time()
         while True:
             try:
                 socket_hmap:Dict[zmq.Socket, int] = dict(await poller.poll(timeout=1000))    
+                if self.embedding_cache is not None and time() - marker > self.embedding_cache.config.log_interval:
+                    logger.info(f'grpc server embedding cache : {self.embedding_cache.stats()}')
+                    marker = time()
+
                 if socket_hmap.get(client2broker_router_socket, None) == zmq.POLLIN:
-                    incoming_req:Tuple[bytes, bytes, bytes, bytes, bytes] = await client2broker_router_socket.recv_multipart()
-                    source_client_id, _, encoded_topic, encoded_task_type, encoded_client_message = incoming_req
-                    target_queue = self.topic2queue_hmap.get(encoded_topic.decode(), None)
-                    if target_queue is None:
-                        await client2broker_router_socket.send_multipart([
-                            source_client_id, b'', 'INTERNAL-ERROR:{} is not a valid topic'.format(encoded_topic.decode()).encode()
-                        ])
-                    else:
-                        await target_queue.put((source_client_id, encoded_task_type, encoded_client_message))
+                    incoming_req:List[bytes] = await client2broker_router_socket.recv_multipart()
+                    try:
+                        await self.handle_client_request(client2broker_router_socket, incoming_req)
+                    except Exception as e:  # a malformed client message must not stop the broker, every pending request would hang
+                        self.metrics.inc('vectorizer_malformed_messages_total', {'source': 'client'})
+                        logger.error(f'grpc server broker failed to handle a client message of {len(incoming_req)} frame(s) : {e}')
+                        if len(incoming_req) >= 3:  # the envelope is readable : fail the request now instead of at its deadline
+                            source_socket_id, _, correlation_id, *_ = incoming_req
+                            await client2broker_router_socket.send_multipart([source_socket_id, b'', correlation_id, b'', f'INTERNAL-ERROR:malformed request : {e}'.encode()])
 
                 if socket_hmap.get(broker2router_puller_socket, None) == zmq.POLLIN:
-                    target_client_id, encoded_worker_message = await broker2router_puller_socket.recv_pyobj()
-                    await client2broker_router_socket.send_multipart([target_client_id, b'', encoded_worker_message])
+                    incoming_res:List[zmq.Frame] = await broker2router_puller_socket.recv_multipart(copy=False)
+                    try:
+                        target_client_id, encoded_trace, encoded_worker_message = incoming_res
+                        await self.send_response(client2broker_router_socket, target_client_id.bytes, encoded_trace, encoded_worker_message)
+                    except Exception as e:
+                        self.metrics.inc('vectorizer_malformed_messages_total', {'source': 'router'})
+                        logger.error(f'grpc server broker failed to handle a router message of {len(incoming_res)} frame(s) : {e}')
 
             except asyncio.CancelledError:
                 break 
+            except zmq.ContextTerminated:  # the sockets are gone, nothing left to serve
+                break
             except Exception as e:
-                logger.warning(e)
-                break 
+                logger.error(f'grpc server broker : {e}')
         
 
         client2broker_router_socket.close(linger=0)
         broker2router_puller_socket.close(linger=0)
  
     
-    async def router(self, topic:str, broker2router_addr:str, router2worker_addr:str):
+    async def handle_client_request(self, client2broker_router_socket:aiozmq.Socket, incoming_req:List[bytes]) -> None:
+        source_socket_id, _, correlation_id, *incoming_frames = incoming_req
+        if incoming_frames == [b'CANCEL']:  # the client gave up, the job is dropped by its router if still queued
+            cancelled_job = self.client_id2pending_job.pop(source_socket_id + correlation_id, None)
+            if cancelled_job is not None:
+                cancelled_job.cancelled = True
+            return
+
+        encoded_topic, encoded_task_type, encoded_deadline, encoded_priority, encoded_trace, encoded_client_message = incoming_frames
+        target_queue = self.topic2queue_hmap.get(encoded_topic.decode(), None)
+        if target_queue is None:
+            self.metrics.inc('vectorizer_invalid_topic_requests_total')
+            await client2broker_router_socket.send_multipart([
+                source_socket_id, b'', correlation_id, b'', 'INTERNAL-ERROR:{} is not a valid topic'.format(encoded_topic.decode()).encode()
+            ])
+            return
+
+        # the client id travels as an opaque frame : routing id of the pooled socket + fixed size correlation id
+        job = Job(
+            source_socket_id + correlation_id, encoded_task_type, encoded_client_message, 
+            deadline=struct.unpack('>d', encoded_deadline)[0], enqueued_at=time(), priority=encoded_priority[0], trace=encoded_trace
+        )
+        self.client_id2pending_job[job.client_id] = job
+        await target_queue.put(job)
+
+    def split_client_id(self, client_id:bytes) -> Tuple[bytes, bytes]:
+        return client_id[:-BrokerClientPool.CORRELATION_ID_SIZE], client_id[-BrokerClientPool.CORRELATION_ID_SIZE:]
+
+    async def send_response(self, client2broker_router_socket:aiozmq.Socket, target_client_id:bytes, encoded_trace:zmq.Frame, encoded_worker_message:zmq.Frame) -> None:
+        target_socket_id, correlation_id = self.split_client_id(target_client_id)
+        await client2broker_router_socket.send_multipart([target_socket_id, b'', correlation_id, encoded_trace, encoded_worker_message], copy=False)
+
+    async def collect_batch(self, target_queue:PriorityLaneQueue, max_batch_size:int, max_batch_wait_ms:int) -> List[Job]:
+        jobs:List[Job] = [await target_queue.get()]
+        deadline = time() + max_batch_wait_ms / 1000
+        while len(jobs) < max_batch_size:
+            if not target_queue.empty():
+                jobs.append(target_queue.get_nowait())
+                continue
+            remaining = deadline - time()
+            if remaining <= 0:
+                break
+            try:
+                jobs.append(await asyncio.wait_for(target_queue.get(), timeout=remaining))
+            except asyncio.TimeoutError:
+                break
+        return jobs
+
+    def observe_worker_metrics(self, topic_labels:Dict[str, str], worker_metrics:Dict) -> None:
+        if worker_metrics.get('encode_seconds') is not None:
+            self.metrics.observe('vectorizer_worker_encode_seconds', topic_labels, worker_metrics['encode_seconds'])
+        for key in ('jobs', 'skipped_jobs', 'failed_jobs'):
+            self.metrics.inc(f'vectorizer_worker_{key}_total', topic_labels, worker_metrics.get(key, 0))
+        for key, value in worker_metrics.get('stats', {}).items():  # strategy specific counters : encoded tokens, chunk cache...
+            self.metrics.inc(f'vectorizer_worker_{key}_total', topic_labels, value)
+
+    async def router(self, config:EmbedderModelConfig, broker2router_addr:str, router2worker_addr:str, client2broker_router_socket:Optional[aiozmq.Socket]=None):
+        topic = config.target_topic
+        target_queue = self.topic2queue_hmap.get(topic, None)
+        assert target_queue is not None, f'{topic} must have a queue...!'
+        lane2queue_latency = self.topic2queue_latency.setdefault(topic, {})
+        service_time = self.topic2service_time.setdefault(topic, ExponentialAverage())
+
         broker2router_pusher_socket:aiozmq.Socket = self.ctx.socket(socket_type=zmq.PUSH)
         router2worker_router_socket:aiozmq.Socket = self.ctx.socket(socket_type=zmq.ROUTER)
 
         broker2router_pusher_socket.connect(addr=broker2router_addr)
+        router2worker_router_socket.setsockopt(zmq.ROUTER_HANDOVER, 1)  # a restarted worker takes over the identity of the dead one
         router2worker_router_socket.bind(addr=router2worker_addr)
 
-        poller = aiozmq.Poller()
-        poller.register(router2worker_router_socket, zmq.POLLIN)
+        idle_worker_ids:Deque[bytes] = deque()
+        worker2dispatched_at:Dict[bytes, float] = {}
+        worker2pending_client_ids:Dict[bytes, Set[bytes]] = {}  # clients of the dispatched batch still waiting for their response
+        retiring_worker_ids:Set[bytes] = set()  # retired by the autoscaler, they leave after their current batch
+        busy_seconds = 0.0  # cumulated batch time of the finished batches, the autoscaler derives the utilisation from it
+        worker_ready = asyncio.Event()
+        topic_labels = {'topic': topic}
 
-        worker_ids:List[bytes] = []
-        marker = time()
-        while True:
-            try:
-                socket_hmap:Dict[zmq.Socket, int] = dict(await poller.poll(timeout=1000))
-                duration = time() - marker 
-                if duration > 5:
-                    logger.info(f'grpc server topic : {topic} is running with {len(worker_ids)} background transformer workers')
-                    marker = time()
+        def update_worker_states() -> None:
+            self.metrics.set('vectorizer_workers', {**topic_labels, 'state': 'idle'}, len(idle_worker_ids))
+            self.metrics.set('vectorizer_workers', {**topic_labels, 'state': 'busy'}, len(worker2dispatched_at))
+            self.topic2nb_workers[topic] = len(idle_worker_ids) + len(worker2dispatched_at)
 
-                target_queue = self.topic2queue_hmap.get(topic, None)
-                assert target_queue is not None, f'{topic} must have a queue...!'    
-                if not target_queue.empty() and len(worker_ids) > 0:
-                    target_worker_id = worker_ids.pop(0)
-                    source_client_id, encoded_task_type, encoded_client_message = await target_queue.get()
-                    await router2worker_router_socket.send_multipart(
-                     [target_worker_id, b'', source_client_id, encoded_task_type, encoded_client_message]
-                 )
-                    
-                if socket_hmap.get(router2worker_router_socket, None) == zmq.POLLIN:
-                    incoming_res = await router2worker_router_socket.recv_multipart()
-                    source_worker_id, _, encoded_worker_signal, target_client_id, encoded_worker_message = incoming_res
-                    
-                    if encoded_worker_signal == b'HANDSHAKE':
-                        worker_ids.append(source_worker_id) 
-                        continue
-
-                    if encoded_worker_signal == b'RESPONSE':
-                        await broker2router_pusher_socket.send_pyobj((target_client_id, encoded_worker_message))
-                         
-            except asyncio.CancelledError:
-                logger.info(f'grpc server topic : {topic} cancelled')
-                break 
-            except Exception as e:
-                logger.error(e)
-                break 
+        async def forward_response(target_client_id:Union[bytes, zmq.Frame], encoded_trace:Union[bytes, zmq.Frame], encoded_worker_message:Union[bytes, zmq.Frame]) -> None:
+            # the embedding payload is forwarded as a zmq frame, it is never copied nor pickled
+            if client2broker_router_socket is not None:
+                target_client_id = target_client_id.bytes if isinstance(target_client_id, zmq.Frame) else target_client_id
+                await self.send_response(client2broker_router_socket, target_client_id, encoded_trace, encoded_worker_message)
+            else:
+                await broker2router_pusher_socket.send_multipart([target_client_id, encoded_trace, encoded_worker_message], copy=False)
+
+        async def handle_worker_message(incoming_res:List[zmq.Frame]) -> None:
+            nonlocal busy_seconds
+            source_worker_id, _, encoded_worker_signal, *worker_frames = incoming_res
+
+            if encoded_worker_signal.bytes == b'HANDSHAKE':
+                dispatched_at = worker2dispatched_at.pop(source_worker_id.bytes, None)
+                worker2pending_client_ids.pop(source_worker_id.bytes, None)
+                if dispatched_at is not None:  # the worker is done with its batch
+                    busy_seconds += time() - dispatched_at
+                    service_time.observe(time() - dispatched_at)
+                    self.metrics.observe('vectorizer_batch_duration_seconds', topic_labels, time() - dispatched_at)
+                if source_worker_id.bytes in retiring_worker_ids:
+                    await retire_worker(source_worker_id.bytes)
+                    return
+                if source_worker_id.bytes not in idle_worker_ids:
+                    idle_worker_ids.append(source_worker_id.bytes) 
+                update_worker_states()
+                worker_ready.set()
+                return
+
+            if encoded_worker_signal.bytes == b'WORKER-DEAD':  # sent by the supervisor, before the worker is restarted
+                dead_worker_id, encoded_report = worker_frames
+                await handle_dead_worker(dead_worker_id.bytes, json.loads(encoded_report.bytes))
+                return
+
+            if encoded_worker_signal.bytes == b'LOAD-REPORT':  # polled by the autoscaler
+                now = time()
+                load_report = {
+                    'queue_depth': target_queue.qsize(),
+                    'idle': len(idle_worker_ids),
+                    'busy': len(worker2dispatched_at),
+                    'busy_seconds': busy_seconds + sum(now - dispatched_at for dispatched_at in worker2dispatched_at.values())
+                }
+                await router2worker_router_socket.send_multipart([source_worker_id, b'', b'LOAD-REPORT', json.dumps(load_report).encode()])
+                return
+
+            if encoded_worker_signal.bytes == b'RETIRE':  # sent by the autoscaler, the worker leaves once its current batch is answered
+                retiring_worker_id = worker_frames[0].bytes
+                retiring_worker_ids.add(retiring_worker_id)
+                if retiring_worker_id in idle_worker_ids:
+                    await retire_worker(retiring_worker_id)
+                return
+
+            if encoded_worker_signal.bytes == b'METRICS':
+                self.observe_worker_metrics(topic_labels, json.loads(worker_frames[-1].bytes))
+                return
+
+            if encoded_worker_signal.bytes == b'RESPONSE':
+                target_client_id, encoded_trace, encoded_worker_message = worker_frames
+                worker2pending_client_ids.get(source_worker_id.bytes, set()).discard(target_client_id.bytes)
+                await forward_response(target_client_id, encoded_trace, encoded_worker_message)
+
+        async def retire_worker(retiring_worker_id:bytes) -> None:
+            retiring_worker_ids.discard(retiring_worker_id)
+            if retiring_worker_id in idle_worker_ids:
+                idle_worker_ids.remove(retiring_worker_id)
+            if len(idle_worker_ids) == 0:
+                worker_ready.clear()
+            update_worker_states()
+            await router2worker_router_socket.send_multipart([retiring_worker_id, b'', b'RETIRE'])
+            logger.info(f'grpc server topic : {topic} retired {retiring_worker_id.decode(errors="replace")}')
+
+        async def handle_dead_worker(dead_worker_id:bytes, report:Dict) -> None:
+            retiring_worker_ids.discard(dead_worker_id)
+            if dead_worker_id in idle_worker_ids:
+                idle_worker_ids.remove(dead_worker_id)
+            if len(idle_worker_ids) == 0:
+                worker_ready.clear()
+            worker2dispatched_at.pop(dead_worker_id, None)
+            pending_client_ids = worker2pending_client_ids.pop(dead_worker_id, set())
+            update_worker_states()
+            self.metrics.inc('vectorizer_worker_crashes_total', topic_labels)
+            logger.warning(f'grpc server topic : {topic} lost {dead_worker_id.decode(errors="replace")} (exitcode : {report.get("exitcode")}, restarts : {report.get("restarts")}), failing {len(pending_client_ids)} in-flight job(s)')
+            # in-flight jobs are failed rather than retried : the request may be the one that killed the worker
+            for client_id in pending_client_ids:
+                await forward_response(client_id, b'', f'INTERNAL-ERROR:worker {dead_worker_id.decode(errors="replace")} died while processing the request'.encode())
+
+        async def consume_worker_messages() -> None:
+            while True:
+                incoming_res:List[zmq.Frame] = await router2worker_router_socket.recv_multipart(copy=False)
+                try:
+                    await handle_worker_message(incoming_res)
+                except Exception as e:  # a malformed message must not take the whole topic down
+                    logger.error(f'grpc server topic : {topic} failed to handle a worker message of {len(incoming_res)} frame(s) : {e}')
+
+        async def dispatch_batch(collected_jobs:List[Job]) -> None:
+            while len(idle_worker_ids) == 0:  # the idle worker may have died while the batch was collected
+                worker_ready.clear()
+                await worker_ready.wait()
+            dispatched_at = time()
+            jobs:List[Job] = []
+            for job in collected_jobs:
+                self.client_id2pending_job.pop(job.client_id, None)
+                if job.expired(dispatched_at):  # expired or cancelled while queued
+                    self.topic2dropped[topic] = self.topic2dropped.get(topic, 0) + 1
+                    self.metrics.inc('vectorizer_dropped_jobs_total', topic_labels)
+                    continue
+                lane = GRPCServer.LANE2NAME.get(job.priority, str(job.priority))
+                lane2queue_latency.setdefault(lane, LatencyWindow()).observe(dispatched_at - job.enqueued_at)
+                self.metrics.observe('vectorizer_queue_latency_seconds', {**topic_labels, 'lane': lane}, dispatched_at - job.enqueued_at)
+                job.trace = Trace.annotate(job.trace, marks={'enqueued': job.enqueued_at, 'dispatched': dispatched_at})
+                jobs.append(job)
+            if len(jobs) == 0:
+                return
+            job_frames = [ frame for job in jobs for frame in job.to_frames() ]
+            target_worker_id = idle_worker_ids.popleft()
+            if len(idle_worker_ids) == 0:
+                worker_ready.clear()
+            worker2dispatched_at[target_worker_id] = dispatched_at
+            worker2pending_client_ids[target_worker_id] = { job.client_id for job in jobs }
+            update_worker_states()
+            self.metrics.observe('vectorizer_batch_size', topic_labels, len(jobs))
+            await router2worker_router_socket.send_multipart([target_worker_id, b'', b'PROCESS'] + job_frames)
+
+        async def dispatch_jobs() -> None:
+            # wakes up as soon as a worker is idle and a job is queued, drains the queue while idle workers remain
+            while True:
+                await worker_ready.wait()
+                collected_jobs = await self.collect_batch(target_queue, config.max_batch_size, config.max_batch_wait_ms)
+                try:
+                    await dispatch_batch(collected_jobs)
+                except Exception as e:
+                    # fail the batch fast instead of letting its clients wait for their deadline
+                    logger.error(f'grpc server topic : {topic} failed to dispatch {len(collected_jobs)} job(s) : {e}')
+                    for job in collected_jobs:
+                        try:
+                            await forward_response(job.client_id, b'', f'INTERNAL-ERROR:{e}'.encode())
+                        except Exception as forward_error:
+                            logger.warning(forward_error)
+
+        async def report_state() -> None:
+            while True:
+                await asyncio.sleep(5)
+                try:
+                    lane2percentiles = { lane: queue_latency.percentiles() for lane, queue_latency in lane2queue_latency.items() }
+                    logger.info(f'grpc server topic : {topic} is running with {len(idle_worker_ids)} idle background transformer workers, queue latency : {lane2percentiles}, dropped jobs : {self.topic2dropped.get(topic, 0)}')
+                except Exception as e:
+                    logger.warning(e)
+
+        tasks = [ asyncio.create_task(coroutine) for coroutine in (consume_worker_messages(), dispatch_jobs(), report_state()) ]
+        try:
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+            for task in done:
+                if task.exception() is not None:
+                    logger.error(task.exception())
+        except asyncio.CancelledError:
+            logger.info(f'grpc server topic : {topic} cancelled')
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
         
         broker2router_pusher_socket.close(linger=0)
         router2worker_router_socket.close(linger=0)
 
 
-def run_grpc_server(grpc_server_address:str, embedder_model_configs:List[EmbedderModelConfig], max_concurrent_requests:int, request_timeout:int, grace:int=5):
+def run_grpc_server(grpc_server_address:str, embedder_model_configs:List[EmbedderModelConfig], max_concurrent_requests:int, request_timeout:int, embedding_cache_config:Optional[EmbeddingCacheConfig]=None, metrics_address:Optional[str]=None, tracing_config:Optional[TracingConfig]=None, grace:int=5):
     async def main():
-        async with GRPCServer(max_concurrent_requests=max_concurrent_requests, request_timeout=request_timeout) as server:
+        async with GRPCServer(max_concurrent_requests=max_concurrent_requests, request_timeout=request_timeout, embedding_cache_config=embedding_cache_config, metrics_address=metrics_address, tracing_config=tracing_config) as server:
             await server.listen(
                 embedder_model_configs=embedder_model_configs,
                 grpc_server_address=grpc_server_address,
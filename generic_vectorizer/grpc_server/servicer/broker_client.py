@@ -0,0 +1,78 @@
+import struct
+import asyncio
+
+import zmq
+import zmq.asyncio as aiozmq
+
+from time import time
+from itertools import count
+from typing import List, Dict, Optional
+
+from generic_vectorizer.log import logger
+from generic_vectorizer.tracing import Trace
+
+class BrokerClientPool:
+    CORRELATION_ID_SIZE:int=8
+
+    def __init__(self, ctx:aiozmq.Context, client2broker_addr:str, pool_size:int=4):
+        assert pool_size > 0, f'pool_size must be greater than 0'
+        self.ctx = ctx
+        self.client2broker_addr = client2broker_addr
+        self.pool_size = pool_size
+        self.dealer_sockets:List[aiozmq.Socket] = []
+        self.reader_tasks:List[asyncio.Task] = []
+        self.pending_futures:Dict[bytes, asyncio.Future] = {}
+        self.counter = count()
+
+    async def __aenter__(self) -> 'BrokerClientPool':
+        for _ in range(self.pool_size):
+            dealer_socket:aiozmq.Socket = self.ctx.socket(socket_type=zmq.DEALER)
+            dealer_socket.connect(addr=self.client2broker_addr)
+            self.dealer_sockets.append(dealer_socket)
+            self.reader_tasks.append(asyncio.create_task(self._dispatch_responses(dealer_socket)))
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback) -> None:
+        for reader_task in self.reader_tasks:
+            reader_task.cancel()
+        await asyncio.gather(*self.reader_tasks, return_exceptions=True)
+        for dealer_socket in self.dealer_sockets:
+            dealer_socket.close(linger=0)
+        for future in self.pending_futures.values():
+            if not future.done():
+                future.set_exception(ConnectionError('broker client pool was closed'))
+        self.pending_futures.clear()
+
+    async def _dispatch_responses(self, dealer_socket:aiozmq.Socket) -> None:
+        while True:
+            try:
+                _, correlation_id, encoded_trace, encoded_res = await dealer_socket.recv_multipart()
+                future = self.pending_futures.pop(correlation_id, None)
+                if future is not None and not future.done():
+                    future.set_result((encoded_trace, encoded_res))
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.warning(e)
+
+    async def request(self, target_topic:str, task_type:bytes, encoded_req:bytes, deadline:float=0.0, priority:int=0, trace:Optional[Trace]=None) -> bytes:
+        sequence_number = next(self.counter)
+        correlation_id = sequence_number.to_bytes(BrokerClientPool.CORRELATION_ID_SIZE, byteorder='big')
+        future = asyncio.get_running_loop().create_future()
+        self.pending_futures[correlation_id] = future
+        dealer_socket = self.dealer_sockets[sequence_number % self.pool_size]
+        try:
+            encoded_trace = trace.encode() if trace is not None else b''
+            await dealer_socket.send_multipart([b'', correlation_id, target_topic.encode(), task_type, struct.pack('>d', deadline), bytes([priority]), encoded_trace, encoded_req])
+            timeout = deadline - time() if deadline > 0 else None
+            encoded_trace, encoded_res = await asyncio.wait_for(future, timeout=timeout)
+            if trace is not None:  # stages recorded by the router and the worker travel back with the response
+                trace.merge(encoded_trace)
+                trace.mark('response_received')
+            return encoded_res
+        except (asyncio.CancelledError, asyncio.TimeoutError):
+            # the job may still be queued, tell the broker to drop it
+            await dealer_socket.send_multipart([b'', correlation_id, b'CANCEL'])
+            raise
+        finally:
+            self.pending_futures.pop(correlation_id, None)
@@ -1,108 +1,309 @@
+import asyncio
 
-
-import asyncio 
-
-import zmq 
-import zmq.asyncio as aiozmq 
+from random import random
 
 from grpc import ServicerContext, StatusCode
-from typing import List, Tuple, Dict, Optional, AsyncGenerator
+from time import time
+from typing import List, Tuple, Dict, Optional, Set, Union, AsyncGenerator, AsyncIterator
 
 from generic_vectorizer.grpc_server.interfaces import strategies_pb2, strategies_pb2_grpc
+from generic_vectorizer.grpc_server.cache import EmbeddingCache
+from generic_vectorizer.grpc_server.servicer.broker_client import BrokerClientPool
+from generic_vectorizer.grpc_server.admission import AdmissionController, AdmissionRejected
 
-from generic_vectorizer.log import logger 
-from contextlib import asynccontextmanager
+from generic_vectorizer.log import logger
+from generic_vectorizer.tracing import Trace, OTLPFileExporter
+from contextlib import asynccontextmanager, AsyncExitStack
 
 class TextEmbeddingServicer(strategies_pb2_grpc.TextEmbeddingServicer):
-    def __init__(self, ctx:aiozmq.Context, client2broker_addr:str, shared_semaphore:asyncio.Semaphore):
-        self.ctx = ctx  
-        self.cleint2broker_addr = client2broker_addr
-        self.shared_semaphore = shared_semaphore
-    
-    async def _wait_socket_response_in_loop(self, dealer_socket:aiozmq.Socket) -> bytes:
-        while True:
-            try:
-                incoming_signal = await dealer_socket.poll(timeout=100)
-                if incoming_signal != zmq.POLLIN:
-                    continue
-                _, encoded_incoming_res = await dealer_socket.recv_multipart()
-                return encoded_incoming_res 
-            except asyncio.CancelledError:
-                break 
-        
+    def __init__(self, broker_client:BrokerClientPool, admission:AdmissionController, request_timeout:float=30, cache:Optional[EmbeddingCache]=None, topic2fingerprint:Optional[Dict[str, str]]=None, trace_exporter:Optional[OTLPFileExporter]=None, trace_sample_ratio:float=1.0):
+        self.broker_client = broker_client
+        self.admission = admission
+        self.request_timeout = request_timeout
+        self.cache = cache
+        self.topic2fingerprint = topic2fingerprint or {}
+        self.trace_exporter = trace_exporter
+        self.trace_sample_ratio = trace_sample_ratio
+
+    def _deadline(self, context:ServicerContext) -> float:
+        timeout = self.request_timeout
+        time_remaining = context.time_remaining()  # None when the client did not set a deadline
+        if time_remaining is not None:
+            timeout = min(timeout, time_remaining)
+        return time() + timeout
+
+    def _priority(self, requested_priority:int, default_priority:int) -> int:
+        # interactive by default for single requests, bulk for batches
+        # proto3 enums are open : unknown values coming from newer or broken clients fall back to the default lane
+        if requested_priority not in (strategies_pb2.Priority.INTERACTIVE, strategies_pb2.Priority.BULK):
+            return default_priority
+        return requested_priority
+
+    def _start_trace(self, name:str, return_timings:bool, context:ServicerContext) -> Optional[Trace]:
+        # untraced requests carry an empty trace frame, nothing is allocated nor encoded for them
+        if self.trace_exporter is None and not return_timings:
+            return None
+        traceparent = next((value for key, value in context.invocation_metadata() or () if key == 'traceparent'), None)
+        trace = Trace.from_traceparent(name, traceparent)
+        if trace is None:
+            trace = Trace(name, sampled=random() < self.trace_sample_ratio)
+        if not return_timings and not trace.sampled:
+            return None
+        return trace
+
+    def _finish_trace(self, trace:Optional[Trace], plain_res:Union[strategies_pb2.TextEmbeddingResponse, strategies_pb2.TextBatchEmbeddingResponse, strategies_pb2.TextRerankScoresResponse, strategies_pb2.TextBatchRerankScoresResponse], target_topic:str, return_timings:bool) -> None:
+        if trace is None:
+            return
+        trace.mark('done')
+        if return_timings:
+            plain_res.timings_ms.update(trace.timings_ms())
+        if self.trace_exporter is not None and trace.sampled:
+            self.trace_exporter.export(trace, {'target_topic': target_topic, 'status': str(plain_res.status)})
+
+    async def _request_broker(self, target_topic:str, task_type:bytes, encoded_req:bytes, deadline:float, priority:int, trace:Optional[Trace]=None) -> bytes:
+        if trace is not None:
+            trace.mark('admitted')
+        encoded_res = await self.broker_client.request(target_topic, task_type, encoded_req, deadline, priority, trace)
+        if encoded_res.startswith(b'DEADLINE-EXCEEDED:'):
+            raise asyncio.TimeoutError(encoded_res.decode())
+        return encoded_res
+
     @asynccontextmanager
-    async def _create_socket(self, addr:str) -> AsyncGenerator[aiozmq.Socket, None]:
-        dealer_socket:aiozmq.Socket = self.ctx.socket(socket_type=zmq.DEALER)
-        caught_exc:Optional[Exception] = None 
+    async def _admit(self, target_topic:str, context:ServicerContext) -> AsyncGenerator[None, None]:
+        async with AsyncExitStack() as exit_stack:
+            try:
+                await exit_stack.enter_async_context(self.admission.admit(target_topic))
+            except AdmissionRejected as e:
+                logger.warning(e)
+                await context.abort(code=StatusCode.RESOURCE_EXHAUSTED, details=str(e))
+            yield
+
+    async def _forward(self, target_topic:str, task_type:bytes, encoded_req:bytes, priority:int, context:ServicerContext, trace:Optional[Trace]=None) -> bytes:
         try:
-            dealer_socket.connect(addr=addr)
-            yield dealer_socket
+            encoded_res = await self._request_broker(target_topic, task_type, encoded_req, self._deadline(context), priority, trace)
+        except asyncio.TimeoutError:
+            logger.warning(f'{target_topic} request has exceeded its deadline')
+            await context.abort(code=StatusCode.DEADLINE_EXCEEDED, details=f'{target_topic} request has exceeded its deadline')
         except Exception as e:
-            caught_exc = e
-            logger.error(e)
-        finally:
-            dealer_socket.close(linger=0)
+            logger.warning(e)
+            await context.abort(code=StatusCode.INTERNAL, details=str(e))
+        return encoded_res
+
+    def _cache_key(self, request:strategies_pb2.TextBatchEmbeddingRequest, text:str) -> bytes:
+        return EmbeddingCache.make_key(
+            topic=request.target_topic,
+            fingerprint=self.topic2fingerprint.get(request.target_topic, ''),
+            options=[str(request.chunk_size), str(request.return_dense), str(request.return_sparse), str(request.dense_encoding), str(request.sparse_format), str(request.sparse_pooling), str(request.dense_aggregation)],
+            text=text
+        )
 
-        if caught_exc is not None:
-            raise caught_exc
-    
     async def getTextRerankScores(self, request:strategies_pb2.TextRerankScoresRequest, context:ServicerContext):
-        async with self.shared_semaphore:
-            try:
-                async with self._create_socket(addr=self.cleint2broker_addr) as dealer_socket:
-                    encoded_req = request.SerializeToString()
-                    await dealer_socket.send_multipart([b'', request.target_topic.encode(), b'', encoded_req])
-                    encoded_res = await self._wait_socket_response_in_loop(dealer_socket=dealer_socket)
-            except Exception as e:
-                logger.warning(e)
-                await context.abort(code=StatusCode.INTERNAL, details=str(e))
-            
-            if encoded_res.startswith(b'INTERNAL-ERROR:'):
-                return strategies_pb2.TextRerankScoresResponse(
-                    status=False,
-                    error=encoded_res.decode()
-                )
+        trace = self._start_trace('getTextRerankScores', request.return_timings, context)
+        async with self._admit(request.target_topic, context):
+            encoded_res = await self._forward(request.target_topic, b'', request.SerializeToString(), self._priority(request.priority, strategies_pb2.Priority.INTERACTIVE), context, trace)
 
+        if encoded_res.startswith(b'INTERNAL-ERROR:'):
+            plain_res = strategies_pb2.TextRerankScoresResponse(
+                status=False,
+                error=encoded_res.decode()
+            )
+        else:
             plain_res = strategies_pb2.TextRerankScoresResponse()
             plain_res.ParseFromString(encoded_res)
 
-            return plain_res
-        
+        self._finish_trace(trace, plain_res, request.target_topic, request.return_timings)
+        return plain_res
+
+    async def getTextBatchRerankScores(self, request:strategies_pb2.TextBatchRerankScoresRequest, context:ServicerContext):
+        # every (query, candidates) group travels in a single job, the worker scores them with one model call
+        trace = self._start_trace('getTextBatchRerankScores', request.return_timings, context)
+        async with self._admit(request.target_topic, context):
+            encoded_res = await self._forward(request.target_topic, b'RERANK_BATCH', request.SerializeToString(), self._priority(request.priority, strategies_pb2.Priority.INTERACTIVE), context, trace)
+
+        if encoded_res.startswith(b'INTERNAL-ERROR:'):
+            plain_res = strategies_pb2.TextBatchRerankScoresResponse(
+                status=False,
+                error=encoded_res.decode()
+            )
+        else:
+            plain_res = strategies_pb2.TextBatchRerankScoresResponse()
+            plain_res.ParseFromString(encoded_res)
+
+        self._finish_trace(trace, plain_res, request.target_topic, request.return_timings)
+        return plain_res
+
+    async def _lookup_text_embedding(self, request:strategies_pb2.TextEmbeddingRequest) -> Tuple[Optional[bytes], Optional[strategies_pb2.TextEmbeddingResponse]]:
+        if self.cache is None or request.bypass_cache:
+            return None, None
+        cache_key = self._cache_key(request, request.text)
+        encoded_embedding = (await self.cache.get_many([cache_key])).get(cache_key, None)
+        if encoded_embedding is None:
+            return cache_key, None
+        embedding = strategies_pb2.Embedding()
+        embedding.ParseFromString(encoded_embedding)
+        return cache_key, strategies_pb2.TextEmbeddingResponse(status=True, embedding=embedding)
+
+    def _parse_text_embedding(self, encoded_res:bytes, cache_key:Optional[bytes]) -> strategies_pb2.TextEmbeddingResponse:
+        if encoded_res.startswith(b'INTERNAL-ERROR:'):
+            return strategies_pb2.TextEmbeddingResponse(
+                status=False,
+                error=encoded_res.decode()
+            )
+
+        plain_res = strategies_pb2.TextEmbeddingResponse()
+        plain_res.ParseFromString(encoded_res)
+        if cache_key is not None and plain_res.status:
+            self.cache.put(cache_key, plain_res.embedding.SerializeToString())
+        return plain_res
+
     async def getTextEmbedding(self, request:strategies_pb2.TextEmbeddingRequest, context:ServicerContext):
-        async with self.shared_semaphore:
+        trace = self._start_trace('getTextEmbedding', request.return_timings, context)
+        cache_key, plain_res = await self._lookup_text_embedding(request)
+        if plain_res is None:
+            async with self._admit(request.target_topic, context):
+                encoded_res = await self._forward(request.target_topic, b'TEXT', request.SerializeToString(), self._priority(request.priority, strategies_pb2.Priority.INTERACTIVE), context, trace)
+            plain_res = self._parse_text_embedding(encoded_res, cache_key)
+
+        self._finish_trace(trace, plain_res, request.target_topic, request.return_timings)
+        return plain_res
+
+    async def _stream_text_embeddings(self, request_iterator:AsyncIterator[strategies_pb2.TextStreamEmbeddingRequest], context:ServicerContext) -> AsyncGenerator[strategies_pb2.TextStreamEmbeddingResponse, None]:
+        responses:asyncio.Queue = asyncio.Queue()
+        pending_tasks:Set[asyncio.Task] = set()
+
+        async def embed(stream_request:strategies_pb2.TextStreamEmbeddingRequest, trace:Optional[Trace]) -> None:
             try:
-                async with self._create_socket(addr=self.cleint2broker_addr) as dealer_socket:
-                    encoded_req = request.SerializeToString()
-                    await dealer_socket.send_multipart([b'', request.target_topic.encode(), b'TEXT', encoded_req])
-                    encoded_res = await self._wait_socket_response_in_loop(dealer_socket=dealer_socket)
+                cache_key, plain_res = await self._lookup_text_embedding(stream_request.request)
+                if plain_res is None:
+                    encoded_res = await self._request_broker(
+                        stream_request.request.target_topic, b'TEXT', stream_request.request.SerializeToString(), 
+                        self._deadline(context), self._priority(stream_request.request.priority, strategies_pb2.Priority.INTERACTIVE), trace
+                    )
+                    plain_res = self._parse_text_embedding(encoded_res, cache_key)
+            except asyncio.CancelledError:
+                raise
+            except asyncio.TimeoutError:
+                plain_res = strategies_pb2.TextEmbeddingResponse(status=False, error='DEADLINE-EXCEEDED:request has exceeded its deadline')
             except Exception as e:
                 logger.warning(e)
-                await context.abort(code=StatusCode.INTERNAL, details=str(e))
-            
-            if encoded_res.startswith(b'INTERNAL-ERROR:'):
-                return strategies_pb2.TextEmbeddingResponse(
-                    status=False,
-                    error=encoded_res.decode()
+                plain_res = strategies_pb2.TextEmbeddingResponse(status=False, error=str(e))
+            self._finish_trace(trace, plain_res, stream_request.request.target_topic, stream_request.request.return_timings)
+            # the admission slot travels with the response, it is released once the client has read it
+            responses.put_nowait((strategies_pb2.TextStreamEmbeddingResponse(request_id=stream_request.request_id, response=plain_res), stream_request.request.target_topic))
+
+        def release_unanswered(task:asyncio.Task, target_topic:str) -> None:
+            # tasks cancelled before handing over their response still hold their slot
+            if task.cancelled() or task.exception() is not None:
+                self.admission.release(target_topic)
+
+        async def consume() -> None:
+            try:
+                async for stream_request in request_iterator:
+                    # flow control : stop reading from the client while the topic is saturated, streams are throttled instead of shed
+                    # slots are held until the response is yielded, a client that does not read its responses stops being read
+                    target_topic = stream_request.request.target_topic
+                    trace = self._start_trace('streamTextEmbeddings', stream_request.request.return_timings, context)
+                    await self.admission.acquire(target_topic)
+                    task = asyncio.create_task(embed(stream_request, trace))
+                    pending_tasks.add(task)
+                    task.add_done_callback(pending_tasks.discard)
+                    task.add_done_callback(lambda task, target_topic=target_topic: release_unanswered(task, target_topic))
+                if len(pending_tasks) > 0:
+                    await asyncio.gather(*pending_tasks, return_exceptions=True)
+            finally:
+                await responses.put(None)
+
+        consumer_task = asyncio.create_task(consume())
+        try:
+            while True:
+                item:Optional[Tuple[strategies_pb2.TextStreamEmbeddingResponse, str]] = await responses.get()
+                if item is None:
+                    break
+                stream_res, target_topic = item
+                try:
+                    yield stream_res
+                finally:
+                    self.admission.release(target_topic)
+            await consumer_task  # surface errors raised while reading the client stream
+        finally:
+            consumer_task.cancel()
+            for task in list(pending_tasks):
+                task.cancel()
+            while not responses.empty():  # responses never read by the client
+                item = responses.get_nowait()
+                if item is not None:
+                    self.admission.release(item[1])
+
+    async def streamTextEmbeddings(self, request_iterator:AsyncIterator[strategies_pb2.TextStreamEmbeddingRequest], context:ServicerContext):
+        async for stream_res in self._stream_text_embeddings(request_iterator, context):
+            yield stream_res
+
+    async def streamTextBatchEmbedding(self, request:strategies_pb2.TextBatchEmbeddingRequest, context:ServicerContext):
+        async def split_batch() -> AsyncGenerator[strategies_pb2.TextStreamEmbeddingRequest, None]:
+            for position, text in enumerate(request.texts):
+                yield strategies_pb2.TextStreamEmbeddingRequest(
+                    request_id=str(position),
+                    request=strategies_pb2.TextEmbeddingRequest(
+                        target_topic=request.target_topic,
+                        text=text,
+                        chunk_size=request.chunk_size,
+                        return_dense=request.return_dense,
+                        return_sparse=request.return_sparse,
+                        bypass_cache=request.bypass_cache,
+                        dense_encoding=request.dense_encoding,
+                        sparse_format=request.sparse_format,
+                        sparse_pooling=request.sparse_pooling,
+                        dense_aggregation=request.dense_aggregation,
+                        priority=self._priority(request.priority, strategies_pb2.Priority.BULK),
+                        return_timings=request.return_timings
+                    )
                 )
 
-            plain_res = strategies_pb2.TextEmbeddingResponse()
-            plain_res.ParseFromString(encoded_res)
+        async for stream_res in self._stream_text_embeddings(split_batch(), context):
+            yield stream_res
 
-            return plain_res
-        
     async def getTextBatchEmbedding(self, request:strategies_pb2.TextBatchEmbeddingRequest, context:ServicerContext):
-        async with self.shared_semaphore:
-            try:
-                async with self._create_socket(addr=self.cleint2broker_addr) as dealer_socket:
-                    encoded_req = request.SerializeToString()
-                    await dealer_socket.send_multipart([b'', request.target_topic.encode(), b'TEXT_BATCH', encoded_req])
-                    encoded_res = await self._wait_socket_response_in_loop(dealer_socket=dealer_socket)
-            except Exception as e:
-                logger.warning(e)
-                await context.abort(code=StatusCode.INTERNAL, details=str(e))
-            
+        trace = self._start_trace('getTextBatchEmbedding', request.return_timings, context)
+        plain_res = await self._text_batch_embedding(request, context, trace)
+        self._finish_trace(trace, plain_res, request.target_topic, request.return_timings)
+        return plain_res
+
+    async def _text_batch_embedding(self, request:strategies_pb2.TextBatchEmbeddingRequest, context:ServicerContext, trace:Optional[Trace]) -> strategies_pb2.TextBatchEmbeddingResponse:
+        embeddings:List[Optional[strategies_pb2.Embedding]] = [None] * len(request.texts)
+        missing_text2positions:Dict[str, List[int]] = {}
+        cache_keys:Dict[str, bytes] = {}
+        use_cache = self.cache is not None and not request.bypass_cache
+        if use_cache:
+            text2positions:Dict[str, List[int]] = {}
+            for position, text in enumerate(request.texts):  # duplicated texts are looked up and forwarded once
+                text2positions.setdefault(text, []).append(position)
+            cache_keys = { text: self._cache_key(request, text) for text in text2positions }
+            key2encoded_embedding = await self.cache.get_many(list(cache_keys.values()))
+            for text, positions in text2positions.items():
+                encoded_embedding = key2encoded_embedding.get(cache_keys[text], None)
+                if encoded_embedding is None:
+                    missing_text2positions[text] = positions
+                    continue
+                embedding = strategies_pb2.Embedding()
+                embedding.ParseFromString(encoded_embedding)
+                for position in positions:
+                    embeddings[position] = embedding
+
+            if len(missing_text2positions) == 0:
+                return strategies_pb2.TextBatchEmbeddingResponse(status=True, embeddings=embeddings)
+
+            forwarded_req = strategies_pb2.TextBatchEmbeddingRequest()
+            forwarded_req.CopyFrom(request)
+            del forwarded_req.texts[:]
+            forwarded_req.texts.extend(missing_text2positions.keys())
+        else:
+            forwarded_req = request
+
+        async with self._admit(request.target_topic, context):
+            encoded_res = await self._forward(request.target_topic, b'TEXT_BATCH', forwarded_req.SerializeToString(), self._priority(request.priority, strategies_pb2.Priority.BULK), context, trace)
+
             if encoded_res.startswith(b'INTERNAL-ERROR:'):
-                return strategies_pb2.TextEmbeddingResponse(
+                return strategies_pb2.TextBatchEmbeddingResponse(
                     status=False,
                     error=encoded_res.decode()
                 )
@@ -110,7 +311,12 @@ class TextEmbeddingServicer(strategies_pb2_grpc.TextEmbeddingServicer):
             plain_res = strategies_pb2.TextBatchEmbeddingResponse()
             plain_res.ParseFromString(encoded_res)
 
+        if not use_cache or not plain_res.status:
             return plain_res
-    
 
-   
\ No newline at end of file
+        for (text, positions), embedding in zip(missing_text2positions.items(), plain_res.embeddings):
+            self.cache.put(cache_keys[text], embedding.SerializeToString())
+            for position in positions:
+                embeddings[position] = embedding
+
+        return strategies_pb2.TextBatchEmbeddingResponse(status=True, embeddings=embeddings)
@@ -1,8 +1,9 @@
+import os 
 import logging 
 
 logging.basicConfig(
     format='%(asctime)s - %(filename)s - %(levelname)s - %(lineno)3d - %(message)s -',
-    level=logging.INFO
+    level=os.environ.get('GENERIC_VECTORIZER_LOG_LEVEL', 'INFO').upper()  # DEBUG brings back the per batch worker logs
 )
 
 logger = logging.getLogger(name='grpc-embedding')
\ No newline at end of file
@@ -1,2 +1,3 @@
 from .embedding.bge_m3 import BGEM3FlagModelStrategy
 from .reranker.flag_reranker import FlagRerankerStrategy
+from .stub.stub import StubStrategy
@@ -1,7 +1,8 @@
 from abc import ABC, abstractmethod 
-from typing import Any 
+from typing import Any, Dict, List, Tuple 
 
 from google.protobuf import message as _message
+from generic_vectorizer.tracing import StageTimer
 
 class ABCStrategy(ABC):
     def __int__(self):
@@ -9,4 +10,19 @@ class ABCStrategy(ABC):
         
     @abstractmethod
     def process(self, task_type:bytes, encoded_message:bytes) -> _message.Message:
-        pass 
\ No newline at end of file
+        pass 
+
+    def process_batch(self, tasks:List[Tuple[bytes, bytes]]) -> List[_message.Message]:
+        # strategies able to fuse several requests into a single model call should override this method
+        return [ self.process(task_type, encoded_message) for task_type, encoded_message in tasks ]
+
+    @property
+    def stage_timer(self) -> StageTimer:
+        # strategies wrap tokenization, model calls and post processing in stages, the worker attaches them to traced jobs
+        if '_stage_timer' not in self.__dict__:
+            self._stage_timer = StageTimer()
+        return self._stage_timer
+
+    def stats(self) -> Dict[str, int]:
+        # monotonic counters reported to the grpc server after every batch, the worker sends the deltas
+        return {}
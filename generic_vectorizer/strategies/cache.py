@@ -0,0 +1,44 @@
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+class LRUCache:
+    def __init__(self, max_size:int):
+        self.max_size = max_size
+        self.entries:OrderedDict[Hashable, Any] = OrderedDict()
+        self.counters:Dict[str, int] = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    def get(self, key:Hashable) -> Optional[Any]:
+        value = self.entries.get(key, None)
+        if value is None:
+            self.counters['misses'] += 1
+            return None
+        self.entries.move_to_end(key)
+        self.counters['hits'] += 1
+        return value
+
+    def peek(self, key:Hashable) -> Optional[Any]:
+        return self.entries.get(key, None)
+
+    def touch(self, key:Hashable) -> None:
+        # for callers that peek first and only count the entries they actually use
+        self.entries.move_to_end(key)
+        self.counters['hits'] += 1
+
+    def miss(self) -> None:
+        self.counters['misses'] += 1
+
+    def put(self, key:Hashable, value:Any) -> None:
+        if not self.enabled:
+            return
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.counters['evictions'] += 1
+
+    def stats(self) -> Dict[str, int]:
+        return {**self.counters, 'entries': len(self.entries)}
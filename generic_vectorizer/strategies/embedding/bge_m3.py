@@ -1,132 +1,310 @@
-import numpy as np 
+import re
+import numpy as np
 
 from typing import Any
 from ..abstract_strategy import ABCStrategy
+from ..cache import LRUCache
+from ..onnx_runtime import OnnxBGEM3Model
 
-from functools import reduce 
+from hashlib import sha256
 
 from FlagEmbedding import BGEM3FlagModel
 from generic_vectorizer.typing import BGEM3FlagModelConfig
 
-from generic_vectorizer.grpc_server.interfaces.strategies_pb2 import TextEmbeddingRequest, TextEmbeddingResponse, Embedding
+from generic_vectorizer.grpc_server.interfaces.strategies_pb2 import TextEmbeddingRequest, TextEmbeddingResponse, Embedding, DenseEncoding, DenseAggregation, SparseFormat
 from generic_vectorizer.grpc_server.interfaces.strategies_pb2 import TextBatchEmbeddingRequest, TextBatchEmbeddingResponse
 
-from typing import Dict, List, Tuple, Union, Callable 
+from typing import Dict, List, Tuple, Union, Callable
 from typing import Optional
 
-from generic_vectorizer.log import logger 
+from generic_vectorizer.log import logger
+from generic_vectorizer.codec import encode_dense, aggregate_dense, merge_sparse_weights, merge_sparse_arrays
 from numpy.typing import NDArray
 
 class BGEM3FlagModelStrategy(ABCStrategy):
     def __init__(self, options:Dict[str, Any]) -> None:
         config = BGEM3FlagModelConfig(**options)
-        self.model = BGEM3FlagModel(**config.model_dump())
+        if config.backend == 'onnxruntime':
+            self.model = OnnxBGEM3Model.from_config(config)
+        else:
+            self.model = BGEM3FlagModel(**config.model_kwargs())
         self.tokenizer = self.model.tokenizer
-        self.map_task2function:Dict[bytes, Callable[[bytes], Union[TextEmbeddingResponse, TextBatchEmbeddingRequest]]] = {
-            b'TEXT': self._process_text,
-            b'TEXT_BATCH': self._process_batch_texts
+        self.batch_token_budget = config.batch_token_budget
+        self.chunk_overlap = config.chunk_overlap
+        self.sentence_boundaries = config.sentence_boundaries
+        self.chunk_cache = LRUCache(max_size=config.chunk_cache_size)
+        self.counters:Dict[str, int] = {'encoded_chunks': 0, 'encoded_tokens': 0}
+        self.map_task2request:Dict[bytes, Callable[[], Union[TextEmbeddingRequest, TextBatchEmbeddingRequest]]] = {
+            b'TEXT': TextEmbeddingRequest,
+            b'TEXT_BATCH': TextBatchEmbeddingRequest
         }
 
-    def to_chunks(self, text:str, chunk_size:int) -> List[str]:
-        tokens = self.tokenizer.encode(text=text, add_special_tokens=False)
+    def _token_spans(self, text:str, token_starts:NDArray, chunk_size:int) -> List[Tuple[int, int]]:
+        nb_tokens = len(token_starts)
+        sentence_ends:NDArray = np.empty(0, dtype=np.intp)
+        if self.sentence_boundaries:
+            # a chunk may end right after a token closing a sentence, as long as it keeps at least half of its tokens
+            break_positions = [ match.end() for match in re.finditer(r'[.!?。！？]+(?=\s)|\n', text) ]
+            sentence_ends = np.unique(np.searchsorted(token_starts, break_positions, side='left'))  # number of tokens before each break
+
+        spans:List[Tuple[int, int]] = []
+        start = 0
+        while start < nb_tokens:
+            end = min(start + chunk_size, nb_tokens)
+            if end < nb_tokens and len(sentence_ends) > 0:
+                candidates = sentence_ends[(sentence_ends >= start + max(chunk_size // 2, 1)) & (sentence_ends <= end)]
+                if len(candidates) > 0:
+                    end = int(candidates[-1])
+            spans.append((start, end))
+            if end == nb_tokens:
+                break
+            start = max(end - self.chunk_overlap, start + 1)  # consecutive chunks share chunk_overlap tokens
+        return spans
+
+    def _chunk_texts(self, texts:List[str], chunk_sizes:List[int]) -> Tuple[List[str], List[int], List[int]]:
+        # one call to the fast tokenizer for all the texts, chunks are sliced from the original strings with the offset mapping : no decode
+        encodings = self.tokenizer(texts, add_special_tokens=False, return_offsets_mapping=True, return_attention_mask=False)
         accumulator:List[str] = []
-        for counter in range(0, len(tokens), chunk_size):
-            tokens_slice = tokens[counter:counter+chunk_size]
-            text_chunk = self.tokenizer.decode(token_ids=tokens_slice) 
-            accumulator.append(text_chunk)
-        
-        if len(accumulator) == 0:
-            accumulator = [text]
+        lengths:List[int] = []
+        nb_chunks:List[int] = []
+        for text, chunk_size, offset_mapping in zip(texts, chunk_sizes, encodings['offset_mapping']):
+            token_offsets = np.asarray(offset_mapping, dtype=np.intp).reshape(-1, 2)
+            spans = self._token_spans(text, token_offsets[:, 0], chunk_size)
+            if len(spans) == 0:
+                accumulator.append(text)
+                lengths.append(0)
+                nb_chunks.append(1)
+                continue
+            accumulator.extend(text[token_offsets[start, 0]:token_offsets[end - 1, 1]] for start, end in spans)
+            lengths.extend(end - start for start, end in spans)
+            nb_chunks.append(len(spans))
+        return accumulator, lengths, nb_chunks
 
+    def to_chunks(self, text:str, chunk_size:int) -> List[str]:
+        accumulator, _, _ = self._chunk_texts(texts=[text], chunk_sizes=[chunk_size])
         return accumulator
 
-    def aggregate_embeddings(self, embeddings:NDArray) -> NDArray:
-        if embeddings.shape[0] == 1:
-            return embeddings[0]
-        
-        dot_scores = embeddings @ embeddings.T 
-        embedding_norms = np.linalg.norm(embeddings, axis=1)
-        cosine_similarity_scores = dot_scores / (embedding_norms[None, :] * embedding_norms[:, None] + 1e-8)
-        node_centrality_scores = np.sum(cosine_similarity_scores, axis=1, keepdims=True)
-        text_embedding:NDArray = np.mean(node_centrality_scores * embeddings, axis=0)
-        return text_embedding
-
-    def _process_text(self, encoded_message:bytes) -> TextEmbeddingResponse:
-        try:
-            plain_message = TextEmbeddingRequest()
-            plain_message.ParseFromString(encoded_message)
-            assert plain_message.return_dense | plain_message.return_sparse == True, f'one of [return_dense or return_sparse] was not set!'
-            sentences = self.to_chunks(text=plain_message.text, chunk_size=plain_message.chunk_size)
-            embeddings_hmap:Dict = self.model.encode(sentences=sentences, return_dense=plain_message.return_dense, return_sparse=plain_message.return_sparse)
-            dense_embeddings:Optional[NDArray] = embeddings_hmap.get('dense_vecs', None)
-            
-            if dense_embeddings is not None:
-                dense_values = self.aggregate_embeddings(embeddings=dense_embeddings)
-            else:
-                dense_values = None 
+    def _pack_chunks(self, lengths:List[int]) -> List[List[int]]:
+        # longest chunks first : every sub batch is padded to its first chunk length
+        sorted_indices = sorted(range(len(lengths)), key=lambda index: lengths[index], reverse=True)
+        sub_batches:List[List[int]] = []
+        current_sub_batch:List[int] = []
+        for index in sorted_indices:
+            padded_length = lengths[current_sub_batch[0]] + 2 if len(current_sub_batch) > 0 else 0  # cls and eos tokens
+            if len(current_sub_batch) > 0 and (len(current_sub_batch) + 1) * padded_length > self.batch_token_budget:
+                sub_batches.append(current_sub_batch)
+                current_sub_batch = []
+            current_sub_batch.append(index)
+
+        if len(current_sub_batch) > 0:
+            sub_batches.append(current_sub_batch)
+        return sub_batches
+
+    def _lookup_chunks(self, chunks:List[str], return_dense:bool, return_sparse:bool) -> Tuple[List[bytes], Dict[int, Dict[str, Any]]]:
+        chunk_keys:List[bytes] = [ sha256(chunk.encode()).digest() for chunk in chunks ]
+        cached_entries:Dict[int, Dict[str, Any]] = {}
+        for index, chunk_key in enumerate(chunk_keys):
+            entry = self.chunk_cache.peek(chunk_key)
+            if entry is None or (return_dense and 'dense' not in entry) or (return_sparse and 'sparse' not in entry):
+                self.chunk_cache.miss()  # entries cached without the requested outputs are encoded again
+                continue
+            self.chunk_cache.touch(chunk_key)
+            cached_entries[index] = entry
+        return chunk_keys, cached_entries
+
+    def _encode_chunks(self, chunks:List[str], lengths:List[int], return_dense:bool, return_sparse:bool, use_cache:bool=True) -> Tuple[Optional[NDArray], Optional[List[Dict]]]:
+        chunk_keys:List[bytes] = []
+        cached_entries:Dict[int, Dict[str, Any]] = {}
+        if use_cache and self.chunk_cache.enabled:
+            chunk_keys, cached_entries = self._lookup_chunks(chunks, return_dense, return_sparse)
+        # identical chunks of a batch (shared sections, repeated texts) are encoded once and copied to their duplicates
+        chunk2index:Dict[str, int] = {}
+        duplicated_indices:Dict[int, int] = {}
+        uncached_indices:List[int] = []
+        for index, chunk in enumerate(chunks):
+            if index in cached_entries:
+                continue
+            if chunk in chunk2index:
+                duplicated_indices[index] = chunk2index[chunk]
+                continue
+            chunk2index[chunk] = index
+            uncached_indices.append(index)
 
-            lexical_weights:Optional[List[Dict]] = embeddings_hmap.get('lexical_weights', None)
-            sparse_values = None 
+        dense_embeddings:Optional[NDArray] = None
+        lexical_weights:Optional[List[Dict]] = [None] * len(chunks) if return_sparse else None
+        for packed_sub_batch in self._pack_chunks([ lengths[index] for index in uncached_indices ]):
+            sub_batch = [ uncached_indices[index] for index in packed_sub_batch ]
+            sentences = [ chunks[index] for index in sub_batch ]
+            self.counters['encoded_chunks'] += len(sentences)
+            self.counters['encoded_tokens'] += sum(lengths[index] for index in sub_batch)
+            with self.stage_timer.stage('encode'):
+                embeddings_hmap:Dict = self.model.encode(sentences=sentences, batch_size=len(sentences), return_dense=return_dense, return_sparse=return_sparse)
+            sub_dense_embeddings:Optional[NDArray] = embeddings_hmap.get('dense_vecs', None)
+            if sub_dense_embeddings is not None:
+                if dense_embeddings is None:
+                    dense_embeddings = np.empty((len(chunks), sub_dense_embeddings.shape[1]), dtype=sub_dense_embeddings.dtype)
+                dense_embeddings[sub_batch] = sub_dense_embeddings  # restore the original chunk order
+
+            sub_lexical_weights:Optional[List[Dict]] = embeddings_hmap.get('lexical_weights', None)
+            if sub_lexical_weights is not None and lexical_weights is not None:
+                for index, weights in zip(sub_batch, sub_lexical_weights):
+                    lexical_weights[index] = weights
+
+        if len(cached_entries) > 0:
+            cached_indices = list(cached_entries.keys())
+            if return_dense:
+                cached_dense_embeddings = np.stack([ cached_entries[index]['dense'] for index in cached_indices ])
+                if dense_embeddings is None:
+                    dense_embeddings = np.empty((len(chunks), cached_dense_embeddings.shape[1]), dtype=cached_dense_embeddings.dtype)
+                dense_embeddings[cached_indices] = cached_dense_embeddings
             if lexical_weights is not None:
-                sparse_values = lexical_weights
-                sparse_values = reduce(lambda acc, elm: {**acc, **elm}, sparse_values[1:], sparse_values[0])
-                sparse_values = {key:val for key,val in sparse_values.items()}  # use max scores as best key in case of dupplication
-            response = TextEmbeddingResponse(status=True, error=None, embedding=Embedding(dense_values=dense_values, sparse_values=sparse_values))        
-        except Exception as e:
-            logger.error(e)
-            response = TextEmbeddingResponse(status=False, error=str(e), embedding=Embedding(dense_values=None, sparse_values=None))    
+                for index in cached_indices:
+                    lexical_weights[index] = cached_entries[index]['sparse']
 
-        return response
+        if len(duplicated_indices) > 0:
+            if dense_embeddings is not None:
+                dense_embeddings[list(duplicated_indices.keys())] = dense_embeddings[list(duplicated_indices.values())]
+            if lexical_weights is not None:
+                for index, source_index in duplicated_indices.items():
+                    lexical_weights[index] = lexical_weights[source_index]
 
-    def _process_batch_texts(self, encoded_message:bytes) -> TextBatchEmbeddingResponse:
-        try:
-            plain_message = TextBatchEmbeddingRequest()
-            plain_message.ParseFromString(encoded_message) 
-            assert plain_message.return_dense | plain_message.return_sparse == True, f'one of [return_dense or return_sparse] was not set!'
-            accumulator:List[str] = []
-            nb_chunks:List[int] = []
-            for text in plain_message.texts:
-                sentences = self.to_chunks(text=text, chunk_size=plain_message.chunk_size) 
-                nb_chunks.append(len(sentences))
-                accumulator.extend(sentences)
-            
-            embeddings_hmap = self.model.encode(sentences=accumulator, return_dense=plain_message.return_dense, return_sparse=plain_message.return_sparse)
-            dense_embeddings:Optional[NDArray] = embeddings_hmap.get('dense_vecs', None)
-            lexical_weights:Optional[List[Dict]] = embeddings_hmap.get('lexical_weights', None)
-            text_embeddings_acc:List[Embedding] = []
-                
-            nb_embeddings = len(accumulator)
-            counter = 0
-            index = 0
-            while counter < nb_embeddings:
-                dense_values = None
+        if len(chunk_keys) > 0:
+            for index in uncached_indices:
+                entry:Dict[str, Any] = dict(self.chunk_cache.peek(chunk_keys[index]) or {})
                 if dense_embeddings is not None:
-                    embeddings_slice = dense_embeddings[counter:counter+nb_chunks[index], :]
-                    dense_values = self.aggregate_embeddings(embeddings=embeddings_slice).tolist()
-                
-                sparse_values = None 
+                    entry['dense'] = dense_embeddings[index].copy()
                 if lexical_weights is not None:
-                    sparse_values = lexical_weights[counter:counter+nb_chunks[index]]             
-                    sparse_values = reduce(lambda acc, elm: {**acc, **elm}, sparse_values[1:], sparse_values[0])
-                    sparse_values = {key:val for key,val in sparse_values.items()}
+                    entry['sparse'] = lexical_weights[index]
+                self.chunk_cache.put(chunk_keys[index], entry)
+
+        return dense_embeddings, lexical_weights
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            **self.counters,
+            'chunk_cache_hits': self.chunk_cache.counters['hits'],
+            'chunk_cache_misses': self.chunk_cache.counters['misses']
+        }
+
+    def aggregate_embeddings(self, dense_embeddings:NDArray, nb_chunks:NDArray, dense_aggregations:NDArray) -> NDArray:
+        # one vectorised pass per aggregation mode over the contiguous chunks of its texts
+        text_dense_embeddings = np.empty((len(nb_chunks), dense_embeddings.shape[1]), dtype=np.float32)
+        for dense_aggregation in np.unique(dense_aggregations).tolist():
+            text_mask = dense_aggregations == dense_aggregation
+            if np.all(text_mask):
+                text_dense_embeddings[:] = aggregate_dense(dense_embeddings, nb_chunks, dense_aggregation)
+                continue
+            chunk_mask = np.repeat(text_mask, nb_chunks)
+            text_dense_embeddings[text_mask] = aggregate_dense(dense_embeddings[chunk_mask], nb_chunks[text_mask], dense_aggregation)
+        return text_dense_embeddings
 
-                text_embeddings_acc.append(Embedding(dense_values=dense_values, sparse_values=sparse_values))
-                counter = counter + nb_chunks[index]
-                index = index + 1
-                
-            response = TextBatchEmbeddingResponse(embeddings=text_embeddings_acc, status=True, error=None)
-        except Exception as e:
-            logger.error(e)
-            response = TextEmbeddingResponse(status=False, error=str(e),embedding=Embedding(dense_values=None, sparse_values=None))    
+    def _embed_texts(self, texts:List[str], chunk_sizes:List[int], return_dense:bool, return_sparse:bool, use_cache:bool=True, dense_aggregations:Optional[List[int]]=None) -> Tuple[Optional[NDArray], Optional[List[List[Dict]]]]:
+        with self.stage_timer.stage('tokenize'):
+            accumulator, lengths, nb_chunks = self._chunk_texts(texts=texts, chunk_sizes=chunk_sizes)
 
-        return response        
+        if len(accumulator) == 0:
+            return None, None
+
+        dense_embeddings, lexical_weights = self._encode_chunks(chunks=accumulator, lengths=lengths, return_dense=return_dense, return_sparse=return_sparse, use_cache=use_cache)
+        text_dense_embeddings:Optional[NDArray] = None
+        text_sparse_values:Optional[List[List[Dict]]] = None  # chunk weights are merged per request
+        with self.stage_timer.stage('aggregate'):
+            if dense_embeddings is not None:
+                if dense_aggregations is None:
+                    dense_aggregations = [DenseAggregation.CENTRALITY_AGGREGATION] * len(nb_chunks)
+                text_dense_embeddings = self.aggregate_embeddings(dense_embeddings, np.asarray(nb_chunks), np.asarray(dense_aggregations))
+
+            if lexical_weights is not None:
+                offsets = np.cumsum([0] + nb_chunks).tolist()
+                text_sparse_values = [ lexical_weights[start:end] for start, end in zip(offsets[:-1], offsets[1:]) ]
+
+        return text_dense_embeddings, text_sparse_values
+
+    def _build_embedding(self, dense_values:Optional[NDArray], chunk_weights:Optional[List[Dict]], plain_message:Union[TextEmbeddingRequest, TextBatchEmbeddingRequest]) -> Embedding:
+        embedding = Embedding()
+        if dense_values is not None:
+            if plain_message.dense_encoding == DenseEncoding.FLOAT_LIST:
+                embedding.dense_values.extend(dense_values.tolist())
+            else:
+                embedding.dense_buffer, embedding.dense_scale = encode_dense(dense_values, plain_message.dense_encoding)
+                embedding.dense_encoding = plain_message.dense_encoding
+
+        if chunk_weights is not None:
+            if plain_message.sparse_format == SparseFormat.TOKEN_ID_ARRAYS:
+                token_ids, token_weights = merge_sparse_arrays(chunk_weights, plain_message.sparse_pooling)
+                embedding.sparse_indices.extend(token_ids.tolist())
+                embedding.sparse_weights.extend(token_weights.tolist())
+            else:
+                embedding.sparse_values.update(merge_sparse_weights(chunk_weights, plain_message.sparse_pooling))
+        return embedding
+
+    def _build_response(self, task_type:bytes, embeddings:List[Embedding]) -> Union[TextEmbeddingResponse, TextBatchEmbeddingResponse]:
+        if task_type == b'TEXT':
+            return TextEmbeddingResponse(status=True, error=None, embedding=embeddings[0])
+        return TextBatchEmbeddingResponse(embeddings=embeddings, status=True, error=None)
+
+    def _build_error_response(self, task_type:bytes, error:Exception) -> Union[TextEmbeddingResponse, TextBatchEmbeddingResponse]:
+        logger.error(error)
+        if task_type == b'TEXT':
+            return TextEmbeddingResponse(status=False, error=str(error), embedding=Embedding(dense_values=None, sparse_values=None))
+        return TextBatchEmbeddingResponse(status=False, error=str(error), embeddings=[])
+
+    def process_batch(self, tasks:List[Tuple[bytes, bytes]]) -> List[Union[TextEmbeddingResponse, TextBatchEmbeddingResponse]]:
+        responses:List[Optional[Union[TextEmbeddingResponse, TextBatchEmbeddingResponse]]] = [None] * len(tasks)
+
+        # requests sharing the same outputs are fused into a single encode call
+        groups:Dict[Tuple[bool, bool, bool], List[Tuple[int, bytes, List[str], Union[TextEmbeddingRequest, TextBatchEmbeddingRequest]]]] = {}
+        for position, (task_type, encoded_message) in enumerate(tasks):
+            try:
+                assert task_type in self.map_task2request, f'{task_type} must be one of [TEXT, TEXT_BATCH]'
+                plain_message = self.map_task2request[task_type]()
+                plain_message.ParseFromString(encoded_message)
+                assert plain_message.return_dense | plain_message.return_sparse == True, f'one of [return_dense or return_sparse] was not set!'
+                assert plain_message.dense_aggregation in DenseAggregation.values(), f'{plain_message.dense_aggregation} is not a known dense aggregation'
+                assert plain_message.chunk_size > self.chunk_overlap, f'chunk_size must be greater than the chunk overlap ({self.chunk_overlap} tokens)'
+                texts = [plain_message.text] if task_type == b'TEXT' else list(plain_message.texts)
+                group_key = (plain_message.return_dense, plain_message.return_sparse, not plain_message.bypass_cache)
+                groups.setdefault(group_key, []).append((position, task_type, texts, plain_message))
+            except Exception as e:
+                responses[position] = self._build_error_response(task_type, e)
+
+        for (return_dense, return_sparse, use_cache), members in groups.items():
+            texts:List[str] = []
+            chunk_sizes:List[int] = []
+            dense_aggregations:List[int] = []
+            for _, _, member_texts, plain_message in members:
+                texts.extend(member_texts)
+                chunk_sizes.extend([plain_message.chunk_size] * len(member_texts))
+                dense_aggregations.extend([plain_message.dense_aggregation] * len(member_texts))
+
+            try:
+                dense_embeddings, text_chunk_weights = self._embed_texts(texts=texts, chunk_sizes=chunk_sizes, return_dense=return_dense, return_sparse=return_sparse, use_cache=use_cache, dense_aggregations=dense_aggregations)
+            except Exception as e:
+                for position, task_type, _, _ in members:
+                    responses[position] = self._build_error_response(task_type, e)
+                continue
+
+            with self.stage_timer.stage('build_response'):
+                counter = 0
+                for position, task_type, member_texts, plain_message in members:
+                    embeddings = [
+                        self._build_embedding(
+                            dense_values=dense_embeddings[index] if dense_embeddings is not None else None,
+                            chunk_weights=text_chunk_weights[index] if text_chunk_weights is not None else None,
+                            plain_message=plain_message
+                        )
+                        for index in range(counter, counter + len(member_texts))
+                    ]
+                    responses[position] = self._build_response(task_type, embeddings)
+                    counter = counter + len(member_texts)
+
+        return responses
 
     def process(
-            self, 
-            task_type:bytes, 
+            self,
+            task_type:bytes,
             encoded_message: bytes
-        ) -> Union[TextEmbeddingResponse, TextBatchEmbeddingResponse]:  
+        ) -> Union[TextEmbeddingResponse, TextBatchEmbeddingResponse]:
         assert task_type in [b'TEXT', b'TEXT_BATCH'], f'{task_type} must be one of [TEXT, TEXT_BATCH]'
-        target_function = self.map_task2function[task_type]
-        response = target_function(encoded_message)
-        return response
\ No newline at end of file
+        response = self.process_batch([(task_type, encoded_message)])[0]
+        return response
@@ -0,0 +1,200 @@
+import os
+import json
+import fcntl
+import shutil
+
+import torch
+import numpy as np
+
+from hashlib import sha256
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from transformers import AutoTokenizer
+from generic_vectorizer.log import logger
+from generic_vectorizer.typing import BGEM3FlagModelConfig, FlagRerankerConfig
+
+from numpy.typing import NDArray
+
+ONNX_OPSET = 17
+ONNX_MODEL_FILENAME = 'model.onnx'
+
+def import_onnxruntime():
+    try:
+        import onnxruntime
+    except ImportError as e:
+        raise ImportError('onnxruntime is required by the onnxruntime backend : pip install generic_vectorizer[onnx]') from e
+    return onnxruntime
+
+def onnx_export_dir(onnx_cache_dir:str, kind:str, export_options:Dict[str, Any]) -> str:
+    # one export per model and per option changing the graph, delete the directory to export again
+    digest = sha256(json.dumps({'kind': kind, 'opset': ONNX_OPSET, **export_options}, sort_keys=True).encode()).hexdigest()[:16]
+    model_name = str(export_options['model_name_or_path']).strip('/').replace('/', '--')
+    return os.path.join(os.path.expanduser(onnx_cache_dir), f'{kind}-{model_name}-{digest}')
+
+def export_once(export_dir:str, export:Any) -> None:
+    # workers of a topic start together : the first one exports under the lock, the others wait and load the cached export
+    os.makedirs(os.path.dirname(export_dir), exist_ok=True)
+    with open(f'{export_dir}.lock', mode='w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        if os.path.exists(os.path.join(export_dir, ONNX_MODEL_FILENAME)):
+            return
+        logger.info(f'exporting the model to {export_dir}')
+        tmp_export_dir = f'{export_dir}.tmp-{os.getpid()}'
+        shutil.rmtree(tmp_export_dir, ignore_errors=True)
+        os.makedirs(tmp_export_dir)
+        try:
+            export(tmp_export_dir)
+            shutil.rmtree(export_dir, ignore_errors=True)  # leftovers of an interrupted export
+            os.rename(tmp_export_dir, export_dir)
+        finally:
+            shutil.rmtree(tmp_export_dir, ignore_errors=True)
+
+def export_module(module:torch.nn.Module, tokenizer:Any, sample_inputs:Any, output_names:List[str], dynamic_output_axes:Dict[str, Dict[int, str]], tmp_export_dir:str) -> None:
+    module.eval()
+    dynamic_axes = {
+        'input_ids': {0: 'batch', 1: 'sequence'},
+        'attention_mask': {0: 'batch', 1: 'sequence'},
+        **dynamic_output_axes
+    }
+    with torch.no_grad():
+        # models over 2GB (bge-m3 in fp32) are written with their weights as external data next to model.onnx
+        torch.onnx.export(
+            module, (sample_inputs['input_ids'], sample_inputs['attention_mask']), os.path.join(tmp_export_dir, ONNX_MODEL_FILENAME),
+            input_names=['input_ids', 'attention_mask'], output_names=output_names, dynamic_axes=dynamic_axes,
+            opset_version=ONNX_OPSET, do_constant_folding=True, dynamo=False
+        )
+    tokenizer.save_pretrained(tmp_export_dir)  # the cached export is self contained : no torch weights are loaded once it exists
+
+def create_session(export_dir:str, intra_op_num_threads:int, inter_op_num_threads:int, execution_provider:str):
+    onnxruntime = import_onnxruntime()
+    session_options = onnxruntime.SessionOptions()
+    session_options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+    session_options.execution_mode = onnxruntime.ExecutionMode.ORT_SEQUENTIAL
+    session_options.intra_op_num_threads = intra_op_num_threads  # 0 : one thread per physical core
+    session_options.inter_op_num_threads = inter_op_num_threads
+    return onnxruntime.InferenceSession(os.path.join(export_dir, ONNX_MODEL_FILENAME), sess_options=session_options, providers=[execution_provider])
+
+class BGEM3ExportModule(torch.nn.Module):
+    # same computation as BGEM3ForInference : pooled (normalized) dense vector and relu(sparse_linear) token weights
+    def __init__(self, inference_model:torch.nn.Module) -> None:
+        super().__init__()
+        self.inference_model = inference_model
+
+    def forward(self, input_ids:torch.Tensor, attention_mask:torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor]:
+        last_hidden_state = self.inference_model.model(input_ids=input_ids, attention_mask=attention_mask, return_dict=True).last_hidden_state
+        dense_vecs = self.inference_model.dense_embedding(last_hidden_state, attention_mask)
+        if self.inference_model.normlized:
+            dense_vecs = torch.nn.functional.normalize(dense_vecs, dim=-1)
+        token_weights = self.inference_model.sparse_embedding(last_hidden_state, input_ids, return_embedding=False)
+        return dense_vecs, token_weights.squeeze(-1)
+
+class RerankerExportModule(torch.nn.Module):
+    def __init__(self, model:torch.nn.Module) -> None:
+        super().__init__()
+        self.model = model
+
+    def forward(self, input_ids:torch.Tensor, attention_mask:torch.Tensor) -> torch.Tensor:
+        return self.model(input_ids=input_ids, attention_mask=attention_mask, return_dict=True).logits.view(-1).float()
+
+def export_bge_m3(flag_model:Any, tmp_export_dir:str) -> None:
+    sample_inputs = flag_model.tokenizer(['onnx export sample', 'a longer onnx export sample text'], padding=True, return_tensors='pt')
+    export_module(
+        BGEM3ExportModule(flag_model.model.float().cpu()), flag_model.tokenizer, sample_inputs,
+        output_names=['dense_vecs', 'token_weights'],
+        dynamic_output_axes={'dense_vecs': {0: 'batch'}, 'token_weights': {0: 'batch', 1: 'sequence'}},
+        tmp_export_dir=tmp_export_dir
+    )
+
+def export_reranker(flag_reranker:Any, tmp_export_dir:str) -> None:
+    sample_inputs = flag_reranker.tokenizer([('onnx export', 'sample passage'), ('onnx', 'a longer sample passage')], padding=True, return_tensors='pt')
+    export_module(
+        RerankerExportModule(flag_reranker.model.float().cpu()), flag_reranker.tokenizer, sample_inputs,
+        output_names=['scores'],
+        dynamic_output_axes={'scores': {0: 'batch'}},
+        tmp_export_dir=tmp_export_dir
+    )
+
+class OnnxBGEM3Model:
+    # drop-in replacement of BGEM3FlagModel.encode (dense and sparse outputs) running on onnxruntime
+    def __init__(self, export_dir:str, intra_op_num_threads:int=0, inter_op_num_threads:int=1, execution_provider:str='CPUExecutionProvider') -> None:
+        self.tokenizer = AutoTokenizer.from_pretrained(export_dir)
+        self.session = create_session(export_dir, intra_op_num_threads, inter_op_num_threads, execution_provider)
+        self.unused_token_ids = np.array([self.tokenizer.cls_token_id, self.tokenizer.eos_token_id, self.tokenizer.pad_token_id, self.tokenizer.unk_token_id])
+
+    @classmethod
+    def from_config(cls, config:BGEM3FlagModelConfig) -> 'OnnxBGEM3Model':
+        export_dir = onnx_export_dir(config.onnx_cache_dir, 'bge_m3', config.model_dump(include={'model_name_or_path', 'pooling_method'}))
+
+        def export(tmp_export_dir:str) -> None:
+            from FlagEmbedding import BGEM3FlagModel
+            export_bge_m3(BGEM3FlagModel(model_name_or_path=config.model_name_or_path, pooling_method=config.pooling_method, use_fp16=False, device='cpu'), tmp_export_dir)
+
+        export_once(export_dir, export)
+        return cls(export_dir, config.intra_op_num_threads, config.inter_op_num_threads, config.onnx_execution_provider)
+
+    def _lexical_weights(self, token_weights:NDArray, input_ids:NDArray) -> List[Dict[str, float]]:
+        # same filtering as BGEM3FlagModel : max weight per token id, special and padding tokens are dropped
+        lexical_weights:List[Dict[str, float]] = []
+        for row_weights, row_input_ids in zip(token_weights, input_ids):
+            kept_tokens = (row_weights > 0) & ~np.isin(row_input_ids, self.unused_token_ids)
+            unique_token_ids, inverse_indices = np.unique(row_input_ids[kept_tokens], return_inverse=True)
+            max_weights = np.zeros(len(unique_token_ids), dtype=np.float32)
+            np.maximum.at(max_weights, inverse_indices, row_weights[kept_tokens])
+            lexical_weights.append(dict(zip(map(str, unique_token_ids.tolist()), max_weights.tolist())))
+        return lexical_weights
+
+    def encode(self, sentences:Union[List[str], str], batch_size:int=12, max_length:int=8192, return_dense:bool=True, return_sparse:bool=False) -> Dict[str, Any]:
+        input_was_string = isinstance(sentences, str)
+        if input_was_string:
+            sentences = [sentences]
+        output_names = [ name for name, requested in [('dense_vecs', return_dense), ('token_weights', return_sparse)] if requested ]
+
+        all_dense_embeddings:List[NDArray] = []
+        all_lexical_weights:List[Dict[str, float]] = []
+        for start_index in range(0, len(sentences), batch_size):
+            batch_data = self.tokenizer(sentences[start_index:start_index + batch_size], padding=True, truncation=True, max_length=max_length, return_tensors='np')
+            input_ids = batch_data['input_ids'].astype(np.int64)
+            outputs = self.session.run(output_names, {'input_ids': input_ids, 'attention_mask': batch_data['attention_mask'].astype(np.int64)})
+            name2output = dict(zip(output_names, outputs))
+            if return_dense:
+                all_dense_embeddings.append(name2output['dense_vecs'])
+            if return_sparse:
+                all_lexical_weights.extend(self._lexical_weights(name2output['token_weights'], input_ids))
+
+        dense_embeddings:Optional[NDArray] = np.concatenate(all_dense_embeddings, axis=0) if return_dense else None
+        lexical_weights:Optional[List[Dict[str, float]]] = all_lexical_weights if return_sparse else None
+        if input_was_string:
+            dense_embeddings = dense_embeddings[0] if dense_embeddings is not None else None
+            lexical_weights = lexical_weights[0] if lexical_weights is not None else None
+        return {'dense_vecs': dense_embeddings, 'lexical_weights': lexical_weights, 'colbert_vecs': None}
+
+class OnnxReranker:
+    # drop-in replacement of FlagReranker.compute_score running on onnxruntime
+    def __init__(self, export_dir:str, intra_op_num_threads:int=0, inter_op_num_threads:int=1, execution_provider:str='CPUExecutionProvider') -> None:
+        self.tokenizer = AutoTokenizer.from_pretrained(export_dir)
+        self.session = create_session(export_dir, intra_op_num_threads, inter_op_num_threads, execution_provider)
+
+    @classmethod
+    def from_config(cls, config:FlagRerankerConfig) -> 'OnnxReranker':
+        export_dir = onnx_export_dir(config.onnx_cache_dir, 'reranker', config.model_dump(include={'model_name_or_path'}))
+
+        def export(tmp_export_dir:str) -> None:
+            from FlagEmbedding import FlagReranker
+            export_reranker(FlagReranker(model_name_or_path=config.model_name_or_path, use_fp16=False, cache_dir=config.cache_dir, device='cpu'), tmp_export_dir)
+
+        export_once(export_dir, export)
+        return cls(export_dir, config.intra_op_num_threads, config.inter_op_num_threads, config.onnx_execution_provider)
+
+    def compute_score(self, sentence_pairs:Union[List[Tuple[str, str]], Tuple[str, str]], batch_size:int=256, max_length:int=512, normalize:bool=False) -> List[float]:
+        if isinstance(sentence_pairs[0], str):
+            sentence_pairs = [sentence_pairs]
+
+        all_scores:List[float] = []
+        for start_index in range(0, len(sentence_pairs), batch_size):
+            inputs = self.tokenizer(list(sentence_pairs[start_index:start_index + batch_size]), padding=True, truncation=True, max_length=max_length, return_tensors='np')
+            scores, = self.session.run(['scores'], {'input_ids': inputs['input_ids'].astype(np.int64), 'attention_mask': inputs['attention_mask'].astype(np.int64)})
+            all_scores.extend(scores.tolist())
+
+        if normalize:
+            all_scores = [ float(1 / (1 + np.exp(-score))) for score in all_scores ]
+        return all_scores
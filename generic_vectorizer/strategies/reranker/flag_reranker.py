@@ -1,30 +1,141 @@
+import numpy as np
+
 from google.protobuf.message import Message
 from ..abstract_strategy import ABCStrategy
+from ..cache import LRUCache
+from ..onnx_runtime import OnnxReranker
+
+from hashlib import sha256
 
 from FlagEmbedding import FlagReranker
 from generic_vectorizer.typing import FlagRerankerConfig
 
 from generic_vectorizer.grpc_server.interfaces.strategies_pb2 import TextRerankScoresRequest, TextRerankScoresResponse
+from generic_vectorizer.grpc_server.interfaces.strategies_pb2 import TextBatchRerankScoresRequest, TextBatchRerankScoresResponse, RerankScores
 
-from typing import Dict, Any 
+from typing import Dict, Any, List, Optional, Tuple
 from generic_vectorizer.log import logger 
-
-from itertools import zip_longest
+from generic_vectorizer.codec import select_top_k
 
 class FlagRerankerStrategy(ABCStrategy):
     def __init__(self, options: Dict[str, Any]) -> None:
         config = FlagRerankerConfig(**options)
-        self.model = FlagReranker(**config.model_dump())
+        if config.backend == 'onnxruntime':
+            self.model = OnnxReranker.from_config(config)
+        else:
+            self.model = FlagReranker(**config.model_kwargs())
+        self.batch_size = config.batch_size
+        self.max_length = config.max_length
+        self.score_cache = LRUCache(max_size=config.score_cache_size)
+        self.counters: Dict[str, int] = {'scored_pairs': 0}
         
     def process(self, task_type: bytes, encoded_message: bytes) -> Message:
-        try:
-            plain_message = TextRerankScoresRequest()
+        return self.process_batch([(task_type, encoded_message)])[0]
+
+    def _parse_groups(self, task_type: bytes, encoded_message: bytes) -> Tuple[List[Tuple[str, List[str]]], bool, int]:
+        if task_type == b'RERANK_BATCH':
+            plain_message = TextBatchRerankScoresRequest()
             plain_message.ParseFromString(encoded_message)
-            sentence_pairs = list(zip_longest([plain_message.query], plain_message.corpus, fillvalue=plain_message.query))
-            scores = self.model.compute_score(sentence_pairs=sentence_pairs, normalize=plain_message.normalize)
-            response = TextRerankScoresResponse(status=True, error="", scores=scores)
-        except Exception as e:
-            response = TextRerankScoresResponse(status=False, error=str(e), scores=[])
-            logger.error(e) 
-        
-        return response
\ No newline at end of file
+            return [ (group.query, list(group.corpus)) for group in plain_message.groups ], plain_message.normalize, plain_message.top_k
+        plain_message = TextRerankScoresRequest()
+        plain_message.ParseFromString(encoded_message)
+        corpus = list(plain_message.corpus) or [plain_message.query]  # an empty corpus scores the query against itself
+        return [ (plain_message.query, corpus) ], plain_message.normalize, plain_message.top_k
+
+    def _score_pairs(self, sentence_pairs: List[Tuple[str, str]]) -> np.ndarray:
+        # longest pairs first : each model call pads to its longest pair, similar lengths waste less compute on padding
+        order = sorted(range(len(sentence_pairs)), key=lambda index: len(sentence_pairs[index][0]) + len(sentence_pairs[index][1]), reverse=True)
+        sorted_scores = self.model.compute_score(sentence_pairs=[ sentence_pairs[index] for index in order ], batch_size=self.batch_size, max_length=self.max_length, normalize=False)
+        scores = np.empty(len(sentence_pairs), dtype=np.float32)
+        scores[order] = np.atleast_1d(np.asarray(sorted_scores, dtype=np.float32))
+        return scores
+
+    def _score_cached_pairs(self, sentence_pairs: List[Tuple[str, str]]) -> np.ndarray:
+        # raw scores are cached, the normalization depends on the request
+        scores = np.empty(len(sentence_pairs), dtype=np.float32)
+        pair_keys: List[Tuple[bytes, bytes]] = []
+        text2digest: Dict[str, bytes] = {}
+        for query, passage in sentence_pairs:
+            for text in (query, passage):
+                if text not in text2digest:
+                    text2digest[text] = sha256(text.encode()).digest()
+            pair_keys.append((text2digest[query], text2digest[passage]))
+
+        # repeated pairs of the batch (paginated queries, shared candidates) are scored once
+        key2positions: Dict[Tuple[bytes, bytes], List[int]] = {}
+        for position, pair_key in enumerate(pair_keys):
+            key2positions.setdefault(pair_key, []).append(position)
+
+        missing_keys: List[Tuple[bytes, bytes]] = []
+        for pair_key, positions in key2positions.items():
+            cached_score = self.score_cache.peek(pair_key) if self.score_cache.enabled else None
+            if cached_score is None:
+                if self.score_cache.enabled:
+                    self.score_cache.miss()
+                missing_keys.append(pair_key)
+                continue
+            self.score_cache.touch(pair_key)
+            scores[positions] = cached_score
+
+        if len(missing_keys) > 0:
+            missing_scores = self._score_pairs([ sentence_pairs[key2positions[pair_key][0]] for pair_key in missing_keys ])
+            self.counters['scored_pairs'] += len(missing_keys)
+            for pair_key, score in zip(missing_keys, missing_scores.tolist()):
+                scores[key2positions[pair_key]] = score
+                self.score_cache.put(pair_key, score)
+        return scores
+
+    def _group_result(self, raw_scores: np.ndarray, normalize: bool, top_k: int) -> Dict[str, Any]:
+        scores = 1 / (1 + np.exp(-raw_scores)) if normalize else raw_scores
+        if top_k > 0:
+            return {'hits': select_top_k(scores, top_k)}
+        return {'scores': scores.tolist()}
+
+    def _build_response(self, task_type: bytes, group_results: List[Dict[str, Any]]) -> Message:
+        if task_type == b'RERANK_BATCH':
+            return TextBatchRerankScoresResponse(status=True, error="", results=[ RerankScores(**group_result) for group_result in group_results ])
+        return TextRerankScoresResponse(status=True, error="", **group_results[0])
+
+    def _build_error_response(self, task_type: bytes, error: Exception) -> Message:
+        logger.error(error)
+        if task_type == b'RERANK_BATCH':
+            return TextBatchRerankScoresResponse(status=False, error=str(error), results=[])
+        return TextRerankScoresResponse(status=False, error=str(error), scores=[])
+
+    def process_batch(self, tasks: List[Tuple[bytes, bytes]]) -> List[Message]:
+        # the groups of every request of the micro batch are flattened into a single length sorted compute_score
+        responses: List[Optional[Message]] = [None] * len(tasks)
+        parsed_tasks: List[Tuple[int, bytes, List[Tuple[str, List[str]]], bool, int]] = []
+        for position, (task_type, encoded_message) in enumerate(tasks):
+            try:
+                groups, normalize, top_k = self._parse_groups(task_type, encoded_message)
+                parsed_tasks.append((position, task_type, groups, normalize, top_k))
+            except Exception as e:
+                responses[position] = self._build_error_response(task_type, e)
+
+        sentence_pairs: List[Tuple[str, str]] = [ (query, passage) for _, _, groups, _, _ in parsed_tasks for query, corpus in groups for passage in corpus ]
+        scores = np.empty(0, dtype=np.float32)
+        if len(sentence_pairs) > 0:
+            try:
+                with self.stage_timer.stage('encode'):
+                    scores = self._score_cached_pairs(sentence_pairs)
+            except Exception as e:
+                for position, task_type, _, _, _ in parsed_tasks:
+                    responses[position] = self._build_error_response(task_type, e)
+                return responses
+
+        offset = 0
+        for position, task_type, groups, normalize, top_k in parsed_tasks:
+            group_results: List[Dict[str, Any]] = []
+            for _, corpus in groups:
+                group_results.append(self._group_result(scores[offset:offset+len(corpus)], normalize, top_k))
+                offset += len(corpus)
+            responses[position] = self._build_response(task_type, group_results)
+        return responses
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            **self.counters,
+            'score_cache_hits': self.score_cache.counters['hits'],
+            'score_cache_misses': self.score_cache.counters['misses']
+        }
@@ -0,0 +1,134 @@
+import numpy as np
+
+from time import sleep, perf_counter
+from hashlib import sha256
+from typing import Any, Dict, List, Optional, Tuple, Union, Callable
+
+from google.protobuf.message import Message
+from ..abstract_strategy import ABCStrategy
+
+from generic_vectorizer.typing import StubModelConfig
+from generic_vectorizer.grpc_server.interfaces.strategies_pb2 import TextEmbeddingRequest, TextEmbeddingResponse, Embedding, DenseEncoding, SparseFormat
+from generic_vectorizer.grpc_server.interfaces.strategies_pb2 import TextBatchEmbeddingRequest, TextBatchEmbeddingResponse
+from generic_vectorizer.grpc_server.interfaces.strategies_pb2 import TextRerankScoresRequest, TextRerankScoresResponse
+from generic_vectorizer.grpc_server.interfaces.strategies_pb2 import TextBatchRerankScoresRequest, TextBatchRerankScoresResponse, RerankScores
+
+from generic_vectorizer.log import logger
+from generic_vectorizer.codec import encode_dense, select_top_k
+from numpy.typing import NDArray
+
+class StubStrategy(ABCStrategy):
+    # model free : the vectors only depend on the seed and the text, every cost measured on top of it belongs to the transport path
+    def __init__(self, options:Dict[str, Any]) -> None:
+        self.config = StubModelConfig(**options)
+        self.counters:Dict[str, int] = {'encoded_texts': 0}
+        self.map_task2request:Dict[bytes, Callable[[], Union[TextEmbeddingRequest, TextBatchEmbeddingRequest, TextRerankScoresRequest, TextBatchRerankScoresRequest]]] = {
+            b'TEXT': TextEmbeddingRequest,
+            b'TEXT_BATCH': TextBatchEmbeddingRequest,
+            b'': TextRerankScoresRequest,
+            b'RERANK_BATCH': TextBatchRerankScoresRequest
+        }
+
+    def _rng(self, text:str) -> np.random.Generator:
+        hasher = sha256(self.config.seed.to_bytes(8, 'little', signed=True))
+        hasher.update(text.encode())
+        return np.random.default_rng(int.from_bytes(hasher.digest()[:8], 'little'))
+
+    def _compute(self, nb_texts:int) -> None:
+        delay = (self.config.delay_ms + self.config.per_text_delay_ms * nb_texts) / 1000
+        if delay == 0:
+            return
+        if not self.config.busy_wait:
+            sleep(delay)
+            return
+        end = perf_counter() + delay
+        while perf_counter() < end:
+            pass
+
+    def _build_embedding(self, text:str, plain_message:Union[TextEmbeddingRequest, TextBatchEmbeddingRequest]) -> Embedding:
+        rng = self._rng(text)
+        embedding = Embedding()
+        if plain_message.return_dense:
+            dense_values:NDArray = rng.standard_normal(self.config.dimension, dtype=np.float32)
+            dense_values /= np.linalg.norm(dense_values)
+            if plain_message.dense_encoding == DenseEncoding.FLOAT_LIST:
+                embedding.dense_values.extend(dense_values.tolist())
+            else:
+                embedding.dense_buffer, embedding.dense_scale = encode_dense(dense_values, plain_message.dense_encoding)
+                embedding.dense_encoding = plain_message.dense_encoding
+
+        if plain_message.return_sparse:
+            token_ids = np.unique(rng.integers(0, 250002, size=self.config.nb_sparse_tokens)).astype(np.uint32)
+            token_weights = rng.random(len(token_ids), dtype=np.float32)
+            if plain_message.sparse_format == SparseFormat.TOKEN_ID_ARRAYS:
+                embedding.sparse_indices.extend(token_ids.tolist())
+                embedding.sparse_weights.extend(token_weights.tolist())
+            else:
+                embedding.sparse_values.update({ str(token_id): weight for token_id, weight in zip(token_ids.tolist(), token_weights.tolist()) })
+        return embedding
+
+    def _rerank_result(self, query:str, corpus:List[str], top_k:int) -> Dict[str, Any]:
+        scores = [ float(self._rng(query + '\x00' + passage).random()) for passage in corpus ]
+        if top_k > 0:
+            return {'hits': select_top_k(np.asarray(scores, dtype=np.float32), top_k)}
+        return {'scores': scores}
+
+    def _build_response(self, task_type:bytes, plain_message:Message) -> Message:
+        if task_type == b'':
+            return TextRerankScoresResponse(status=True, error="", **self._rerank_result(plain_message.query, plain_message.corpus, plain_message.top_k))
+        if task_type == b'RERANK_BATCH':
+            return TextBatchRerankScoresResponse(status=True, error="", results=[ RerankScores(**self._rerank_result(group.query, group.corpus, plain_message.top_k)) for group in plain_message.groups ])
+        if task_type == b'TEXT':
+            return TextEmbeddingResponse(status=True, error=None, embedding=self._build_embedding(plain_message.text, plain_message))
+        return TextBatchEmbeddingResponse(status=True, error=None, embeddings=[ self._build_embedding(text, plain_message) for text in plain_message.texts ])
+
+    def _build_error_response(self, task_type:bytes, error:Exception) -> Message:
+        logger.error(error)
+        if task_type == b'':
+            return TextRerankScoresResponse(status=False, error=str(error), scores=[])
+        if task_type == b'RERANK_BATCH':
+            return TextBatchRerankScoresResponse(status=False, error=str(error), results=[])
+        if task_type == b'TEXT':
+            return TextEmbeddingResponse(status=False, error=str(error))
+        return TextBatchEmbeddingResponse(status=False, error=str(error), embeddings=[])
+
+    def _nb_texts(self, task_type:bytes, plain_message:Message) -> int:
+        if task_type == b'':
+            return len(plain_message.corpus)
+        if task_type == b'RERANK_BATCH':
+            return sum(len(group.corpus) for group in plain_message.groups)
+        if task_type == b'TEXT':
+            return 1
+        return len(plain_message.texts)
+
+    def process_batch(self, tasks:List[Tuple[bytes, bytes]]) -> List[Message]:
+        responses:List[Optional[Message]] = [None] * len(tasks)
+        parsed_tasks:List[Tuple[int, bytes, Message]] = []
+        for position, (task_type, encoded_message) in enumerate(tasks):
+            try:
+                assert task_type in self.map_task2request, f'{task_type} must be one of [TEXT, TEXT_BATCH, rerank, RERANK_BATCH]'
+                plain_message = self.map_task2request[task_type]()
+                plain_message.ParseFromString(encoded_message)
+                parsed_tasks.append((position, task_type, plain_message))
+            except Exception as e:
+                responses[position] = self._build_error_response(task_type, e)
+
+        if len(parsed_tasks) == 0:
+            return responses
+
+        # a single synthetic model call for the whole micro batch, like the fused encode of the real strategies
+        nb_texts = sum(self._nb_texts(task_type, plain_message) for _, task_type, plain_message in parsed_tasks)
+        with self.stage_timer.stage('encode'):
+            self._compute(nb_texts)
+        self.counters['encoded_texts'] += nb_texts
+
+        with self.stage_timer.stage('build_response'):
+            for position, task_type, plain_message in parsed_tasks:
+                responses[position] = self._build_response(task_type, plain_message)
+        return responses
+
+    def process(self, task_type:bytes, encoded_message:bytes) -> Message:
+        return self.process_batch([(task_type, encoded_message)])[0]
+
+    def stats(self) -> Dict[str, int]:
+        return dict(self.counters)
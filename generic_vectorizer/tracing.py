@@ -0,0 +1,172 @@
+import os
+import re
+import json
+import asyncio
+
+from time import time, perf_counter
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Tuple, TextIO
+
+from generic_vectorizer.log import logger
+
+TRACEPARENT_PATTERN = re.compile(r'^[0-9a-f]{2}-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$')
+
+# (name, start mark, end mark) : marks are absolute unix timestamps set along the request path
+TRACE_INTERVALS:List[Tuple[str, str, str]] = [
+    ('admission', 'received', 'admitted'),
+    ('broker', 'admitted', 'enqueued'),
+    ('queue', 'enqueued', 'dispatched'),
+    ('dispatch', 'dispatched', 'worker_received'),
+    ('worker', 'worker_received', 'worker_sent'),
+    ('response', 'worker_sent', 'response_received'),
+    ('parse', 'response_received', 'done'),
+    ('total', 'received', 'done')
+]
+
+class StageTimer:
+    def __init__(self):
+        self.durations:Dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name:str) -> Iterator[None]:
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.durations[name] = self.durations.get(name, 0.0) + perf_counter() - start
+
+    def reset(self) -> Dict[str, float]:
+        durations = self.durations
+        self.durations = {}
+        return durations
+
+class Trace:
+    def __init__(self, name:str, trace_id:Optional[str]=None, parent_span_id:Optional[str]=None, sampled:bool=False):
+        self.name = name
+        self.sampled = sampled  # exported when a trace exporter is configured
+        self.trace_id = trace_id or os.urandom(16).hex()
+        self.span_id = os.urandom(8).hex()
+        self.parent_span_id = parent_span_id
+        self.marks:Dict[str, float] = {'received': time()}
+        self.durations:Dict[str, float] = {}  # worker stages, measured over the whole batch the job was part of
+
+    @classmethod
+    def from_traceparent(cls, name:str, traceparent:Optional[str]) -> Optional['Trace']:
+        # w3c trace context : continue the caller trace and honor its sampled flag
+        match = TRACEPARENT_PATTERN.match(traceparent or '')
+        if match is None:
+            return None
+        trace_id, parent_span_id, flags = match.groups()
+        return cls(name, trace_id, parent_span_id, sampled=int(flags, 16) & 1 == 1)
+
+    def mark(self, name:str, at:Optional[float]=None) -> None:
+        self.marks[name] = at if at is not None else time()
+
+    def encode(self) -> bytes:
+        return json.dumps({'trace_id': self.trace_id, 'span_id': self.span_id, 'marks': self.marks, 'durations': self.durations}).encode()
+
+    def merge(self, encoded_trace:bytes) -> None:
+        if len(encoded_trace) == 0:
+            return
+        trace_data = json.loads(encoded_trace)
+        self.marks.update(trace_data.get('marks', {}))
+        self.durations.update(trace_data.get('durations', {}))
+
+    @staticmethod
+    def annotate(encoded_trace:bytes, marks:Optional[Dict[str, float]]=None, durations:Optional[Dict[str, float]]=None) -> bytes:
+        # used by the router and the workers : they never build a Trace, they only add their own stages
+        if len(encoded_trace) == 0:
+            return encoded_trace
+        trace_data = json.loads(encoded_trace)
+        trace_data.setdefault('marks', {}).update(marks or {})
+        trace_data.setdefault('durations', {}).update(durations or {})
+        return json.dumps(trace_data).encode()
+
+    def timings_ms(self) -> Dict[str, float]:
+        timings:Dict[str, float] = {}
+        for interval_name, start_mark, end_mark in TRACE_INTERVALS:
+            if start_mark in self.marks and end_mark in self.marks:
+                timings[interval_name] = round((self.marks[end_mark] - self.marks[start_mark]) * 1000, 3)
+        for stage_name, duration in self.durations.items():
+            timings[f'worker.{stage_name}'] = round(duration * 1000, 3)
+        return timings
+
+class OTLPFileExporter:
+    # one ExportTraceServiceRequest per line, in the OTLP/JSON encoding understood by the opentelemetry collector file receiver
+    _WRITE_BATCH_SIZE:int=256
+    _FLUSH_DELAY:float=1.0
+
+    def __init__(self, export_path:str, service_name:str='generic-vectorizer'):
+        self.export_path = export_path
+        self.service_name = service_name
+        # the file is only touched from its own thread : exported requests are queued and written in batches, never on the event loop
+        self.file_handler:TextIO = open(export_path, mode='a', encoding='utf-8')
+        self.write_executor:Optional[ThreadPoolExecutor] = ThreadPoolExecutor(max_workers=1, thread_name_prefix='trace-exporter')
+        self.pending_requests:List[Dict[str, Any]] = []
+        self.flush_handle:Optional[asyncio.TimerHandle] = None
+
+    def _span(self, trace:Trace, span_id:str, parent_span_id:Optional[str], name:str, start:float, end:float, attributes:Dict[str, Any]) -> Dict[str, Any]:
+        span:Dict[str, Any] = {
+            'traceId': trace.trace_id,
+            'spanId': span_id,
+            'name': name,
+            'kind': 2 if span_id == trace.span_id else 1,  # SERVER for the request, INTERNAL for its stages
+            'startTimeUnixNano': str(int(start * 1e9)),
+            'endTimeUnixNano': str(int(end * 1e9)),
+            'attributes': [ {'key': key, 'value': {'doubleValue': value} if isinstance(value, float) else {'stringValue': str(value)}} for key, value in attributes.items() ]
+        }
+        if parent_span_id is not None:
+            span['parentSpanId'] = parent_span_id
+        return span
+
+    def export(self, trace:Trace, attributes:Optional[Dict[str, Any]]=None) -> None:
+        marks = trace.marks
+        spans = [ self._span(trace, trace.span_id, trace.parent_span_id, trace.name, marks['received'], marks.get('done', time()), attributes or {}) ]
+        for interval_name, start_mark, end_mark in TRACE_INTERVALS[:-1]:
+            if start_mark not in marks or end_mark not in marks:
+                continue
+            stage_attributes = { f'worker.{stage_name}_ms': round(duration * 1000, 3) for stage_name, duration in trace.durations.items() } if interval_name == 'worker' else {}
+            spans.append(self._span(trace, os.urandom(8).hex(), trace.span_id, interval_name, marks[start_mark], marks[end_mark], stage_attributes))
+
+        export_request = {
+            'resourceSpans': [{
+                'resource': {'attributes': [{'key': 'service.name', 'value': {'stringValue': self.service_name}}]},
+                'scopeSpans': [{'scope': {'name': 'generic_vectorizer'}, 'spans': spans}]
+            }]
+        }
+        self.pending_requests.append(export_request)
+        if len(self.pending_requests) >= OTLPFileExporter._WRITE_BATCH_SIZE:
+            self.flush()
+            return
+        if self.flush_handle is None:
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:  # no event loop : nothing would run a delayed flush
+                self.flush()
+                return
+            self.flush_handle = loop.call_later(OTLPFileExporter._FLUSH_DELAY, self.flush)
+
+    def _write_many(self, export_requests:List[Dict[str, Any]]) -> None:
+        try:
+            self.file_handler.write(''.join( json.dumps(export_request) + '\n' for export_request in export_requests ))
+            self.file_handler.flush()
+        except OSError as e:
+            logger.warning(e)
+
+    def flush(self) -> None:
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+        if self.write_executor is None or len(self.pending_requests) == 0:
+            return
+        export_requests = self.pending_requests
+        self.pending_requests = []
+        self.write_executor.submit(self._write_many, export_requests)
+
+    def close(self) -> None:
+        if self.write_executor is not None:
+            self.flush()
+            self.write_executor.submit(self.file_handler.close).result()
+            self.write_executor.shutdown(wait=True)
+            self.write_executor = None
@@ -1,18 +1,41 @@
 from enum import Enum 
 from typing import Optional, List, Any, Dict 
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, model_validator
 
 from .reranker import FlagRerankerConfig
 from .bge_embedding import BGEM3FlagModelConfig
+from .job import Job
+from .cache import EmbeddingCacheConfig
+from .tracing import TracingConfig
+from .bench import BenchConfig
+from .stub import StubModelConfig
+from .autoscaler import AutoscalerConfig
 
 class EmbedderModelType(str, Enum):
     BGE_RERANKER_MODEL:str='FlagRerankerStrategy'
     BGE_M3_EMBEDDING_MODEL:str='BGEM3FlagModelStrategy'
+    STUB_MODEL:str='StubStrategy'
     
 class EmbedderModelConfig(BaseModel):
     embedder_model_type:EmbedderModelType
     target_topic:str
     nb_instances:int=1
+    min_instances:Optional[int]=Field(default=None, ge=1)  # autoscaling bounds, nb_instances is the initial number of workers
+    max_instances:Optional[int]=Field(default=None, ge=1)
+    instance_cost:float=Field(default=1.0, gt=0)  # share of the autoscaler budget used by one worker
+    share_weights:bool=False  # load the model once in the parent, the forked workers share its read-only pages
     zmq_tcp_address:Optional[str]=None
-    options:Dict[str, Any] 
\ No newline at end of file
+    max_batch_size:int=Field(default=1, ge=1)
+    max_batch_wait_ms:int=Field(default=0, ge=0)
+    max_queue_depth:int=Field(default=0, ge=0)  # 0 means unbounded
+    max_queue_time_ms:int=Field(default=0, ge=0)  # 0 disables the estimated queue time check
+    concurrency_share:float=Field(default=1.0, gt=0)
+    interactive_weight:int=Field(default=8, ge=1)  # interactive jobs dispatched for each bulk job when both lanes are busy
+    options:Dict[str, Any]
+
+    @model_validator(mode='after')
+    def validate_instances(self) -> 'EmbedderModelConfig':
+        if self.nb_instances < (self.min_instances or 0) or self.nb_instances > (self.max_instances or self.nb_instances):
+            raise ValueError(f"nb_instances must be between min_instances and max_instances for {self.target_topic}")
+        return self
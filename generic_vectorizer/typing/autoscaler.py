@@ -0,0 +1,16 @@
+from pydantic import BaseModel, Field, model_validator
+from typing import Optional
+
+class AutoscalerConfig(BaseModel):
+    interval: float = Field(default=5.0, gt=0)  # seconds between two load reports
+    cooldown: float = Field(default=30.0, ge=0)  # minimum delay between two scaling actions of a topic
+    budget: Optional[float] = Field(default=None, gt=0)  # shared by all topics, in the unit of instance_cost (cores, GB...), unbounded when not set
+    scale_up_queue_depth: float = Field(default=2.0, gt=0)  # queued jobs per worker
+    scale_up_utilisation: float = Field(default=0.85, gt=0, le=1)
+    scale_down_utilisation: float = Field(default=0.3, ge=0, lt=1)
+
+    @model_validator(mode='after')
+    def validate_utilisation(self) -> 'AutoscalerConfig':
+        if self.scale_down_utilisation >= self.scale_up_utilisation:
+            raise ValueError("scale_down_utilisation must be lower than scale_up_utilisation")
+        return self
@@ -0,0 +1,49 @@
+from pydantic import BaseModel, Field, field_validator, model_validator
+from typing import Dict, Literal, Optional
+
+BENCH_OPERATIONS = ['embed', 'batch', 'rerank']
+TEXT_LENGTH_DISTRIBUTIONS = {'fixed': 1, 'uniform': 2, 'lognormal': 2}
+
+class BenchConfig(BaseModel):
+    grpc_server_address: str = Field(default='localhost:5000')
+    embedding_topic: str = Field(default='bge_m3')
+    rerank_topic: Optional[str] = Field(default=None)
+    mode: Literal['open', 'closed'] = Field(default='closed')  # open : requests arrive at a fixed rate, closed : each client waits for its answer
+    rps: float = Field(default=50, gt=0)
+    arrival: Literal['constant', 'poisson'] = Field(default='poisson')
+    concurrency: int = Field(default=16, ge=1)
+    duration: float = Field(default=30, gt=0)
+    warmup: float = Field(default=2, ge=0)
+    text_length: str = Field(default='uniform:16:256')  # in words : fixed:N | uniform:MIN:MAX | lognormal:MEDIAN:SIGMA
+    mix: Dict[str, float] = Field(default={'embed': 1.0})
+    batch_size: int = Field(default=16, ge=1)
+    nb_candidates: int = Field(default=32, ge=1)
+    return_sparse: bool = Field(default=False)
+    bypass_cache: bool = Field(default=True)
+    request_timeout: float = Field(default=30, gt=0)
+    seed: int = Field(default=0)
+
+    @field_validator('text_length')
+    @classmethod
+    def validate_text_length(cls, v: str) -> str:
+        distribution, *parameters = v.split(':')
+        if distribution not in TEXT_LENGTH_DISTRIBUTIONS or len(parameters) != TEXT_LENGTH_DISTRIBUTIONS[distribution]:
+            raise ValueError("text_length must be one of fixed:N, uniform:MIN:MAX or lognormal:MEDIAN:SIGMA")
+        if any(float(parameter) <= 0 for parameter in parameters):
+            raise ValueError("text_length parameters must be positive")
+        return v
+
+    @field_validator('mix')
+    @classmethod
+    def validate_mix(cls, v: Dict[str, float]) -> Dict[str, float]:
+        if any(operation not in BENCH_OPERATIONS for operation in v):
+            raise ValueError(f"mix operations must be in {BENCH_OPERATIONS}")
+        if any(weight < 0 for weight in v.values()) or sum(v.values()) <= 0:
+            raise ValueError("mix weights must be positive")
+        return v
+
+    @model_validator(mode='after')
+    def validate_rerank_topic(self) -> 'BenchConfig':
+        if self.mix.get('rerank', 0) > 0 and self.rerank_topic is None:
+            raise ValueError("rerank_topic is required when the mix contains rerank requests")
+        return self
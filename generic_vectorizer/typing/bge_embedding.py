@@ -1,5 +1,5 @@
-from pydantic import BaseModel, Field, field_validator, ConfigDict
-from typing import Literal
+from pydantic import BaseModel, Field, field_validator, model_validator, ConfigDict
+from typing import Literal, Dict, Any
 
 bge_m3_models = [
     "BAAI/bge-m3",
@@ -17,6 +17,18 @@ class BGEM3FlagModelConfig(BaseModel):
     device: str = Field(default='cpu')
     use_fp16: bool = Field(default=True)
     pooling_method: Literal['cls', 'mean'] = Field(default='cls')
+    batch_token_budget: int = Field(default=16384, gt=0)
+    chunk_cache_size: int = Field(default=0, ge=0)
+    chunk_overlap: int = Field(default=0, ge=0)
+    sentence_boundaries: bool = Field(default=False)
+    backend: Literal['torch', 'onnxruntime'] = Field(default='torch')
+    onnx_cache_dir: str = Field(default='~/.cache/generic_vectorizer/onnx')  # the model is exported once, then loaded from here
+    onnx_execution_provider: Literal['CPUExecutionProvider', 'OpenVINOExecutionProvider'] = Field(default='CPUExecutionProvider')
+    intra_op_num_threads: int = Field(default=0, ge=0)  # 0 : one thread per physical core, divide the cores between the instances
+    inter_op_num_threads: int = Field(default=1, ge=0)
+
+    def model_kwargs(self) -> Dict[str, Any]:
+        return self.model_dump(include={'model_name_or_path', 'device', 'use_fp16', 'pooling_method'})
 
     @field_validator('model_name_or_path')
     @classmethod
@@ -30,4 +42,10 @@ class BGEM3FlagModelConfig(BaseModel):
     def validate_pooling_method(cls, v: str) -> str:
         if v not in ['cls', 'mean']:
             raise ValueError("pooling_method must be either 'cls' or 'mean'")
-        return v
\ No newline at end of file
+        return v
+
+    @model_validator(mode='after')
+    def validate_backend(self) -> 'BGEM3FlagModelConfig':
+        if self.backend == 'onnxruntime' and self.device != 'cpu':
+            raise ValueError("the onnxruntime backend runs on the cpu, device must be 'cpu'")
+        return self
@@ -0,0 +1,8 @@
+from pydantic import BaseModel, Field
+from typing import Optional
+
+class EmbeddingCacheConfig(BaseModel):
+    max_memory_bytes: int = Field(default=256 * 1024 * 1024, ge=0)
+    disk_path: Optional[str] = Field(default=None)
+    max_disk_bytes: int = Field(default=4 * 1024 * 1024 * 1024, gt=0)  # keys and values, least recently accessed rows are evicted past it
+    log_interval: int = Field(default=60, gt=0)
@@ -0,0 +1,32 @@
+import struct
+
+from dataclasses import dataclass, field
+from typing import List, Sequence
+
+@dataclass
+class Job:
+    client_id:bytes
+    task_type:bytes
+    message:bytes
+    deadline:float=0.0  # absolute unix timestamp, 0 means no deadline
+    enqueued_at:float=field(default=0.0, compare=False)  # broker side only, never sent to the workers
+    cancelled:bool=field(default=False, compare=False)  # set by the broker when the client went away
+    priority:int=field(default=0, compare=False)  # broker side only, lane of the topic queue
+    trace:bytes=b''  # encoded trace context and stage timestamps, empty when the request is not traced
+
+    NB_FRAMES = 5
+
+    def expired(self, now:float) -> bool:
+        return self.cancelled or 0 < self.deadline < now
+
+    def to_frames(self) -> List[bytes]:
+        return [self.client_id, self.task_type, struct.pack('>d', self.deadline), self.trace, self.message]
+
+    @classmethod
+    def from_frames(cls, frames:Sequence[bytes]) -> List['Job']:
+        assert len(frames) % cls.NB_FRAMES == 0, f'{len(frames)} frames can not be split into jobs of {cls.NB_FRAMES} frames'
+        jobs:List[Job] = []
+        for index in range(0, len(frames), cls.NB_FRAMES):
+            client_id, task_type, encoded_deadline, trace, message = frames[index:index+cls.NB_FRAMES]
+            jobs.append(cls(client_id, task_type, message, deadline=struct.unpack('>d', encoded_deadline)[0], trace=trace))
+        return jobs
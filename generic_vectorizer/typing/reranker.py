@@ -1,5 +1,5 @@
-from pydantic import Field, BaseModel, field_validator, ConfigDict 
-from typing import Optional
+from pydantic import Field, BaseModel, field_validator, model_validator, ConfigDict 
+from typing import Literal, Optional, Dict, Any
 
 bge_reranker_models = [
     "BAAI/bge-reranker-base",
@@ -9,6 +9,13 @@ bge_reranker_models = [
     "BAAI/bge-reranker-v2-minicpm-layerwise"
 ]
 
+# cross encoders with a single logit, the llm based rerankers are not exported
+onnx_reranker_models = [
+    "BAAI/bge-reranker-base",
+    "BAAI/bge-reranker-large",
+    "BAAI/bge-reranker-v2-m3"
+]
+
 class FlagRerankerConfig(BaseModel):
     model_config = ConfigDict(protected_namespaces=())
 
@@ -16,10 +23,30 @@ class FlagRerankerConfig(BaseModel):
     device: str = Field(default='cpu')
     use_fp16: bool = Field(default=True)
     cache_dir: Optional[str] = Field(default=None)
+    batch_size: int = Field(default=32, gt=0)  # pairs per model call, the pairs of a batch are sorted by length first
+    max_length: int = Field(default=512, gt=0)  # (query, passage) pairs are truncated to this number of tokens
+    score_cache_size: int = Field(default=0, ge=0)  # (query, passage) scores kept by each worker, 0 disables the cache
+    backend: Literal['torch', 'onnxruntime'] = Field(default='torch')
+    onnx_cache_dir: str = Field(default='~/.cache/generic_vectorizer/onnx')  # the model is exported once, then loaded from here
+    onnx_execution_provider: Literal['CPUExecutionProvider', 'OpenVINOExecutionProvider'] = Field(default='CPUExecutionProvider')
+    intra_op_num_threads: int = Field(default=0, ge=0)  # 0 : one thread per physical core, divide the cores between the instances
+    inter_op_num_threads: int = Field(default=1, ge=0)
+
+    def model_kwargs(self) -> Dict[str, Any]:
+        return self.model_dump(include={'model_name_or_path', 'device', 'use_fp16', 'cache_dir'})
 
     @field_validator('model_name_or_path')
     @classmethod
     def validate_model_name(cls, v):
         if v not in bge_reranker_models:
             raise ValueError(f"model_name_or_path must be one of {bge_reranker_models}")
-        return v
\ No newline at end of file
+        return v
+
+    @model_validator(mode='after')
+    def validate_backend(self) -> 'FlagRerankerConfig':
+        if self.backend == 'onnxruntime':
+            if self.device != 'cpu':
+                raise ValueError("the onnxruntime backend runs on the cpu, device must be 'cpu'")
+            if self.model_name_or_path not in onnx_reranker_models:
+                raise ValueError(f"the onnxruntime backend supports {onnx_reranker_models}")
+        return self
@@ -0,0 +1,9 @@
+from pydantic import BaseModel, Field
+
+class StubModelConfig(BaseModel):
+    dimension: int = Field(default=1024, gt=0)
+    nb_sparse_tokens: int = Field(default=32, ge=0)
+    seed: int = Field(default=0)  # same seed and text, same vectors
+    delay_ms: float = Field(default=0, ge=0)  # synthetic compute time of every model call
+    per_text_delay_ms: float = Field(default=0, ge=0)  # added for each text of the call, micro batches amortize delay_ms only
+    busy_wait: bool = Field(default=False)  # spin instead of sleeping to hold the cpu like a real model
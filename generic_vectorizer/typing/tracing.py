@@ -0,0 +1,6 @@
+from pydantic import BaseModel, Field
+from typing import Optional
+
+class TracingConfig(BaseModel):
+    export_path: Optional[str] = Field(default=None)  # OTLP/JSON lines, disabled when not set
+    sample_ratio: float = Field(default=1.0, ge=0, le=1)
@@ -3,9 +3,9 @@ import multiprocessing as mp
 from generic_vectorizer.grpc_server.server import run_grpc_server
 from generic_vectorizer.background_workers.embedder import EmbedderPool
 
-from generic_vectorizer.typing import EmbedderModelConfig, EmbedderModelType
+from generic_vectorizer.typing import EmbedderModelConfig, EmbedderModelType, EmbeddingCacheConfig, TracingConfig, AutoscalerConfig
 
-from typing import List
+from typing import List, Optional
 
 import re 
 import socket 
@@ -13,13 +13,17 @@ import socket
 from collections import Counter
 
 class Vectorizer:
-    def __init__(self, grpc_server_address:str, embedder_model_configs:List[EmbedderModelConfig], max_concurrent_requests:int=512, request_timeout:int=30):
+    def __init__(self, grpc_server_address:str, embedder_model_configs:List[EmbedderModelConfig], max_concurrent_requests:int=512, request_timeout:int=30, embedding_cache_config:Optional[EmbeddingCacheConfig]=None, metrics_address:Optional[str]=None, tracing_config:Optional[TracingConfig]=None, autoscaler_config:Optional[AutoscalerConfig]=None):
         self.grpc_server_address = grpc_server_address
         self.validate_topics(embedder_model_configs)
         self.validate_zmq_tcp_addresses(embedder_model_configs)
         self.embedder_model_configs = embedder_model_configs 
         self.max_concurrent_requests = max_concurrent_requests
         self.request_timeout = request_timeout
+        self.embedding_cache_config = embedding_cache_config
+        self.metrics_address = metrics_address
+        self.tracing_config = tracing_config
+        self.autoscaler_config = autoscaler_config
 
     def validate_topics(self, embedder_model_configs: List[EmbedderModelConfig]) -> None:
         topics = [cfg.target_topic for cfg in embedder_model_configs]
@@ -59,11 +63,11 @@ class Vectorizer:
     def listen(self):
         grpc_process = mp.Process(
             target=run_grpc_server, 
-            args=[self.grpc_server_address, self.embedder_model_configs, self.max_concurrent_requests, self.request_timeout]
+            args=[self.grpc_server_address, self.embedder_model_configs, self.max_concurrent_requests, self.request_timeout, self.embedding_cache_config, self.metrics_address, self.tracing_config]
         )
         grpc_process.start()
-        embedder_pool = EmbedderPool(embedder_model_configs=self.embedder_model_configs)
-        embedder_pool.launch_workers()
+        embedder_pool = EmbedderPool(embedder_model_configs=self.embedder_model_configs, autoscaler_config=self.autoscaler_config)
+        embedder_pool.launch_workers(is_running=grpc_process.is_alive)  # returns on ctrl+c or when the grpc server is gone
 
         try:
             grpc_process.join()
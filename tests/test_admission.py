@@ -0,0 +1,62 @@
+import asyncio
+import pytest
+
+from generic_vectorizer.grpc_server.admission import AdmissionController, AdmissionRejected
+from generic_vectorizer.grpc_server.metrics import ExponentialAverage
+from generic_vectorizer.typing import EmbedderModelConfig, EmbedderModelType, Job
+
+def make_config(target_topic, **kwargs):
+    return EmbedderModelConfig(
+        embedder_model_type=EmbedderModelType.BGE_M3_EMBEDDING_MODEL,
+        target_topic=target_topic,
+        options={'model_name_or_path': 'BAAI/bge-m3', 'cache_folder': '/tmp'},
+        **kwargs
+    )
+
+def make_controller(configs, max_concurrent_requests=100):
+    async def main():
+        topic2queue_hmap = { cfg.target_topic: asyncio.Queue() for cfg in configs }
+        topic2service_time = { cfg.target_topic: ExponentialAverage() for cfg in configs }
+        return AdmissionController(configs, max_concurrent_requests, topic2queue_hmap, topic2service_time)
+    return asyncio.run(main())
+
+def test_concurrency_is_split_by_share():
+    controller = make_controller([make_config('bge_m3', concurrency_share=3), make_config('reranker', concurrency_share=1)])
+    assert controller.topic2semaphore['bge_m3']._value == 52
+    assert controller.topic2semaphore['reranker']._value == 17
+
+def test_rejects_when_queue_depth_is_exceeded():
+    controller = make_controller([make_config('bge_m3', max_queue_depth=2), make_config('reranker')])
+    for _ in range(2):
+        controller.topic2queue_hmap['bge_m3'].put_nowait(Job(b'client', b'TEXT', b''))
+        controller.topic2queue_hmap['reranker'].put_nowait(Job(b'client', b'', b''))
+    with pytest.raises(AdmissionRejected):
+        controller.check('bge_m3')
+    controller.check('reranker')  # other topics are not affected
+    controller.check('unknown')
+    assert controller.stats()['bge_m3']['rejections'] == 1
+
+def test_rejects_when_estimated_queue_time_is_exceeded():
+    controller = make_controller([make_config('bge_m3', max_queue_time_ms=100, max_batch_size=2)])
+    controller.check('bge_m3')  # no service time observed yet
+    controller.topic2service_time['bge_m3'].observe(0.03)
+    controller.check('bge_m3')
+    for _ in range(6):
+        controller.topic2queue_hmap['bge_m3'].put_nowait(Job(b'client', b'TEXT', b''))
+    assert controller.estimated_queue_time('bge_m3') == pytest.approx(0.12)
+    with pytest.raises(AdmissionRejected):
+        controller.check('bge_m3')
+
+def test_waiting_requests_count_toward_queue_depth():
+    async def main():
+        configs = [make_config('bge_m3', max_queue_depth=1)]
+        controller = AdmissionController(configs, 1, {'bge_m3': asyncio.Queue()}, {})
+        async with controller.admit('bge_m3'):
+            waiting_task = asyncio.create_task(controller.acquire('bge_m3'))
+            await asyncio.sleep(0)
+            with pytest.raises(AdmissionRejected):
+                controller.check('bge_m3')
+        await waiting_task
+        controller.release('bge_m3')
+        controller.check('bge_m3')
+    asyncio.run(main())
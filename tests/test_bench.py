@@ -0,0 +1,76 @@
+import grpc
+import pytest
+import asyncio
+import numpy as np
+from pydantic import ValidationError
+
+from generic_vectorizer.bench import TextSampler, LoadGenerator, summarize
+from generic_vectorizer.strategies import StubStrategy
+from generic_vectorizer.grpc_server.interfaces import strategies_pb2_grpc
+from generic_vectorizer.grpc_server.servicer.text_embedding import TextEmbeddingServicer
+from generic_vectorizer.grpc_server.admission import AdmissionController
+from generic_vectorizer.typing import BenchConfig, EmbedderModelConfig, EmbedderModelType
+
+class StubBrokerClient:
+    # the worker side of the path, without the broker
+    def __init__(self):
+        self.strategy = StubStrategy({})
+
+    async def request(self, target_topic, task_type, encoded_req, deadline=0.0, priority=0, trace=None):
+        return self.strategy.process(task_type, encoded_req).SerializeToString()
+
+def test_text_sampler_distributions():
+    assert all(len(TextSampler('fixed:12', seed=0).sample().split()) == 12 for _ in range(10))
+    uniform_sampler = TextSampler('uniform:3:5', seed=0)
+    assert { uniform_sampler.nb_words() for _ in range(200) } == {3, 4, 5}
+    lognormal_sampler = TextSampler('lognormal:64:0.5', seed=0)
+    assert 48 < np.median([ lognormal_sampler.nb_words() for _ in range(2000) ]) < 80
+    assert TextSampler('fixed:8', seed=1).sample() == TextSampler('fixed:8', seed=1).sample()
+
+def test_bench_config_validation():
+    with pytest.raises(ValidationError):
+        BenchConfig(text_length='gaussian:3')
+    with pytest.raises(ValidationError):
+        BenchConfig(mix={'search': 1.0})
+    with pytest.raises(ValidationError):
+        BenchConfig(mix={'embed': 1.0, 'rerank': 1.0})  # rerank needs a topic
+    assert BenchConfig(mix={'embed': 1.0, 'rerank': 1.0}, rerank_topic='bge_reranker').rerank_topic == 'bge_reranker'
+
+def test_summarize():
+    samples = [ ('embed', 0.0, latency / 1000, 1, 'OK') for latency in range(1, 101) ]
+    samples.append(('embed', 0.0, 0.5, 1, 'UNAVAILABLE'))
+    summary = summarize(samples, elapsed=2.0)
+    assert summary['requests'] == 101
+    assert summary['throughput_rps'] == 50.0
+    assert summary['errors'] == {'UNAVAILABLE': 1}
+    assert summary['error_rate'] == pytest.approx(1 / 101, abs=1e-6)
+    assert summary['latency_ms']['p50'] == pytest.approx(50.5)
+    assert summary['latency_ms']['max'] == pytest.approx(100.0)
+    assert summarize([], elapsed=1.0)['latency_ms']['p99'] is None
+
+@pytest.mark.parametrize('mode', ['open', 'closed'])
+def test_load_generator_against_a_stub_servicer(mode):
+    async def main():
+        config = EmbedderModelConfig(embedder_model_type=EmbedderModelType.STUB_MODEL, target_topic='stub', options={})
+        admission = AdmissionController([config], 100, {'stub': asyncio.Queue()}, {})
+        server = grpc.aio.server()
+        strategies_pb2_grpc.add_TextEmbeddingServicer_to_server(TextEmbeddingServicer(broker_client=StubBrokerClient(), admission=admission), server)
+        port = server.add_insecure_port('127.0.0.1:0')
+        await server.start()
+        try:
+            bench_config = BenchConfig(
+                grpc_server_address=f'127.0.0.1:{port}', embedding_topic='stub', rerank_topic='stub', mode=mode, rps=100, arrival='constant',
+                concurrency=4, duration=0.5, warmup=0.1, text_length='fixed:8', mix={'embed': 1.0, 'batch': 1.0, 'rerank': 1.0}, batch_size=4, nb_candidates=3
+            )
+            return await LoadGenerator(bench_config).run()
+        finally:
+            await server.stop(grace=None)
+
+    report = asyncio.run(main())
+    assert report['mode'] == mode
+    assert report['requests'] > 0
+    assert report['error_rate'] == 0.0
+    assert set(report['operations']) == {'embed', 'batch', 'rerank'}
+    assert report['latency_ms']['p50'] <= report['latency_ms']['p99']
+    if mode == 'open':
+        assert report['requests'] == pytest.approx(50, abs=2)  # 100 rps over the measured half second
@@ -0,0 +1,111 @@
+import json
+import struct
+import asyncio
+import pytest
+
+import zmq
+import zmq.asyncio as aiozmq
+
+from time import time
+
+from generic_vectorizer.grpc_server.servicer.broker_client import BrokerClientPool
+from generic_vectorizer.tracing import Trace
+
+async def reversed_echo_broker(router_socket, nb_requests):
+    # answers in reverse order to make sure responses are matched by correlation id and not by arrival
+    incoming_reqs = [ await router_socket.recv_multipart() for _ in range(nb_requests) ]
+    for socket_id, _, correlation_id, topic, task_type, _, _, encoded_trace, message in reversed(incoming_reqs):
+        await router_socket.send_multipart([socket_id, b'', correlation_id, encoded_trace, topic + b':' + task_type + b':' + message])
+
+def test_pool_multiplexes_concurrent_requests():
+    async def main():
+        ctx = aiozmq.Context()
+        router_socket = ctx.socket(zmq.ROUTER)
+        router_socket.bind('inproc://test_broker_client')
+        try:
+            async with BrokerClientPool(ctx, 'inproc://test_broker_client', pool_size=2) as broker_client:
+                broker_task = asyncio.create_task(reversed_echo_broker(router_socket, 16))
+                responses = await asyncio.gather(*[
+                    broker_client.request('bge_m3', b'TEXT', str(index).encode())
+                    for index in range(16)
+                ])
+                await broker_task
+                assert len(broker_client.dealer_sockets) == 2
+                assert len(broker_client.pending_futures) == 0
+        finally:
+            router_socket.close(linger=0)
+            ctx.term()
+        return responses
+
+    responses = asyncio.run(main())
+    assert responses == [ f'bge_m3:TEXT:{index}'.encode() for index in range(16) ]
+
+def test_pool_times_out_at_deadline():
+    async def main():
+        ctx = aiozmq.Context()
+        router_socket = ctx.socket(zmq.ROUTER)
+        router_socket.bind('inproc://test_broker_client_deadline')
+        try:
+            async with BrokerClientPool(ctx, 'inproc://test_broker_client_deadline', pool_size=1) as broker_client:
+                deadline = time() + 0.05
+                with pytest.raises(asyncio.TimeoutError):
+                    await broker_client.request('bge_m3', b'TEXT', b'slow', deadline, priority=2)
+                socket_id, _, correlation_id, _, _, encoded_deadline, encoded_priority, encoded_trace, _ = await router_socket.recv_multipart()
+                assert struct.unpack('>d', encoded_deadline)[0] == deadline
+                assert encoded_priority == b'\x02'
+                assert encoded_trace == b''  # untraced requests carry an empty trace frame
+                assert await router_socket.recv_multipart() == [socket_id, b'', correlation_id, b'CANCEL']
+        finally:
+            router_socket.close(linger=0)
+            ctx.term()
+
+    asyncio.run(main())
+
+def test_pool_forgets_cancelled_requests():
+    async def main():
+        ctx = aiozmq.Context()
+        router_socket = ctx.socket(zmq.ROUTER)
+        router_socket.bind('inproc://test_broker_client_cancel')
+        try:
+            async with BrokerClientPool(ctx, 'inproc://test_broker_client_cancel', pool_size=1) as broker_client:
+                with pytest.raises(asyncio.TimeoutError):
+                    await asyncio.wait_for(broker_client.request('bge_m3', b'TEXT', b'slow'), timeout=0.05)
+                assert len(broker_client.pending_futures) == 0
+                # the broker is told to drop the queued job, a late response is dropped silently
+                socket_id, _, correlation_id, *_ = await router_socket.recv_multipart()
+                assert await router_socket.recv_multipart() == [socket_id, b'', correlation_id, b'CANCEL']
+                await router_socket.send_multipart([socket_id, b'', correlation_id, b'', b'late'])
+                broker_task = asyncio.create_task(reversed_echo_broker(router_socket, 1))
+                response = await broker_client.request('bge_m3', b'TEXT', b'fast')
+                await broker_task
+        finally:
+            router_socket.close(linger=0)
+            ctx.term()
+        return response
+
+    assert asyncio.run(main()) == b'bge_m3:TEXT:fast'
+
+def test_pool_merges_the_returned_trace():
+    async def main():
+        ctx = aiozmq.Context()
+        router_socket = ctx.socket(zmq.ROUTER)
+        router_socket.bind('inproc://test_broker_client_trace')
+        try:
+            async with BrokerClientPool(ctx, 'inproc://test_broker_client_trace', pool_size=1) as broker_client:
+                trace = Trace('getTextEmbedding')
+                request_task = asyncio.create_task(broker_client.request('bge_m3', b'TEXT', b'message', trace=trace))
+                socket_id, _, correlation_id, _, _, _, _, encoded_trace, _ = await router_socket.recv_multipart()
+                assert json.loads(encoded_trace)['trace_id'] == trace.trace_id
+                encoded_trace = Trace.annotate(encoded_trace, marks={'enqueued': 1.0, 'dispatched': 2.0}, durations={'encode': 0.5})
+                await router_socket.send_multipart([socket_id, b'', correlation_id, encoded_trace, b'response'])
+                response = await request_task
+        finally:
+            router_socket.close(linger=0)
+            ctx.term()
+        return response, trace
+
+    response, trace = asyncio.run(main())
+    assert response == b'response'
+    assert trace.marks['enqueued'] == 1.0 and trace.marks['dispatched'] == 2.0
+    assert 'response_received' in trace.marks
+    assert trace.durations == {'encode': 0.5}
@@ -0,0 +1,115 @@
+import pytest
+import numpy as np
+from generic_vectorizer.codec import encode_dense, decode_dense, merge_sparse_weights, merge_sparse_arrays, decode_sparse, to_csr, select_top_k, aggregate_dense
+from generic_vectorizer.grpc_server.interfaces.strategies_pb2 import Embedding, DenseEncoding, DenseAggregation, SparseFormat, SparsePooling
+from generic_vectorizer.client import AsyncEmbeddingClient
+
+@pytest.fixture
+def dense_vector():
+    return np.random.default_rng(0).standard_normal(1024).astype(np.float32)
+
+def roundtrip(vector, dense_encoding):
+    dense_buffer, dense_scale = encode_dense(vector, dense_encoding)
+    embedding = Embedding(dense_buffer=dense_buffer, dense_encoding=dense_encoding, dense_scale=dense_scale)
+    encoded_embedding = embedding.SerializeToString()
+    decoded_embedding = Embedding()
+    decoded_embedding.ParseFromString(encoded_embedding)
+    return decode_dense(decoded_embedding), len(encoded_embedding)
+
+def test_float32_roundtrip_is_exact(dense_vector):
+    decoded_vector, nb_bytes = roundtrip(dense_vector, DenseEncoding.FLOAT32)
+    assert np.array_equal(decoded_vector, dense_vector)
+    assert nb_bytes < 1024 * 4 + 16
+
+def test_float16_roundtrip(dense_vector):
+    decoded_vector, nb_bytes = roundtrip(dense_vector, DenseEncoding.FLOAT16)
+    assert decoded_vector.dtype == np.float16
+    assert np.allclose(decoded_vector, dense_vector, atol=1e-2)
+    assert nb_bytes < 1024 * 2 + 16
+
+def test_int8_roundtrip(dense_vector):
+    decoded_vector, nb_bytes = roundtrip(dense_vector, DenseEncoding.INT8)
+    scale = np.max(np.abs(dense_vector)) / 127
+    assert np.max(np.abs(decoded_vector - dense_vector)) <= scale / 2 + 1e-6
+    assert nb_bytes < 1024 + 16
+
+def test_float_list_is_decoded_from_dense_values(dense_vector):
+    embedding = Embedding(dense_values=dense_vector.tolist())
+    assert np.allclose(decode_dense(embedding), dense_vector)
+
+def test_encode_dense_rejects_float_list(dense_vector):
+    with pytest.raises(ValueError):
+        encode_dense(dense_vector, DenseEncoding.FLOAT_LIST)
+
+@pytest.fixture
+def chunk_weights():
+    return [{'10': 0.5, '3': 0.1}, {'10': 0.2, '7': 0.4}, {'3': 0.3}]
+
+def test_merge_sparse_weights_max_and_sum(chunk_weights):
+    assert merge_sparse_weights(chunk_weights, SparsePooling.MAX_POOLING) == pytest.approx({'10': 0.5, '3': 0.3, '7': 0.4})
+    assert merge_sparse_weights(chunk_weights, SparsePooling.SUM_POOLING) == pytest.approx({'10': 0.7, '3': 0.4, '7': 0.4})
+
+def test_merge_sparse_arrays_max_and_sum(chunk_weights):
+    token_ids, token_weights = merge_sparse_arrays(chunk_weights, SparsePooling.MAX_POOLING)
+    assert token_ids.dtype == np.uint32
+    assert token_ids.tolist() == [3, 7, 10]
+    assert token_weights == pytest.approx([0.3, 0.4, 0.5])
+
+    token_ids, token_weights = merge_sparse_arrays(chunk_weights, SparsePooling.SUM_POOLING)
+    assert token_ids.tolist() == [3, 7, 10]
+    assert token_weights == pytest.approx([0.4, 0.4, 0.7])
+
+def test_decode_sparse_from_both_formats():
+    token_ids, token_weights = decode_sparse(Embedding(sparse_indices=[3, 10], sparse_weights=[0.3, 0.5]))
+    assert token_ids.tolist() == [3, 10]
+    assert token_weights == pytest.approx([0.3, 0.5])
+
+    token_ids, token_weights = decode_sparse(Embedding(sparse_values={'3': 0.3}))
+    assert token_ids.tolist() == [3]
+    assert token_weights == pytest.approx([0.3])
+
+def test_client_sparse_output_follows_the_requested_format():
+    client = AsyncEmbeddingClient('localhost:0')
+    empty_embedding = Embedding()
+    token_ids, token_weights = client._embedding_to_dict(empty_embedding, False, True, SparseFormat.TOKEN_ID_ARRAYS)["sparse"]
+    assert len(token_ids) == 0 and len(token_weights) == 0
+    assert client._embedding_to_dict(empty_embedding, False, True, SparseFormat.TOKEN_WEIGHT_MAP)["sparse"] == {}
+
+    embedding = Embedding(sparse_indices=[7, 42], sparse_weights=[0.5, 0.25])
+    token_ids, token_weights = client._embedding_to_dict(embedding, False, True, SparseFormat.TOKEN_ID_ARRAYS)["sparse"]
+    assert token_ids.tolist() == [7, 42]
+
+def test_to_csr():
+    pytest.importorskip('scipy')
+    matrix = to_csr([(np.array([3, 10], dtype=np.uint32), np.array([0.3, 0.5], dtype=np.float32)), (np.array([7], dtype=np.uint32), np.array([0.4], dtype=np.float32))], vocab_size=16)
+    assert matrix.shape == (2, 16)
+    assert matrix[0, 10] == pytest.approx(0.5)
+    assert matrix[1, 7] == pytest.approx(0.4)
+
+def test_select_top_k_keeps_the_corpus_order_on_ties():
+    scores = np.array([0.1, 0.9, 0.3, 0.9, 0.5], dtype=np.float32)
+    assert [ (hit.index, round(hit.score, 3)) for hit in select_top_k(scores, 3) ] == [(1, 0.9), (3, 0.9), (4, 0.5)]
+    assert [ hit.index for hit in select_top_k(scores, 10) ] == [1, 3, 4, 2, 0]
+
+def centrality_reference(embeddings):
+    # previous per text implementation : full cosine matrix of the chunks
+    if embeddings.shape[0] == 1:
+        return embeddings[0]
+    embedding_norms = np.linalg.norm(embeddings, axis=1)
+    cosine_similarity_scores = (embeddings @ embeddings.T) / (embedding_norms[None, :] * embedding_norms[:, None] + 1e-8)
+    return np.mean(np.sum(cosine_similarity_scores, axis=1, keepdims=True) * embeddings, axis=0)
+
+def test_aggregate_dense_modes():
+    nb_chunks = np.array([3, 1, 2])
+    chunk_embeddings = np.random.default_rng(0).standard_normal((6, 8)).astype(np.float32)
+    segments = np.split(chunk_embeddings, np.cumsum(nb_chunks)[:-1])
+
+    centrality_embeddings = aggregate_dense(chunk_embeddings, nb_chunks, DenseAggregation.CENTRALITY_AGGREGATION)
+    assert centrality_embeddings.dtype == np.float32
+    assert np.allclose(centrality_embeddings, [ centrality_reference(segment) for segment in segments ], atol=1e-5)
+    assert np.array_equal(centrality_embeddings[1], chunk_embeddings[3])  # single chunk texts are copied as is
+    assert np.allclose(aggregate_dense(chunk_embeddings, nb_chunks, DenseAggregation.MEAN_AGGREGATION), [ segment.mean(axis=0) for segment in segments ])
+    assert np.array_equal(aggregate_dense(chunk_embeddings, nb_chunks, DenseAggregation.MAX_AGGREGATION), [ segment.max(axis=0) for segment in segments ])
+    assert np.array_equal(aggregate_dense(chunk_embeddings, nb_chunks, DenseAggregation.FIRST_CHUNK_AGGREGATION), [ segment[0] for segment in segments ])
+    with pytest.raises(ValueError):
+        aggregate_dense(chunk_embeddings, nb_chunks, 42)
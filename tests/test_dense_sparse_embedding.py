@@ -1,13 +1,19 @@
+import re
 import pytest
 from unittest.mock import Mock, patch
 import numpy as np
 from google.protobuf.message import Message
 from generic_vectorizer.strategies.embedding.bge_m3 import BGEM3FlagModelStrategy
-from generic_vectorizer.grpc_server.interfaces.strategies_pb2 import TextEmbeddingRequest, TextEmbeddingResponse, TextBatchEmbeddingRequest, TextBatchEmbeddingResponse, Embedding
+from generic_vectorizer.grpc_server.interfaces.strategies_pb2 import TextEmbeddingRequest, TextEmbeddingResponse, TextBatchEmbeddingRequest, TextBatchEmbeddingResponse, Embedding, DenseEncoding, DenseAggregation, SparseFormat, SparsePooling
+
+def whitespace_tokenizer(texts, add_special_tokens, return_offsets_mapping, return_attention_mask):
+    # fast tokenizer stand-in : one token per word
+    return {'offset_mapping': [ [ match.span() for match in re.finditer(r'\S+', text) ] for text in texts ]}
 
 @pytest.fixture
 def mock_bge_m3_flag_model():
     with patch('generic_vectorizer.strategies.embedding.bge_m3.BGEM3FlagModel') as mock:
+        mock.return_value.tokenizer.side_effect = whitespace_tokenizer
         yield mock
 
 def test_embedding(mock_bge_m3_flag_model):
@@ -115,4 +121,256 @@ def test_batch_embedding(mock_bge_m3_flag_model):
     assert response.embeddings[0].dense_values == pytest.approx(mock_embeddings[0], abs=1e-6)
     assert response.embeddings[1].dense_values == pytest.approx(mock_embeddings[1], abs=1e-6)
     assert not response.embeddings[0].sparse_values
-    assert not response.embeddings[1].sparse_values
\ No newline at end of file
+    assert not response.embeddings[1].sparse_values
+
+def test_process_batch_fuses_requests(mock_bge_m3_flag_model):
+    options = {
+        "model_name_or_path": "BAAI/bge-m3",
+        "device": "cpu",
+        "use_fp16": False,
+        "pooling_method": "cls"
+    }
+    strategy = BGEM3FlagModelStrategy(options)
+
+    # one row per text : 1 single text request + 2 texts from a batch request
+    mock_embeddings = np.array([[0.1, 0.2, 0.3], [0.4, 0.5, 0.6], [0.7, 0.8, 0.9]])
+    strategy.model.encode.return_value = {
+        'dense_vecs': mock_embeddings
+    }
+
+    single_request = TextEmbeddingRequest(text="Sample text 0", chunk_size=512, return_dense=True)
+    batch_request = TextBatchEmbeddingRequest(texts=["Sample text 1", "Sample text 2"], chunk_size=512, return_dense=True)
+    invalid_request = TextEmbeddingRequest(text="Sample text 3", chunk_size=512)
+
+    responses = strategy.process_batch([
+        (b"TEXT", single_request.SerializeToString()),
+        (b"TEXT_BATCH", batch_request.SerializeToString()),
+        (b"TEXT", invalid_request.SerializeToString())
+    ])
+
+    # a single encode call must serve every valid request
+    strategy.model.encode.assert_called_once()
+    assert len(responses) == 3
+    assert isinstance(responses[0], TextEmbeddingResponse)
+    assert responses[0].embedding.dense_values == pytest.approx(mock_embeddings[0], abs=1e-6)
+    assert isinstance(responses[1], TextBatchEmbeddingResponse)
+    assert len(responses[1].embeddings) == 2
+    assert responses[1].embeddings[0].dense_values == pytest.approx(mock_embeddings[1], abs=1e-6)
+    assert responses[1].embeddings[1].dense_values == pytest.approx(mock_embeddings[2], abs=1e-6)
+    assert responses[2].status == False
+
+
+def test_token_budget_packing(mock_bge_m3_flag_model):
+    options = {
+        "model_name_or_path": "BAAI/bge-m3",
+        "device": "cpu",
+        "use_fp16": False,
+        "pooling_method": "cls",
+        "batch_token_budget": 24
+    }
+    strategy = BGEM3FlagModelStrategy(options)
+
+    def encode(sentences, batch_size, return_dense, return_sparse):
+        assert batch_size == len(sentences)
+        assert max(len(sentence.split()) + 2 for sentence in sentences) * len(sentences) <= 24 or len(sentences) == 1
+        return {'dense_vecs': np.array([[float(len(sentence.split())), 1.0] for sentence in sentences])}
+
+    strategy.model.encode.side_effect = encode
+
+    texts = ["w " * 1, "w " * 20, "w " * 2, "w " * 3, "w " * 2]
+    request = TextBatchEmbeddingRequest(texts=texts, chunk_size=512, return_dense=True, return_sparse=False)
+    response = strategy.process(b"TEXT_BATCH", request.SerializeToString())
+
+    assert response.status == True
+    assert strategy.model.encode.call_count > 1
+    # embeddings come back in the order of the original texts
+    assert [ embedding.dense_values[0] for embedding in response.embeddings ] == [1.0, 20.0, 2.0, 3.0, 2.0]
+
+
+def test_chunk_cache(mock_bge_m3_flag_model):
+    options = {
+        "model_name_or_path": "BAAI/bge-m3",
+        "device": "cpu",
+        "use_fp16": False,
+        "pooling_method": "cls",
+        "chunk_cache_size": 8
+    }
+    strategy = BGEM3FlagModelStrategy(options)
+    strategy.model.encode.side_effect = lambda sentences, batch_size, return_dense, return_sparse: {
+        'dense_vecs': np.array([[float(len(sentence)), 1.0] for sentence in sentences]),
+        'lexical_weights': [{'7': float(len(sentence))} for sentence in sentences]
+    }
+
+    first_request = TextBatchEmbeddingRequest(texts=["shared", "first"], chunk_size=512, return_dense=True, return_sparse=True)
+    strategy.process(b"TEXT_BATCH", first_request.SerializeToString())
+    assert strategy.model.encode.call_args.kwargs['sentences'] == ["shared", "first"]
+
+    # only the unseen chunk reaches the model, the cached one is stitched back in place
+    second_request = TextBatchEmbeddingRequest(texts=["second!", "shared"], chunk_size=512, return_dense=True, return_sparse=True)
+    response = strategy.process(b"TEXT_BATCH", second_request.SerializeToString())
+    assert strategy.model.encode.call_args.kwargs['sentences'] == ["second!"]
+    assert [ embedding.dense_values[0] for embedding in response.embeddings ] == [7.0, 6.0]
+    assert response.embeddings[1].sparse_values['7'] == pytest.approx(6.0)
+
+    # the bypass flag always goes to the model
+    bypass_request = TextEmbeddingRequest(text="shared", chunk_size=512, return_dense=True, bypass_cache=True)
+    strategy.process(b"TEXT", bypass_request.SerializeToString())
+    assert strategy.model.encode.call_args.kwargs['sentences'] == ["shared"]
+    assert strategy.model.encode.call_count == 3
+
+
+def test_chunk_cache_counts_only_used_entries(mock_bge_m3_flag_model):
+    options = {
+        "model_name_or_path": "BAAI/bge-m3",
+        "device": "cpu",
+        "use_fp16": False,
+        "pooling_method": "cls",
+        "chunk_cache_size": 8
+    }
+    strategy = BGEM3FlagModelStrategy(options)
+    strategy.model.encode.side_effect = lambda sentences, batch_size, return_dense, return_sparse: {
+        'dense_vecs': np.array([[float(len(sentence)), 1.0] for sentence in sentences]),
+        **({'lexical_weights': [{'7': float(len(sentence))} for sentence in sentences]} if return_sparse else {})
+    }
+
+    dense_request = TextEmbeddingRequest(text="shared", chunk_size=512, return_dense=True)
+    strategy.process(b"TEXT", dense_request.SerializeToString())
+    # the cached entry has no lexical weights : it is not used, so it is not a hit
+    sparse_request = TextEmbeddingRequest(text="shared", chunk_size=512, return_dense=True, return_sparse=True)
+    strategy.process(b"TEXT", sparse_request.SerializeToString())
+    assert strategy.stats()['chunk_cache_hits'] == 0
+    assert strategy.stats()['chunk_cache_misses'] == 2
+
+    strategy.process(b"TEXT", sparse_request.SerializeToString())
+    assert strategy.stats()['chunk_cache_hits'] == 1
+    assert strategy.model.encode.call_count == 2
+
+
+def test_duplicated_chunks_are_encoded_once(mock_bge_m3_flag_model):
+    options = {
+        "model_name_or_path": "BAAI/bge-m3",
+        "device": "cpu",
+        "use_fp16": False,
+        "pooling_method": "cls"
+    }
+    strategy = BGEM3FlagModelStrategy(options)
+    strategy.model.encode.side_effect = lambda sentences, batch_size, return_dense, return_sparse: {
+        'dense_vecs': np.array([[float(len(sentence)), 1.0] for sentence in sentences]),
+        'lexical_weights': [{'7': float(len(sentence))} for sentence in sentences]
+    }
+
+    request = TextBatchEmbeddingRequest(texts=["repeated", "once", "repeated"], chunk_size=512, return_dense=True, return_sparse=True)
+    response = strategy.process(b"TEXT_BATCH", request.SerializeToString())
+    assert sorted(strategy.model.encode.call_args.kwargs['sentences']) == ["once", "repeated"]
+    assert [ embedding.dense_values[0] for embedding in response.embeddings ] == [8.0, 4.0, 8.0]
+    assert response.embeddings[2].sparse_values['7'] == pytest.approx(8.0)
+    assert strategy.stats()['encoded_chunks'] == 2
+
+
+def test_binary_dense_encoding(mock_bge_m3_flag_model):
+    options = {
+        "model_name_or_path": "BAAI/bge-m3",
+        "device": "cpu",
+        "use_fp16": False,
+        "pooling_method": "cls"
+    }
+    strategy = BGEM3FlagModelStrategy(options)
+    mock_embedding = np.array([[0.1, 0.2, 0.3]], dtype=np.float32)
+    strategy.model.encode.return_value = {
+        'dense_vecs': mock_embedding
+    }
+
+    request = TextEmbeddingRequest(text="Sample text", chunk_size=512, return_dense=True, dense_encoding=DenseEncoding.FLOAT32)
+    response = strategy.process(b"TEXT", request.SerializeToString())
+
+    assert response.status == True
+    assert not response.embedding.dense_values
+    assert response.embedding.dense_encoding == DenseEncoding.FLOAT32
+    assert np.frombuffer(response.embedding.dense_buffer, dtype='<f4') == pytest.approx(mock_embedding[0], abs=1e-6)
+
+
+def test_sparse_token_id_arrays(mock_bge_m3_flag_model):
+    options = {
+        "model_name_or_path": "BAAI/bge-m3",
+        "device": "cpu",
+        "use_fp16": False,
+        "pooling_method": "cls"
+    }
+    strategy = BGEM3FlagModelStrategy(options)
+
+    # two chunks sharing the token 10
+    strategy.model.encode.return_value = {
+        'lexical_weights': [{'10': 0.5, '3': 0.1}, {'10': 0.2, '7': 0.4}]
+    }
+
+    request = TextEmbeddingRequest(
+        text="a b",
+        chunk_size=1,
+        return_sparse=True,
+        sparse_format=SparseFormat.TOKEN_ID_ARRAYS,
+        sparse_pooling=SparsePooling.SUM_POOLING
+    )
+    response = strategy.process(b"TEXT", request.SerializeToString())
+
+    assert response.status == True
+    assert not response.embedding.sparse_values
+    assert list(response.embedding.sparse_indices) == [3, 7, 10]
+    assert list(response.embedding.sparse_weights) == pytest.approx([0.1, 0.4, 0.7])
+
+
+def test_dense_aggregation_is_selected_per_request(mock_bge_m3_flag_model):
+    options = {
+        "model_name_or_path": "BAAI/bge-m3",
+        "device": "cpu",
+        "use_fp16": False,
+        "pooling_method": "cls"
+    }
+    strategy = BGEM3FlagModelStrategy(options)
+
+    # one chunk per word : every text below has two chunks
+    word2embedding = {'a': [1.0, 0.0], 'b': [0.0, 3.0], 'c': [2.0, 2.0], 'd': [4.0, 0.0]}
+    strategy.model.encode.side_effect = lambda sentences, batch_size, return_dense, return_sparse: {'dense_vecs': np.array([ word2embedding[sentence] for sentence in sentences ], dtype=np.float32)}
+
+    mean_request = TextBatchEmbeddingRequest(texts=["a b", "c d"], chunk_size=1, return_dense=True, dense_aggregation=DenseAggregation.MEAN_AGGREGATION)
+    max_request = TextEmbeddingRequest(text="a b", chunk_size=1, return_dense=True, dense_aggregation=DenseAggregation.MAX_AGGREGATION)
+    first_request = TextEmbeddingRequest(text="c d", chunk_size=1, return_dense=True, dense_aggregation=DenseAggregation.FIRST_CHUNK_AGGREGATION)
+    invalid_request = TextEmbeddingRequest(text="a b", chunk_size=1, return_dense=True, dense_aggregation=42)
+    responses = strategy.process_batch([
+        (b"TEXT_BATCH", mean_request.SerializeToString()),
+        (b"TEXT", max_request.SerializeToString()),
+        (b"TEXT", first_request.SerializeToString()),
+        (b"TEXT", invalid_request.SerializeToString())
+    ])
+
+    assert [ list(embedding.dense_values) for embedding in responses[0].embeddings ] == [[0.5, 1.5], [3.0, 1.0]]
+    assert list(responses[1].embedding.dense_values) == [1.0, 3.0]
+    assert list(responses[2].embedding.dense_values) == [2.0, 2.0]
+    assert responses[3].status == False
+
+
+def test_chunking_with_overlap_and_sentence_boundaries(mock_bge_m3_flag_model):
+    options = {
+        "model_name_or_path": "BAAI/bge-m3",
+        "device": "cpu",
+        "use_fp16": False,
+        "pooling_method": "cls",
+        "chunk_overlap": 1
+    }
+    strategy = BGEM3FlagModelStrategy(options)
+
+    # chunks are sliced from the original text : the spacing is kept and nothing is decoded
+    assert strategy.to_chunks("a  b c\td e", chunk_size=3) == ["a  b c", "c\td e"]
+    assert strategy.to_chunks("", chunk_size=3) == [""]
+
+    strategy.sentence_boundaries = True
+    text = "One two three. Four five six seven.\nEight nine"
+    assert strategy.to_chunks(text, chunk_size=5) == ["One two three.", "three. Four five six seven.", "seven.\nEight nine"]
+
+    strategy.tokenizer.reset_mock()
+    chunks, lengths, nb_chunks = strategy._chunk_texts(texts=["a b c d", "e"], chunk_sizes=[2, 2])
+    strategy.tokenizer.assert_called_once()  # all the texts of a request are tokenized in one batch call
+    assert (chunks, lengths, nb_chunks) == (["a b", "b c", "c d", "e"], [2, 2, 2, 1], [3, 1])
+
+    # the overlap must leave room for new tokens in every chunk
+    response = strategy.process(b"TEXT", TextEmbeddingRequest(text="a b", chunk_size=1, return_dense=True).SerializeToString())
+    assert response.status == False
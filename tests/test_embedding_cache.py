@@ -0,0 +1,116 @@
+import pytest
+import sqlite3
+import asyncio
+
+from generic_vectorizer.grpc_server.cache import EmbeddingCache
+from generic_vectorizer.typing import EmbeddingCacheConfig
+
+def make_key(text, chunk_size=512, return_dense=True, return_sparse=False, topic='bge_m3', fingerprint='model-a'):
+    return EmbeddingCache.make_key(
+        topic=topic,
+        fingerprint=fingerprint,
+        options=[str(chunk_size), str(return_dense), str(return_sparse)],
+        text=text
+    )
+
+def test_make_key_depends_on_every_component():
+    reference = make_key("text")
+    assert reference == make_key("text")
+    assert reference != make_key("other text")
+    assert reference != make_key("text", chunk_size=256)
+    assert reference != make_key("text", return_sparse=True)
+    assert reference != make_key("text", topic='other_topic')
+    assert reference != make_key("text", fingerprint='model-b')
+
+def test_memory_tier_hits_and_misses():
+    cache = EmbeddingCache(EmbeddingCacheConfig())
+    assert cache.get(make_key("text")) is None
+    cache.put(make_key("text"), b'embedding')
+    assert cache.get(make_key("text")) == b'embedding'
+
+    stats = cache.stats()
+    assert stats['hits'] == 1
+    assert stats['misses'] == 1
+    assert stats['entries'] == 1
+
+def test_memory_tier_is_bounded_by_bytes():
+    entry_size = 32 + 100 + EmbeddingCache._ENTRY_OVERHEAD
+    cache = EmbeddingCache(EmbeddingCacheConfig(max_memory_bytes=2 * entry_size))
+    cache.put(make_key("a"), b'x' * 100)
+    cache.put(make_key("b"), b'x' * 100)
+    cache.get(make_key("a"))  # a becomes the most recently used entry
+    cache.put(make_key("c"), b'x' * 100)
+
+    assert cache.get(make_key("b")) is None
+    assert cache.get(make_key("a")) is not None
+    assert cache.get(make_key("c")) is not None
+    assert cache.stats()['evictions'] == 1
+    assert cache.stats()['memory_bytes'] <= 2 * entry_size
+
+def test_disk_tier_survives_restart(tmp_path):
+    config = EmbeddingCacheConfig(max_memory_bytes=1024, disk_path=str(tmp_path / 'cache.sqlite'))
+    cache = EmbeddingCache(config)
+    cache.put(make_key("text"), b'embedding')
+    cache.close()
+
+    restarted_cache = EmbeddingCache(config)
+    assert restarted_cache.get(make_key("text")) == b'embedding'
+    assert restarted_cache.stats()['disk_hits'] == 1
+    restarted_cache.close()
+
+def test_disk_writes_are_batched(tmp_path):
+    disk_path = str(tmp_path / 'embeddings.sqlite')
+
+    async def main():
+        cache = EmbeddingCache(EmbeddingCacheConfig(disk_path=disk_path, max_memory_bytes=1024))
+        for position in range(10):
+            cache.put(make_key(str(position)), b'x' * 100)
+        pending_writes = cache.stats()['pending_writes']
+        found = await cache.get_many([ make_key(str(position)) for position in range(12) ])  # evicted entries are still served before the flush
+        cache.close()
+        return pending_writes, found
+
+    pending_writes, found = asyncio.run(main())
+    assert pending_writes == 10
+    assert len(found) == 10
+
+    restarted_cache = EmbeddingCache(EmbeddingCacheConfig(disk_path=disk_path))
+    assert restarted_cache.get(make_key("9")) == b'x' * 100
+    restarted_cache.close()
+
+def test_disk_tier_evicts_the_least_recently_accessed_rows(tmp_path):
+    entry_size = 32 + 100
+    config = EmbeddingCacheConfig(max_memory_bytes=1024, disk_path=str(tmp_path / 'cache.sqlite'), max_disk_bytes=3 * entry_size)
+    cache = EmbeddingCache(config)
+    for text in ["a", "b", "c"]:
+        cache.put(make_key(text), b'x' * 100)
+    cache.close()
+
+    restarted_cache = EmbeddingCache(config)
+    assert restarted_cache.stats()['disk_bytes'] == 3 * entry_size
+    assert restarted_cache.get(make_key("a")) is not None  # disk hit : a becomes the most recently accessed row
+    restarted_cache.put(make_key("d"), b'x' * 100)
+    restarted_cache.flush()
+    restarted_cache.disk_executor.submit(lambda: None).result()
+    stats = restarted_cache.stats()
+    restarted_cache.close()
+    assert stats['disk_evictions'] == 1
+    assert stats['disk_bytes'] == 3 * entry_size
+
+    reopened_cache = EmbeddingCache(config)
+    assert reopened_cache.get(make_key("b")) is None
+    assert all(reopened_cache.get(make_key(text)) is not None for text in ["a", "c", "d"])
+    reopened_cache.close()
+
+def test_disk_tier_opens_files_written_before_it_was_bounded(tmp_path):
+    disk_path = str(tmp_path / 'cache.sqlite')
+    connection = sqlite3.connect(disk_path)
+    connection.execute('CREATE TABLE embeddings (key BLOB PRIMARY KEY, value BLOB NOT NULL)')
+    connection.execute('INSERT INTO embeddings (key, value) VALUES (?, ?)', (make_key("text"), b'embedding'))
+    connection.commit()
+    connection.close()
+
+    cache = EmbeddingCache(EmbeddingCacheConfig(disk_path=disk_path))
+    assert cache.stats()['disk_bytes'] == 32 + len(b'embedding')
+    assert cache.get(make_key("text")) == b'embedding'
+    cache.close()
@@ -0,0 +1,50 @@
+import asyncio
+import pytest
+
+from generic_vectorizer.grpc_server.lanes import PriorityLaneQueue
+from generic_vectorizer.typing import Job
+
+INTERACTIVE, BULK = 1, 2
+
+def make_queue(interactive_weight=3):
+    async def main():
+        return PriorityLaneQueue(lane2weight={INTERACTIVE: interactive_weight, BULK: 1}, default_lane=BULK)
+    return asyncio.run(main())
+
+def make_job(name, priority):
+    return Job(name.encode(), b'TEXT', b'', priority=priority)
+
+def test_interactive_jobs_jump_ahead_while_bulk_keeps_its_share():
+    target_queue = make_queue(interactive_weight=3)
+    for index in range(8):
+        target_queue.put_nowait(make_job(f'bulk-{index}', BULK))
+    for index in range(6):
+        target_queue.put_nowait(make_job(f'interactive-{index}', INTERACTIVE))
+
+    order = [ target_queue.get_nowait().client_id.decode().split('-')[0] for _ in range(8) ]
+    # 3 interactive jobs for each bulk job, interleaved
+    assert order == ['interactive', 'interactive', 'bulk', 'interactive'] * 2
+    assert target_queue.lane_sizes() == {INTERACTIVE: 0, BULK: 6}
+
+    # jobs keep their fifo order inside a lane
+    assert [ target_queue.get_nowait().client_id for _ in range(6) ] == [ f'bulk-{index}'.encode() for index in range(2, 8) ]
+    assert target_queue.empty()
+    with pytest.raises(asyncio.QueueEmpty):
+        target_queue.get_nowait()
+
+def test_unknown_priority_goes_to_default_lane():
+    target_queue = make_queue()
+    target_queue.put_nowait(make_job('default', 0))
+    target_queue.put_nowait(make_job('unknown', 5))
+    assert target_queue.lane_sizes() == {INTERACTIVE: 0, BULK: 2}
+    assert [ target_queue.get_nowait().priority for _ in range(2) ] == [BULK, BULK]  # jobs record the lane they were queued in
+
+def test_get_waits_for_a_job():
+    async def main():
+        target_queue = PriorityLaneQueue(lane2weight={INTERACTIVE: 8, BULK: 1}, default_lane=BULK)
+        getter = asyncio.create_task(target_queue.get())
+        await asyncio.sleep(0.01)
+        assert not getter.done()
+        await target_queue.put(make_job('late', INTERACTIVE))
+        return await asyncio.wait_for(getter, timeout=1)
+    assert asyncio.run(main()).client_id == b'late'
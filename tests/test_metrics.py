@@ -0,0 +1,57 @@
+import asyncio
+
+from generic_vectorizer.grpc_server.metrics import MetricsRegistry, start_metrics_server
+
+def test_registry_renders_prometheus_text():
+    metrics = MetricsRegistry()
+    metrics.describe('vectorizer_batch_size', 'histogram', 'jobs per dispatched batch', buckets=(1, 4, 16))
+    metrics.describe('vectorizer_workers', 'gauge', 'background workers by state')
+    for batch_size in (1, 3, 3, 32):
+        metrics.observe('vectorizer_batch_size', {'topic': 'bge_m3'}, batch_size)
+    metrics.set('vectorizer_workers', {'topic': 'bge_m3', 'state': 'idle'}, 2)
+    metrics.inc('vectorizer_worker_encoded_tokens_total', {'topic': 'bge_m3'}, 128)
+    metrics.inc('vectorizer_worker_encoded_tokens_total', {'topic': 'bge_m3'}, 64)
+    metrics.add_collector(lambda registry: registry.set('vectorizer_workers', {'topic': 'bge_m3', 'state': 'busy'}, 1))
+
+    lines = metrics.render().splitlines()
+    assert '# TYPE vectorizer_batch_size histogram' in lines
+    assert 'vectorizer_batch_size_bucket{topic="bge_m3",le="1"} 1' in lines
+    assert 'vectorizer_batch_size_bucket{topic="bge_m3",le="4"} 3' in lines
+    assert 'vectorizer_batch_size_bucket{topic="bge_m3",le="16"} 3' in lines
+    assert 'vectorizer_batch_size_bucket{topic="bge_m3",le="+Inf"} 4' in lines
+    assert 'vectorizer_batch_size_sum{topic="bge_m3"} 39' in lines
+    assert 'vectorizer_batch_size_count{topic="bge_m3"} 4' in lines
+    assert 'vectorizer_workers{state="idle",topic="bge_m3"} 2' in lines
+    assert 'vectorizer_workers{state="busy",topic="bge_m3"} 1' in lines
+    assert '# TYPE vectorizer_worker_encoded_tokens_total counter' in lines
+    assert 'vectorizer_worker_encoded_tokens_total{topic="bge_m3"} 192' in lines
+
+def test_label_values_are_escaped():
+    metrics = MetricsRegistry()
+    metrics.inc('vectorizer_requests_total', {'topic': 'a"b\\c'})
+    assert 'vectorizer_requests_total{topic="a\\"b\\\\c"} 1' in metrics.render().splitlines()
+
+def test_metrics_endpoint():
+    async def fetch(port, path):
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(f'GET {path} HTTP/1.1\r\nHost: localhost\r\n\r\n'.encode())
+        await writer.drain()
+        response = await reader.read()
+        writer.close()
+        return response
+
+    async def main():
+        metrics = MetricsRegistry()
+        metrics.inc('vectorizer_dropped_jobs_total', {'topic': 'bge_m3'}, 3)
+        server = await start_metrics_server(metrics, '127.0.0.1:0')
+        port = server.sockets[0].getsockname()[1]
+        try:
+            return await fetch(port, '/metrics'), await fetch(port, '/')
+        finally:
+            server.close()
+            await server.wait_closed()
+
+    metrics_response, missing_response = asyncio.run(main())
+    assert metrics_response.startswith(b'HTTP/1.1 200 OK')
+    assert b'vectorizer_dropped_jobs_total{topic="bge_m3"} 3' in metrics_response
+    assert missing_response.startswith(b'HTTP/1.1 404')
@@ -45,6 +45,17 @@ def test_bgem3_flag_model_config_invalid_pooling_method():
     with pytest.raises(ValidationError):
         BGEM3FlagModelConfig(pooling_method='invalid_method')
 
+def test_onnx_backend_config():
+    config = BGEM3FlagModelConfig(backend='onnxruntime', intra_op_num_threads=4)
+    assert 'backend' not in config.model_kwargs()
+    with pytest.raises(ValidationError):
+        BGEM3FlagModelConfig(backend='onnxruntime', device='cuda:0')
+    with pytest.raises(ValidationError):
+        BGEM3FlagModelConfig(backend='tensorrt')
+    FlagRerankerConfig(model_name_or_path='BAAI/bge-reranker-base', backend='onnxruntime', onnx_execution_provider='OpenVINOExecutionProvider')
+    with pytest.raises(ValidationError):
+        FlagRerankerConfig(model_name_or_path='BAAI/bge-reranker-v2-gemma', backend='onnxruntime')
+
 # Tests for EmbedderModelConfig
 def test_embedder_model_config_valid():
     config = EmbedderModelConfig(
@@ -78,4 +89,43 @@ def test_embedder_model_config_invalid_type():
             embedder_model_type='InvalidType',
             target_topic='test_topic',
             options={}
-        )
\ No newline at end of file
+        )
+
+def test_embedder_model_config_batching():
+    config = EmbedderModelConfig(
+        embedder_model_type=EmbedderModelType.BGE_M3_EMBEDDING_MODEL,
+        target_topic='test_topic',
+        max_batch_size=32,
+        max_batch_wait_ms=5,
+        options={}
+    )
+    assert config.max_batch_size == 32
+    assert config.max_batch_wait_ms == 5
+
+    with pytest.raises(ValidationError):
+        EmbedderModelConfig(
+            embedder_model_type=EmbedderModelType.BGE_M3_EMBEDDING_MODEL,
+            target_topic='test_topic',
+            max_batch_size=0,
+            options={}
+        )
+
+def test_embedder_model_config_autoscaling_bounds():
+    config = EmbedderModelConfig(
+        embedder_model_type=EmbedderModelType.BGE_RERANKER_MODEL,
+        target_topic='test_topic',
+        nb_instances=2,
+        min_instances=1,
+        max_instances=4,
+        options={}
+    )
+    assert (config.min_instances, config.nb_instances, config.max_instances) == (1, 2, 4)
+
+    with pytest.raises(ValidationError):
+        EmbedderModelConfig(
+            embedder_model_type=EmbedderModelType.BGE_RERANKER_MODEL,
+            target_topic='test_topic',
+            nb_instances=5,
+            max_instances=4,
+            options={}
+        )
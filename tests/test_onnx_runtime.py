@@ -0,0 +1,96 @@
+import os
+import pytest
+import numpy as np
+
+pytest.importorskip('onnx')
+pytest.importorskip('onnxruntime')
+
+from tokenizers import Tokenizer, models, pre_tokenizers, decoders, processors, trainers
+from transformers import XLMRobertaConfig, XLMRobertaModel, XLMRobertaForSequenceClassification, XLMRobertaTokenizerFast
+from FlagEmbedding import BGEM3FlagModel, FlagReranker
+
+from generic_vectorizer.strategies.onnx_runtime import OnnxBGEM3Model, OnnxReranker, export_bge_m3, export_reranker, export_once, onnx_export_dir, ONNX_MODEL_FILENAME
+
+CORPUS = [
+    "the quick brown fox jumps over the lazy dog",
+    "onnx runtime runs the exported graph on the cpu",
+    "dense and sparse vectors are compared within a tolerance",
+    "a reranker scores query and passage pairs"
+]
+
+def build_tokenizer() -> XLMRobertaTokenizerFast:
+    # tiny xlm-roberta like fast tokenizer : <s> A </s> and <s> A </s></s> B </s> for pairs
+    special_tokens = ['<s>', '<pad>', '</s>', '<unk>', '<mask>']
+    tokenizer = Tokenizer(models.Unigram())
+    tokenizer.pre_tokenizer = pre_tokenizers.Metaspace()
+    tokenizer.decoder = decoders.Metaspace()
+    tokenizer.train_from_iterator(CORPUS * 4, trainers.UnigramTrainer(vocab_size=80, special_tokens=special_tokens, unk_token='<unk>'))
+    tokenizer.post_processor = processors.TemplateProcessing(single='<s> $A </s>', pair='<s> $A </s> </s> $B </s>', special_tokens=[('<s>', 0), ('</s>', 2)])
+    return XLMRobertaTokenizerFast(tokenizer_object=tokenizer, bos_token='<s>', eos_token='</s>', sep_token='</s>', cls_token='<s>', unk_token='<unk>', pad_token='<pad>', mask_token='<mask>')
+
+def build_config(tokenizer:XLMRobertaTokenizerFast, **kwargs) -> XLMRobertaConfig:
+    return XLMRobertaConfig(vocab_size=len(tokenizer), hidden_size=32, num_hidden_layers=2, num_attention_heads=2, intermediate_size=64, max_position_embeddings=64, pad_token_id=tokenizer.pad_token_id, **kwargs)
+
+@pytest.fixture(scope='module')
+def tiny_model_dirs(tmp_path_factory):
+    import torch
+    torch.manual_seed(0)
+    tokenizer = build_tokenizer()
+    embedder_dir = str(tmp_path_factory.mktemp('tiny_bge_m3'))
+    XLMRobertaModel(build_config(tokenizer)).save_pretrained(embedder_dir)
+    tokenizer.save_pretrained(embedder_dir)
+    reranker_dir = str(tmp_path_factory.mktemp('tiny_reranker'))
+    XLMRobertaForSequenceClassification(build_config(tokenizer, num_labels=1)).save_pretrained(reranker_dir)
+    tokenizer.save_pretrained(reranker_dir)
+    return embedder_dir, reranker_dir
+
+def test_onnx_bge_m3_matches_flag_embedding(tiny_model_dirs, tmp_path):
+    flag_model = BGEM3FlagModel(model_name_or_path=tiny_model_dirs[0], use_fp16=False, device='cpu')
+    sentences = CORPUS + ['fox', 'the cpu scores the graph within a tolerance of the lazy dog']
+    expected = flag_model.encode(sentences=sentences, batch_size=3, return_dense=True, return_sparse=True)
+
+    export_bge_m3(flag_model, str(tmp_path))
+    onnx_model = OnnxBGEM3Model(str(tmp_path), intra_op_num_threads=1)
+    actual = onnx_model.encode(sentences=sentences, batch_size=4, return_dense=True, return_sparse=True)
+
+    assert actual['dense_vecs'].shape == expected['dense_vecs'].shape
+    assert np.allclose(actual['dense_vecs'], expected['dense_vecs'], atol=1e-4)
+    assert sum(len(weights) for weights in expected['lexical_weights']) > 0
+    for actual_weights, expected_weights in zip(actual['lexical_weights'], expected['lexical_weights']):
+        assert sorted(actual_weights) == sorted(expected_weights)
+        assert [ actual_weights[token] for token in expected_weights ] == pytest.approx([ float(weight) for weight in expected_weights.values() ], abs=1e-4)
+
+    assert onnx_model.encode(sentences=sentences[:2], return_dense=False, return_sparse=True)['dense_vecs'] is None
+    assert onnx_model.encode(sentences='fox', return_dense=True)['dense_vecs'].shape == (32,)
+
+def test_onnx_reranker_matches_flag_reranker(tiny_model_dirs, tmp_path):
+    flag_reranker = FlagReranker(model_name_or_path=tiny_model_dirs[1], use_fp16=False, device='cpu')
+    sentence_pairs = [ (CORPUS[0], passage) for passage in CORPUS ] + [('query', 'a passage longer than the max length of the pair ' * 4)]
+    expected = flag_reranker.compute_score(sentence_pairs, batch_size=2, max_length=24, normalize=True)
+
+    export_reranker(flag_reranker, str(tmp_path))
+    onnx_reranker = OnnxReranker(str(tmp_path), intra_op_num_threads=1)
+    assert onnx_reranker.compute_score(sentence_pairs, batch_size=3, max_length=24, normalize=True) == pytest.approx(expected, abs=1e-4)
+
+def test_export_runs_once_and_is_keyed_by_the_model(tmp_path):
+    export_dir = onnx_export_dir(str(tmp_path), 'bge_m3', {'model_name_or_path': 'BAAI/bge-m3', 'pooling_method': 'cls'})
+    assert os.path.basename(export_dir).startswith('bge_m3-BAAI--bge-m3-')
+    assert export_dir != onnx_export_dir(str(tmp_path), 'bge_m3', {'model_name_or_path': 'BAAI/bge-m3', 'pooling_method': 'mean'})
+
+    exported_dirs = []
+    def export(tmp_export_dir):
+        exported_dirs.append(tmp_export_dir)
+        open(os.path.join(tmp_export_dir, ONNX_MODEL_FILENAME), mode='w').close()
+
+    export_once(export_dir, export)
+    export_once(export_dir, export)
+    assert len(exported_dirs) == 1
+    assert os.listdir(export_dir) == [ONNX_MODEL_FILENAME]
+
+    def failing_export(tmp_export_dir):
+        raise RuntimeError('export failed')
+
+    other_export_dir = onnx_export_dir(str(tmp_path), 'reranker', {'model_name_or_path': 'BAAI/bge-reranker-v2-m3'})
+    with pytest.raises(RuntimeError):
+        export_once(other_export_dir, failing_export)
+    assert not os.path.exists(other_export_dir)  # a failed export leaves nothing behind to load
@@ -1,8 +1,9 @@
 import pytest
+import numpy as np
 from unittest.mock import Mock, patch
 from google.protobuf.message import Message
 from generic_vectorizer.strategies.reranker.flag_reranker import FlagRerankerStrategy
-from generic_vectorizer.grpc_server.interfaces.strategies_pb2 import TextRerankScoresRequest, TextRerankScoresResponse
+from generic_vectorizer.grpc_server.interfaces.strategies_pb2 import TextRerankScoresRequest, TextRerankScoresResponse, TextBatchRerankScoresRequest, TextBatchRerankScoresResponse, RerankGroup
 from generic_vectorizer.typing import FlagRerankerConfig
 
 @pytest.fixture
@@ -18,7 +19,7 @@ def test_flag_reranker_strategy_initialization(mock_flag_reranker):
     }
     strategy = FlagRerankerStrategy(options)
     
-    mock_flag_reranker.assert_called_once_with(**FlagRerankerConfig(**options).model_dump())
+    mock_flag_reranker.assert_called_once_with(**FlagRerankerConfig(**options).model_kwargs())
     assert isinstance(strategy, FlagRerankerStrategy)
 
 def test_flag_reranker_strategy_process_success(mock_flag_reranker):
@@ -47,7 +48,8 @@ def test_flag_reranker_strategy_process_success(mock_flag_reranker):
     assert isinstance(response, TextRerankScoresResponse)
     assert response.status == True
     assert response.error is ""
-    assert response.scores == pytest.approx([0.5, 0.7, 0.9], abs=1e-6)
+    # raw scores come from the model, the strategy normalizes them (cached scores stay raw)
+    assert response.scores == pytest.approx([1 / (1 + np.exp(-score)) for score in [0.5, 0.7, 0.9]], abs=1e-6)
 
     # Verify that compute_score was called correctly
     strategy.model.compute_score.assert_called_once_with(
@@ -56,7 +58,9 @@ def test_flag_reranker_strategy_process_success(mock_flag_reranker):
             ("Sample query", "Document 2"),
             ("Sample query", "Document 3")
         ],
-        normalize=True
+        batch_size=32,
+        max_length=512,
+        normalize=False
     )
 
 def test_flag_reranker_strategy_process_failure(mock_flag_reranker):
@@ -114,5 +118,81 @@ def test_flag_reranker_strategy_sentence_pairs(mock_flag_reranker, query, corpus
     # Verify that compute_score was called with the correct sentence pairs
     strategy.model.compute_score.assert_called_once_with(
         sentence_pairs=expected_pairs,
-        normalize=normalize
-    )
\ No newline at end of file
+        batch_size=32,
+        max_length=512,
+        normalize=False
+    )
+
+
+def test_flag_reranker_strategy_scores_every_group_in_one_length_sorted_call(mock_flag_reranker):
+    strategy = FlagRerankerStrategy({"model_name_or_path": "BAAI/bge-reranker-v2-m3", "batch_size": 2})
+    # the fake model scores a pair with the length of its passage
+    strategy.model.compute_score.side_effect = lambda sentence_pairs, batch_size, max_length, normalize: [ float(len(passage)) for _, passage in sentence_pairs ]
+
+    batch_request = TextBatchRerankScoresRequest(
+        groups=[RerankGroup(query="q1", corpus=["aaa", "a"]), RerankGroup(query="q2", corpus=[]), RerankGroup(query="q3", corpus=["aaaaa"])],
+        normalize=False
+    )
+    single_request = TextRerankScoresRequest(query="q4", corpus=["aa", "aaaa"], normalize=True)
+    batch_response, single_response, invalid_response = strategy.process_batch([
+        (b"RERANK_BATCH", batch_request.SerializeToString()),
+        (b"", single_request.SerializeToString()),
+        (b"RERANK_BATCH", b"invalid")
+    ])
+
+    strategy.model.compute_score.assert_called_once()
+    call = strategy.model.compute_score.call_args.kwargs
+    assert call["batch_size"] == 2 and call["normalize"] is False
+    assert [ passage for _, passage in call["sentence_pairs"] ] == ["aaaaa", "aaaa", "aaa", "aa", "a"]
+
+    assert isinstance(batch_response, TextBatchRerankScoresResponse) and batch_response.status
+    assert [ list(result.scores) for result in batch_response.results ] == [[3.0, 1.0], [], [5.0]]
+    assert isinstance(single_response, TextRerankScoresResponse)
+    assert single_response.scores == pytest.approx([1 / (1 + np.exp(-2.0)), 1 / (1 + np.exp(-4.0))], abs=1e-6)
+    assert invalid_response.status is False
+    assert strategy.stats()["scored_pairs"] == 5
+
+
+def test_flag_reranker_strategy_batch_failure(mock_flag_reranker):
+    strategy = FlagRerankerStrategy({"model_name_or_path": "BAAI/bge-reranker-v2-m3"})
+    strategy.model.compute_score.side_effect = Exception("Test error")
+    request = TextBatchRerankScoresRequest(groups=[RerankGroup(query="q", corpus=["a"])])
+    response = strategy.process(b"RERANK_BATCH", request.SerializeToString())
+    assert isinstance(response, TextBatchRerankScoresResponse)
+    assert response.status is False and response.error == "Test error"
+
+
+def test_flag_reranker_strategy_top_k_and_max_length(mock_flag_reranker):
+    strategy = FlagRerankerStrategy({"model_name_or_path": "BAAI/bge-reranker-v2-m3", "max_length": 128})
+    mock_flag_reranker.assert_called_once_with(model_name_or_path="BAAI/bge-reranker-v2-m3", device="cpu", use_fp16=True, cache_dir=None)
+    strategy.model.compute_score.side_effect = lambda sentence_pairs, batch_size, max_length, normalize: [ float(passage[-1]) for _, passage in sentence_pairs ]
+
+    request = TextRerankScoresRequest(query="q", corpus=["d3", "d9", "d1", "d9", "d5"], top_k=3)
+    response = strategy.process(b"", request.SerializeToString())
+    assert strategy.model.compute_score.call_args.kwargs["max_length"] == 128
+    assert len(response.scores) == 0
+    assert [ (hit.index, hit.score) for hit in response.hits ] == [(1, 9.0), (3, 9.0), (4, 5.0)]
+
+    groups = [RerankGroup(query="q", corpus=["d1", "d2"]), RerankGroup(query="r", corpus=["d4"])]
+    batch_response = strategy.process(b"RERANK_BATCH", TextBatchRerankScoresRequest(groups=groups, top_k=5).SerializeToString())
+    assert [ [ hit.index for hit in result.hits ] for result in batch_response.results ] == [[1, 0], [0]]
+
+
+def test_flag_reranker_strategy_score_cache(mock_flag_reranker):
+    strategy = FlagRerankerStrategy({"model_name_or_path": "BAAI/bge-reranker-v2-m3", "score_cache_size": 3})
+    strategy.model.compute_score.side_effect = lambda sentence_pairs, batch_size, max_length, normalize: [ float(len(passage)) for _, passage in sentence_pairs ]
+
+    # the repeated candidate of the request is scored once
+    first_page = strategy.process(b"", TextRerankScoresRequest(query="q", corpus=["a", "bb", "a"]).SerializeToString())
+    assert list(first_page.scores) == [1.0, 2.0, 1.0]
+    assert [ passage for _, passage in strategy.model.compute_score.call_args.kwargs["sentence_pairs"] ] == ["bb", "a"]
+
+    # the next page shares two candidates with the first one, normalization is applied on the cached raw scores
+    second_page = strategy.process(b"", TextRerankScoresRequest(query="q", corpus=["bb", "ccc", "a"], normalize=True).SerializeToString())
+    assert second_page.scores == pytest.approx([1 / (1 + np.exp(-score)) for score in [2.0, 3.0, 1.0]], abs=1e-6)
+    assert [ passage for _, passage in strategy.model.compute_score.call_args.kwargs["sentence_pairs"] ] == ["ccc"]
+
+    # same passage for another query is a different pair
+    strategy.process(b"", TextRerankScoresRequest(query="other", corpus=["a"]).SerializeToString())
+    assert strategy.model.compute_score.call_count == 3
+    assert strategy.stats() == {"scored_pairs": 4, "score_cache_hits": 2, "score_cache_misses": 4}
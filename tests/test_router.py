@@ -0,0 +1,355 @@
+import json
+import struct
+import asyncio
+
+import zmq
+
+from time import time
+
+from generic_vectorizer.grpc_server.server import GRPCServer
+from generic_vectorizer.grpc_server.metrics import LatencyWindow
+from generic_vectorizer.grpc_server.lanes import PriorityLaneQueue
+from generic_vectorizer.typing import EmbedderModelConfig, EmbedderModelType, Job
+
+INTERACTIVE, BULK = 1, 2
+
+def test_latency_window_percentiles():
+    latency = LatencyWindow(max_samples=100)
+    assert latency.percentiles()['count'] == 0
+    for index in range(200):
+        latency.observe(index / 1000)
+    stats = latency.percentiles()
+    assert stats['count'] == 200
+    assert 140 <= stats['p50_ms'] <= 160
+    assert stats['p99_ms'] >= stats['p50_ms']
+
+def test_router_dispatches_to_every_idle_worker_without_polling_delay():
+    config = EmbedderModelConfig(
+        embedder_model_type=EmbedderModelType.BGE_M3_EMBEDDING_MODEL,
+        target_topic='bge_m3',
+        options={'model_name_or_path': 'BAAI/bge-m3', 'cache_folder': '/tmp'}
+    )
+
+    async def main():
+        async with GRPCServer() as server:
+            server.topic2queue_hmap['bge_m3'] = asyncio.Queue()
+            router_task = asyncio.create_task(server.router(config, 'inproc://test_broker2router', 'inproc://test_router2worker'))
+            await asyncio.sleep(0)
+
+            workers = []
+            for _ in range(2):
+                dealer_socket = server.ctx.socket(zmq.DEALER)
+                dealer_socket.connect('inproc://test_router2worker')
+                await dealer_socket.send_multipart([b'', b'HANDSHAKE', b'', b''])
+                workers.append(dealer_socket)
+            await asyncio.sleep(0.05)
+
+            start = time()
+            for index in range(2):
+                await server.topic2queue_hmap['bge_m3'].put(Job(f'client-{index}'.encode(), b'TEXT', b'message', enqueued_at=time(), priority=1))
+            frames = await asyncio.wait_for(
+                asyncio.gather(*[ dealer_socket.recv_multipart() for dealer_socket in workers ]),
+                timeout=0.5
+            )
+            elapsed = time() - start
+
+            router_task.cancel()
+            await router_task
+            for dealer_socket in workers:
+                dealer_socket.close(linger=0)
+            return frames, elapsed, server.topic2queue_latency['bge_m3']['interactive'].percentiles()
+
+    frames, elapsed, stats = asyncio.run(main())
+    assert elapsed < 0.5
+    assert all(worker_frames[:2] == [b'', b'PROCESS'] for worker_frames in frames)
+    assert sorted(worker_frames[2] for worker_frames in frames) == [b'client-0', b'client-1']
+    assert stats['count'] == 2
+
+def test_job_frames_carry_the_deadline():
+    jobs = [Job(b'client-0', b'TEXT', b'message', deadline=123.5), Job(b'client-1', b'TEXT_BATCH', b'message')]
+    decoded_jobs = Job.from_frames([ frame for job in jobs for frame in job.to_frames() ])
+    assert decoded_jobs == jobs
+    assert decoded_jobs[0].expired(124) and not decoded_jobs[0].expired(123)
+    assert not decoded_jobs[1].expired(time())
+
+def test_router_drops_expired_and_cancelled_jobs():
+    config = EmbedderModelConfig(
+        embedder_model_type=EmbedderModelType.BGE_M3_EMBEDDING_MODEL,
+        target_topic='bge_m3',
+        max_batch_size=4,
+        options={'model_name_or_path': 'BAAI/bge-m3', 'cache_folder': '/tmp'}
+    )
+
+    async def main():
+        async with GRPCServer() as server:
+            server.topic2queue_hmap['bge_m3'] = asyncio.Queue()
+            router_task = asyncio.create_task(server.router(config, 'inproc://test_broker2router_expired', 'inproc://test_router2worker_expired'))
+            await asyncio.sleep(0)
+
+            cancelled_job = Job(b'cancelled', b'TEXT', b'message')
+            cancelled_job.cancelled = True
+            for job in [Job(b'expired', b'TEXT', b'message', deadline=time() - 1), cancelled_job, Job(b'live', b'TEXT', b'message', deadline=time() + 10)]:
+                await server.topic2queue_hmap['bge_m3'].put(job)
+
+            dealer_socket = server.ctx.socket(zmq.DEALER)
+            dealer_socket.connect('inproc://test_router2worker_expired')
+            await dealer_socket.send_multipart([b'', b'HANDSHAKE', b'', b''])
+            frames = await asyncio.wait_for(dealer_socket.recv_multipart(), timeout=0.5)
+
+            router_task.cancel()
+            await router_task
+            dealer_socket.close(linger=0)
+            return frames, server.topic2dropped['bge_m3']
+
+    frames, nb_dropped = asyncio.run(main())
+    assert [ job.client_id for job in Job.from_frames(frames[2:]) ] == [b'live']
+    assert nb_dropped == 2
+
+def test_router_survives_malformed_messages_and_failing_batches():
+    config = EmbedderModelConfig(
+        embedder_model_type=EmbedderModelType.BGE_M3_EMBEDDING_MODEL,
+        target_topic='bge_m3',
+        options={'model_name_or_path': 'BAAI/bge-m3', 'cache_folder': '/tmp'}
+    )
+
+    async def main():
+        async with GRPCServer() as server:
+            server.topic2queue_hmap['bge_m3'] = PriorityLaneQueue(lane2weight={INTERACTIVE: 8, BULK: 1}, default_lane=BULK)
+            puller_socket = server.ctx.socket(zmq.PULL)
+            puller_socket.bind('inproc://test_broker2router_resilient')
+            router_task = asyncio.create_task(server.router(config, 'inproc://test_broker2router_resilient', 'inproc://test_router2worker_resilient'))
+            await asyncio.sleep(0)
+
+            dealer_socket = server.ctx.socket(zmq.DEALER)
+            dealer_socket.connect('inproc://test_router2worker_resilient')
+            await dealer_socket.send_multipart([b'', b'RESPONSE', b'truncated'])
+            await dealer_socket.send_multipart([b'', b'METRICS', b'', b'not json'])
+            await dealer_socket.send_multipart([b'', b'HANDSHAKE', b'', b''])
+            await asyncio.sleep(0.05)
+
+            # a job the router can not dispatch is answered with an error, the router keeps running
+            server.topic2queue_hmap['bge_m3'].put_nowait(Job(b'broken', b'TEXT', b'message', enqueued_at=time(), trace=b'not json'))
+            error_frames = await asyncio.wait_for(puller_socket.recv_multipart(), timeout=0.5)
+
+            server.topic2queue_hmap['bge_m3'].put_nowait(Job(b'live', b'TEXT', b'message', enqueued_at=time(), priority=5))
+            frames = await asyncio.wait_for(dealer_socket.recv_multipart(), timeout=0.5)
+
+            router_task.cancel()
+            await router_task
+            dealer_socket.close(linger=0)
+            puller_socket.close(linger=0)
+            return error_frames, frames, server.topic2queue_latency['bge_m3']
+
+    error_frames, frames, lane2queue_latency = asyncio.run(main())
+    assert error_frames[:2] == [b'broken', b'']
+    assert error_frames[2].startswith(b'INTERNAL-ERROR:')
+    assert [ job.client_id for job in Job.from_frames(frames[2:]) ] == [b'live']
+    assert list(lane2queue_latency.keys()) == ['bulk']  # unknown priorities are reported under the lane they were queued in
+
+def test_router_sends_responses_directly_to_the_client_socket():
+    config = EmbedderModelConfig(
+        embedder_model_type=EmbedderModelType.BGE_M3_EMBEDDING_MODEL,
+        target_topic='bge_m3',
+        options={'model_name_or_path': 'BAAI/bge-m3', 'cache_folder': '/tmp'}
+    )
+    socket_id, correlation_id = b'client-socket', (42).to_bytes(8, byteorder='big')
+
+    async def main():
+        async with GRPCServer() as server:
+            assert server.split_client_id(socket_id + correlation_id) == (socket_id, correlation_id)
+            server.topic2queue_hmap['bge_m3'] = asyncio.Queue()
+            client_router_socket = server.ctx.socket(zmq.ROUTER)
+            client_router_socket.bind('inproc://test_client2broker_direct')
+            client_dealer_socket = server.ctx.socket(zmq.DEALER)
+            client_dealer_socket.setsockopt(zmq.IDENTITY, socket_id)
+            client_dealer_socket.connect('inproc://test_client2broker_direct')
+            await client_dealer_socket.send_multipart([b'', b'HELLO'])  # makes the routing id known to the router socket
+            await client_router_socket.recv_multipart()
+
+            router_task = asyncio.create_task(server.router(config, 'inproc://test_broker2router_direct', 'inproc://test_router2worker_direct', client_router_socket))
+            await asyncio.sleep(0)
+            worker_socket = server.ctx.socket(zmq.DEALER)
+            worker_socket.connect('inproc://test_router2worker_direct')
+            payload = b'\x01' * 100_000
+            await worker_socket.send_multipart([b'', b'RESPONSE', socket_id + correlation_id, b'', payload])
+            frames = await asyncio.wait_for(client_dealer_socket.recv_multipart(), timeout=0.5)
+
+            router_task.cancel()
+            await router_task
+            for zmq_socket in (worker_socket, client_dealer_socket, client_router_socket):
+                zmq_socket.close(linger=0)
+            return frames, payload
+
+    frames, payload = asyncio.run(main())
+    assert frames == [b'', correlation_id, b'', payload]
+
+def test_router_forgets_dead_workers_and_fails_their_jobs():
+    config = EmbedderModelConfig(
+        embedder_model_type=EmbedderModelType.STUB_MODEL,
+        target_topic='stub',
+        max_batch_size=2,
+        options={}
+    )
+
+    async def main():
+        async with GRPCServer() as server:
+            server.topic2queue_hmap['stub'] = asyncio.Queue()
+            puller_socket = server.ctx.socket(zmq.PULL)
+            puller_socket.bind('inproc://test_broker2router_dead')
+            router_task = asyncio.create_task(server.router(config, 'inproc://test_broker2router_dead', 'inproc://test_router2worker_dead'))
+            await asyncio.sleep(0)
+
+            def connect_worker(worker_id):
+                dealer_socket = server.ctx.socket(zmq.DEALER)
+                dealer_socket.setsockopt(zmq.IDENTITY, worker_id)
+                dealer_socket.connect('inproc://test_router2worker_dead')
+                return dealer_socket
+
+            supervisor_socket = server.ctx.socket(zmq.DEALER)
+            supervisor_socket.connect('inproc://test_router2worker_dead')
+            busy_worker, idle_worker = connect_worker(b'worker-000'), connect_worker(b'worker-001')
+            restarted_worker = None
+            try:
+                await busy_worker.send_multipart([b'', b'HANDSHAKE', b'', b''])
+                await asyncio.sleep(0.05)
+                await idle_worker.send_multipart([b'', b'HANDSHAKE', b'', b''])
+                for client_id in [b'answered', b'lost']:
+                    await server.topic2queue_hmap['stub'].put(Job(client_id, b'TEXT', b'message', enqueued_at=time()))
+                frames = await asyncio.wait_for(busy_worker.recv_multipart(), timeout=0.5)
+                assert [ job.client_id for job in Job.from_frames(frames[2:]) ] == [b'answered', b'lost']
+
+                # the busy worker answers one job then dies, the idle one dies too
+                await busy_worker.send_multipart([b'', b'RESPONSE', b'answered', b'', b'embedding'])
+                answered_frames = await asyncio.wait_for(puller_socket.recv_multipart(), timeout=0.5)
+                for worker_id in [b'worker-000', b'worker-001']:
+                    await supervisor_socket.send_multipart([b'', b'WORKER-DEAD', worker_id, b'{"exitcode": -9, "restarts": 0}'])
+                lost_frames = await asyncio.wait_for(puller_socket.recv_multipart(), timeout=0.5)
+                busy_worker.close(linger=0)
+                idle_worker.close(linger=0)
+                await asyncio.sleep(0.05)
+
+                # nothing is dispatched to the dead workers, the restarted one takes over its identity
+                await server.topic2queue_hmap['stub'].put(Job(b'after-restart', b'TEXT', b'message', enqueued_at=time()))
+                await asyncio.sleep(0.05)
+                restarted_worker = connect_worker(b'worker-001')
+                await restarted_worker.send_multipart([b'', b'HANDSHAKE', b'', b''])
+                restarted_frames = await asyncio.wait_for(restarted_worker.recv_multipart(), timeout=0.5)
+            finally:
+                router_task.cancel()
+                await router_task
+                for zmq_socket in (busy_worker, idle_worker, restarted_worker, supervisor_socket, puller_socket):
+                    if zmq_socket is not None:
+                        zmq_socket.close(linger=0)
+            return answered_frames, lost_frames, restarted_frames, server.metrics.render()
+
+    answered_frames, lost_frames, restarted_frames, rendered_metrics = asyncio.run(main())
+    assert answered_frames == [b'answered', b'', b'embedding']
+    assert lost_frames[0] == b'lost'
+    assert lost_frames[2].startswith(b'INTERNAL-ERROR:worker worker-000 died')
+    assert [ job.client_id for job in Job.from_frames(restarted_frames[2:]) ] == [b'after-restart']
+    assert 'vectorizer_worker_crashes_total{topic="stub"} 2' in rendered_metrics
+
+
+def test_router_retires_workers_after_their_batch_and_reports_load():
+    config = EmbedderModelConfig(
+        embedder_model_type=EmbedderModelType.STUB_MODEL,
+        target_topic='stub',
+        max_batch_size=1,
+        options={}
+    )
+
+    async def main():
+        async with GRPCServer() as server:
+            server.topic2queue_hmap['stub'] = asyncio.Queue()
+            puller_socket = server.ctx.socket(zmq.PULL)
+            puller_socket.bind('inproc://test_broker2router_retire')
+            router_task = asyncio.create_task(server.router(config, 'inproc://test_broker2router_retire', 'inproc://test_router2worker_retire'))
+            await asyncio.sleep(0)
+
+            def connect(identity):
+                dealer_socket = server.ctx.socket(zmq.DEALER)
+                dealer_socket.setsockopt(zmq.IDENTITY, identity)
+                dealer_socket.connect('inproc://test_router2worker_retire')
+                return dealer_socket
+
+            busy_worker, idle_worker, autoscaler_socket = connect(b'worker-000'), connect(b'worker-001'), connect(b'autoscaler')
+            try:
+                await busy_worker.send_multipart([b'', b'HANDSHAKE', b'', b''])
+                await asyncio.sleep(0.05)
+                await server.topic2queue_hmap['stub'].put(Job(b'in-flight', b'TEXT', b'message', enqueued_at=time()))
+                busy_frames = await asyncio.wait_for(busy_worker.recv_multipart(), timeout=0.5)
+                await idle_worker.send_multipart([b'', b'HANDSHAKE', b'', b''])
+                await asyncio.sleep(0.05)
+
+                await autoscaler_socket.send_multipart([b'', b'LOAD-REPORT', b'', b''])
+                load_frames = await asyncio.wait_for(autoscaler_socket.recv_multipart(), timeout=0.5)
+
+                # both workers are retired : the idle one right away, the busy one once its job is answered
+                for worker_id in [b'worker-000', b'worker-001']:
+                    await autoscaler_socket.send_multipart([b'', b'RETIRE', worker_id, b''])
+                idle_frames = await asyncio.wait_for(idle_worker.recv_multipart(), timeout=0.5)
+                await busy_worker.send_multipart([b'', b'RESPONSE', b'in-flight', b'', b'embedding'])
+                response_frames = await asyncio.wait_for(puller_socket.recv_multipart(), timeout=0.5)
+                await busy_worker.send_multipart([b'', b'HANDSHAKE', b'', b''])
+                retired_frames = await asyncio.wait_for(busy_worker.recv_multipart(), timeout=0.5)
+
+                # no worker is left to take new jobs
+                await server.topic2queue_hmap['stub'].put(Job(b'queued', b'TEXT', b'message', enqueued_at=time()))
+                await asyncio.sleep(0.05)
+                nb_pending = [ await busy_worker.poll(timeout=0), await idle_worker.poll(timeout=0) ]
+                nb_workers = server.topic2nb_workers['stub']
+            finally:
+                router_task.cancel()
+                await router_task
+                for zmq_socket in (busy_worker, idle_worker, autoscaler_socket, puller_socket):
+                    zmq_socket.close(linger=0)
+            return busy_frames, load_frames, idle_frames, response_frames, retired_frames, nb_pending, nb_workers
+
+    busy_frames, load_frames, idle_frames, response_frames, retired_frames, nb_pending, nb_workers = asyncio.run(main())
+    assert busy_frames[1] == b'PROCESS'
+    assert load_frames[1] == b'LOAD-REPORT'
+    load_report = json.loads(load_frames[2])
+    assert (load_report['queue_depth'], load_report['idle'], load_report['busy']) == (0, 1, 1)
+    assert load_report['busy_seconds'] > 0
+    assert idle_frames == [b'', b'RETIRE']
+    assert response_frames == [b'in-flight', b'', b'embedding']
+    assert retired_frames == [b'', b'RETIRE']
+    assert nb_pending == [0, 0]
+    assert nb_workers == 0
+
+
+def test_broker_survives_malformed_client_messages():
+    async def main():
+        async with GRPCServer() as server:
+            server.topic2queue_hmap['bge_m3'] = PriorityLaneQueue(lane2weight={INTERACTIVE: 8, BULK: 1}, default_lane=BULK)
+            router_socket = server.ctx.socket(zmq.ROUTER)
+            router_socket.bind('inproc://test_client2broker_malformed')
+            broker_task = asyncio.create_task(server.broker(router_socket, 'inproc://test_broker2router_malformed'))
+            await asyncio.sleep(0)
+
+            dealer_socket = server.ctx.socket(zmq.DEALER)
+            dealer_socket.connect('inproc://test_client2broker_malformed')
+            try:
+                await dealer_socket.send_multipart([b'', b'short-deadline', b'bge_m3', b'TEXT', b'\x00', b'\x01', b'', b'message'])
+                await dealer_socket.send_multipart([b'', b'missing-frames', b'bge_m3', b'TEXT'])
+                await dealer_socket.send_multipart([b''])
+                short_deadline_frames = await asyncio.wait_for(dealer_socket.recv_multipart(), timeout=0.5)
+                missing_frames = await asyncio.wait_for(dealer_socket.recv_multipart(), timeout=0.5)
+
+                # the broker is still running : a valid request is queued
+                await dealer_socket.send_multipart([b'', b'valid', b'bge_m3', b'TEXT', struct.pack('>d', time() + 5), b'\x01', b'', b'message'])
+                job = await asyncio.wait_for(server.topic2queue_hmap['bge_m3'].get(), timeout=0.5)
+                broker_running = not broker_task.done()
+            finally:
+                broker_task.cancel()
+                await broker_task
+                dealer_socket.close(linger=0)
+            return short_deadline_frames, missing_frames, job, broker_running, server.metrics.render()
+
+    short_deadline_frames, missing_frames, job, broker_running, rendered_metrics = asyncio.run(main())
+    assert short_deadline_frames[:3] == [b'', b'short-deadline', b'']
+    assert short_deadline_frames[3].startswith(b'INTERNAL-ERROR:malformed request')
+    assert missing_frames[1] == b'missing-frames' and missing_frames[3].startswith(b'INTERNAL-ERROR:malformed request')
+    assert job.client_id.endswith(b'valid') and job.message == b'message'
+    assert broker_running
+    assert 'vectorizer_malformed_messages_total{source="client"} 3' in rendered_metrics
@@ -0,0 +1,300 @@
+import grpc
+import asyncio
+
+from generic_vectorizer.grpc_server.interfaces import strategies_pb2, strategies_pb2_grpc
+from generic_vectorizer.grpc_server.servicer.text_embedding import TextEmbeddingServicer
+from generic_vectorizer.grpc_server.admission import AdmissionController
+from generic_vectorizer.grpc_server.cache import EmbeddingCache
+from generic_vectorizer.typing import EmbedderModelConfig, EmbedderModelType, EmbeddingCacheConfig
+from generic_vectorizer.tracing import Trace
+from generic_vectorizer.client import AsyncEmbeddingClient
+from generic_vectorizer.strategies import StubStrategy
+
+class FakeBrokerClient:
+    # answers like a worker would : the dense vector of a text is its length
+    def __init__(self, delay:float=0.0):
+        self.delay = delay
+        self.requests = []
+
+    async def request(self, target_topic, task_type, encoded_req, deadline=0.0, priority=0, trace=None):
+        self.requests.append((task_type, encoded_req))
+        await asyncio.sleep(self.delay)
+        if task_type == b'TEXT':
+            plain_req = strategies_pb2.TextEmbeddingRequest()
+            plain_req.ParseFromString(encoded_req)
+            plain_res = strategies_pb2.TextEmbeddingResponse(status=True, embedding=strategies_pb2.Embedding(dense_values=[len(plain_req.text)]))
+        else:
+            plain_req = strategies_pb2.TextBatchEmbeddingRequest()
+            plain_req.ParseFromString(encoded_req)
+            plain_res = strategies_pb2.TextBatchEmbeddingResponse(status=True, embeddings=[ strategies_pb2.Embedding(dense_values=[len(text)]) for text in plain_req.texts ])
+        if trace is not None:
+            trace.merge(Trace.annotate(trace.encode(), marks={'enqueued': trace.marks['admitted'], 'dispatched': trace.marks['admitted']}, durations={'encode': 0.001}))
+            trace.mark('response_received')
+        return plain_res.SerializeToString()
+
+class FakeContext:
+    def __init__(self, metadata=()):
+        self.metadata = metadata
+
+    def time_remaining(self):
+        return None
+
+    def invocation_metadata(self):
+        return self.metadata
+
+    async def abort(self, code, details):
+        raise RuntimeError(f'{code}:{details}')
+
+def make_servicer(broker_client, max_concurrent_requests=100, max_queue_depth=0, **kwargs):
+    config = EmbedderModelConfig(
+        embedder_model_type=EmbedderModelType.BGE_M3_EMBEDDING_MODEL,
+        target_topic='bge_m3',
+        max_queue_depth=max_queue_depth,
+        options={'model_name_or_path': 'BAAI/bge-m3', 'cache_folder': '/tmp'}
+    )
+    admission = AdmissionController([config], max_concurrent_requests, {'bge_m3': asyncio.Queue()}, {})
+    return TextEmbeddingServicer(broker_client=broker_client, admission=admission, **kwargs)
+
+def test_timings_are_returned_on_demand():
+    async def main():
+        servicer = make_servicer(FakeBrokerClient())
+        request = strategies_pb2.TextEmbeddingRequest(target_topic='bge_m3', text='hello', return_dense=True)
+        untimed_res = await servicer.getTextEmbedding(request, FakeContext())
+        request.return_timings = True
+        timed_res = await servicer.getTextEmbedding(request, FakeContext())
+        return untimed_res, timed_res
+
+    untimed_res, timed_res = asyncio.run(main())
+    assert list(untimed_res.embedding.dense_values) == [5]
+    assert len(untimed_res.timings_ms) == 0
+    assert list(timed_res.embedding.dense_values) == [5]
+    assert {'admission', 'queue', 'parse', 'total', 'worker.encode'} <= set(timed_res.timings_ms.keys())
+    assert timed_res.timings_ms['worker.encode'] == 1.0
+
+def test_sampled_traces_are_exported():
+    class MemoryExporter:
+        def __init__(self):
+            self.traces = []
+
+        def export(self, trace, attributes=None):
+            self.traces.append((trace, attributes))
+
+    async def main(exporter, sample_ratio, metadata=()):
+        servicer = make_servicer(FakeBrokerClient(), trace_exporter=exporter, trace_sample_ratio=sample_ratio)
+        request = strategies_pb2.TextBatchEmbeddingRequest(target_topic='bge_m3', texts=['a', 'bb'], return_dense=True)
+        return await servicer.getTextBatchEmbedding(request, FakeContext(metadata))
+
+    exporter = MemoryExporter()
+    plain_res = asyncio.run(main(exporter, 1.0))
+    assert len(plain_res.timings_ms) == 0  # exported, not returned
+    asyncio.run(main(exporter, 0.0))
+    asyncio.run(main(exporter, 0.0, metadata=(('traceparent', '00-0af7651916cd43dd8448eb211c80319c-b7ad6b7169203331-01'),)))
+    assert len(exporter.traces) == 2
+    assert exporter.traces[0][1] == {'target_topic': 'bge_m3', 'status': 'True'}
+    assert exporter.traces[1][0].trace_id == '0af7651916cd43dd8448eb211c80319c'
+
+def test_unknown_priorities_fall_back_to_the_rpc_default():
+    servicer = make_servicer(FakeBrokerClient())
+    assert servicer._priority(strategies_pb2.Priority.DEFAULT_PRIORITY, strategies_pb2.Priority.BULK) == strategies_pb2.Priority.BULK
+    assert servicer._priority(strategies_pb2.Priority.INTERACTIVE, strategies_pb2.Priority.BULK) == strategies_pb2.Priority.INTERACTIVE
+    assert servicer._priority(5, strategies_pb2.Priority.INTERACTIVE) == strategies_pb2.Priority.INTERACTIVE
+
+class StubBrokerClient(FakeBrokerClient):
+    def __init__(self):
+        super().__init__()
+        self.strategy = StubStrategy({'dimension': 4})
+
+    async def request(self, target_topic, task_type, encoded_req, deadline=0.0, priority=0, trace=None):
+        self.requests.append((task_type, encoded_req, priority))
+        return self.strategy.process(task_type, encoded_req).SerializeToString()
+
+def test_batch_rerank_forwards_every_group_in_one_job():
+    async def main():
+        broker_client = StubBrokerClient()
+        servicer = make_servicer(broker_client)
+        groups = [ strategies_pb2.RerankGroup(query='q1', corpus=['a', 'b']), strategies_pb2.RerankGroup(query='q2', corpus=['c']) ]
+        batch_res = await servicer.getTextBatchRerankScores(strategies_pb2.TextBatchRerankScoresRequest(target_topic='bge_m3', groups=groups), FakeContext())
+        single_res = await servicer.getTextRerankScores(strategies_pb2.TextRerankScoresRequest(target_topic='bge_m3', query='q1', corpus=['a', 'b']), FakeContext())
+        return broker_client.requests, batch_res, single_res
+
+    requests, batch_res, single_res = asyncio.run(main())
+    assert [ (task_type, priority) for task_type, _, priority in requests ] == [(b'RERANK_BATCH', strategies_pb2.Priority.INTERACTIVE), (b'', strategies_pb2.Priority.INTERACTIVE)]
+    assert batch_res.status
+    assert [ len(result.scores) for result in batch_res.results ] == [2, 1]
+    assert list(batch_res.results[0].scores) == list(single_res.scores)
+
+async def collect(async_iterator):
+    return [ item async for item in async_iterator ]
+
+def make_stream_requests(texts, read_ids=None):
+    async def request_iterator():
+        for index, text in enumerate(texts):
+            if read_ids is not None:
+                read_ids.append(index)
+            yield strategies_pb2.TextStreamEmbeddingRequest(
+                request_id=f'id-{index}',
+                request=strategies_pb2.TextEmbeddingRequest(target_topic='bge_m3', text=text, return_dense=True)
+            )
+    return request_iterator()
+
+class ExpiredBrokerClient:
+    async def request(self, target_topic, task_type, encoded_req, deadline=0.0, priority=0, trace=None):
+        return b'DEADLINE-EXCEEDED:request has exceeded its deadline'
+
+class ExpiredContext(FakeContext):
+    def time_remaining(self):
+        return -0.1
+
+def test_rejected_requests_are_aborted_with_resource_exhausted():
+    async def main():
+        servicer = make_servicer(FakeBrokerClient(delay=0.05), max_queue_depth=1)
+        request = strategies_pb2.TextEmbeddingRequest(target_topic='bge_m3', text='hello', return_dense=True)
+        admitted_task = asyncio.create_task(servicer.getTextEmbedding(request, FakeContext()))
+        await asyncio.sleep(0.01)
+        servicer.admission.topic2queue_hmap['bge_m3'].put_nowait(None)  # the admitted request is queued
+        try:
+            await servicer.getTextEmbedding(request, FakeContext())
+        except RuntimeError as e:
+            error = str(e)
+        servicer.admission.topic2queue_hmap['bge_m3'].get_nowait()
+        admitted_res = await admitted_task
+        return error, admitted_res.status, servicer.admission.topic2semaphore['bge_m3']._value, servicer.admission.stats()['bge_m3']['rejections']
+
+    error, admitted_status, free_slots, rejections = asyncio.run(main())
+    assert error.startswith(f'{grpc.StatusCode.RESOURCE_EXHAUSTED}:')
+    assert admitted_status
+    assert free_slots == 70  # the rejected request never held a slot
+    assert rejections == 1
+
+def test_expired_requests_are_aborted_with_deadline_exceeded():
+    async def main():
+        servicer = make_servicer(ExpiredBrokerClient())
+        free_slots = servicer.admission.topic2semaphore['bge_m3']._value
+        request = strategies_pb2.TextEmbeddingRequest(target_topic='bge_m3', text='hello', return_dense=True)
+        try:
+            await servicer.getTextEmbedding(request, ExpiredContext())
+        except RuntimeError as e:
+            return str(e), servicer.admission.topic2semaphore['bge_m3']._value == free_slots
+
+    error, slot_released = asyncio.run(main())
+    assert error.startswith(f'{grpc.StatusCode.DEADLINE_EXCEEDED}:')
+    assert slot_released
+
+def test_batch_only_forwards_unique_missing_texts(tmp_path):
+    async def main():
+        broker_client = FakeBrokerClient()
+        cache = EmbeddingCache(EmbeddingCacheConfig(disk_path=str(tmp_path / 'embeddings.sqlite')))
+        servicer = make_servicer(broker_client, cache=cache)
+        warmup_res = await servicer.getTextBatchEmbedding(strategies_pb2.TextBatchEmbeddingRequest(target_topic='bge_m3', texts=['bb', 'dddd'], return_dense=True), FakeContext())
+        assert warmup_res.status
+
+        request = strategies_pb2.TextBatchEmbeddingRequest(target_topic='bge_m3', texts=['a', 'bb', 'a', 'ccc', 'dddd', 'ccc', 'a'], return_dense=True)
+        plain_res = await servicer.getTextBatchEmbedding(request, FakeContext())
+        cache.close()
+        return broker_client.requests, plain_res
+
+    requests, plain_res = asyncio.run(main())
+    assert len(requests) == 2
+    forwarded_req = strategies_pb2.TextBatchEmbeddingRequest()
+    forwarded_req.ParseFromString(requests[1][1])
+    assert list(forwarded_req.texts) == ['a', 'ccc']
+    assert plain_res.status
+    assert [ embedding.dense_values[0] for embedding in plain_res.embeddings ] == [1, 2, 1, 3, 4, 3, 1]
+
+def test_batch_cache_hits_survive_a_restart(tmp_path):
+    disk_path = str(tmp_path / 'embeddings.sqlite')
+    request = strategies_pb2.TextBatchEmbeddingRequest(target_topic='bge_m3', texts=['a', 'bb'], return_dense=True)
+
+    async def embed(broker_client):
+        cache = EmbeddingCache(EmbeddingCacheConfig(disk_path=disk_path))
+        plain_res = await make_servicer(broker_client, cache=cache).getTextBatchEmbedding(request, FakeContext())
+        stats = cache.stats()
+        cache.close()  # flushes the pending writes
+        return plain_res, stats
+
+    first_broker_client, second_broker_client = FakeBrokerClient(), FakeBrokerClient()
+    asyncio.run(embed(first_broker_client))
+    plain_res, stats = asyncio.run(embed(second_broker_client))
+    assert len(first_broker_client.requests) == 1
+    assert len(second_broker_client.requests) == 0
+    assert stats['disk_hits'] == 2
+    assert [ embedding.dense_values[0] for embedding in plain_res.embeddings ] == [1, 2]
+
+def test_stream_answers_every_request_and_releases_its_slots():
+    async def main():
+        servicer = make_servicer(FakeBrokerClient(delay=0.001))
+        texts = [ 'x' * index for index in range(1, 21) ]
+        stream_responses = await collect(servicer.streamTextEmbeddings(make_stream_requests(texts), FakeContext()))
+        return servicer, stream_responses
+
+    servicer, stream_responses = asyncio.run(main())
+    assert sorted((stream_res.request_id, stream_res.response.embedding.dense_values[0]) for stream_res in stream_responses) == sorted((f'id-{index}', index + 1) for index in range(20))
+    assert servicer.admission.topic2semaphore['bge_m3']._value == 70
+
+def test_stream_stops_reading_a_client_that_does_not_read_its_responses():
+    async def main():
+        servicer = make_servicer(FakeBrokerClient(), max_concurrent_requests=3)  # 2 slots for the topic
+        read_ids = []
+        stream_responses = servicer.streamTextEmbeddings(make_stream_requests([ 'text' ] * 50, read_ids), FakeContext())
+        first_response = await stream_responses.__anext__()
+        await asyncio.sleep(0.05)  # the client is slow : only the slots of unread responses were consumed
+        nb_read_while_stalled = len(read_ids)
+        remaining_responses = await collect(stream_responses)
+        return servicer, first_response, nb_read_while_stalled, remaining_responses
+
+    servicer, first_response, nb_read_while_stalled, remaining_responses = asyncio.run(main())
+    assert first_response.response.status
+    assert nb_read_while_stalled <= 4
+    assert len(remaining_responses) == 49
+    assert servicer.admission.topic2semaphore['bge_m3']._value == 2
+
+def test_abandoned_stream_releases_its_slots():
+    async def main():
+        servicer = make_servicer(FakeBrokerClient(delay=0.01), max_concurrent_requests=10)
+        stream_responses = servicer.streamTextEmbeddings(make_stream_requests([ 'text' ] * 20), FakeContext())
+        await stream_responses.__anext__()
+        await stream_responses.aclose()
+        await asyncio.sleep(0.05)  # cancelled tasks release their slots from their done callbacks
+        return servicer
+
+    servicer = asyncio.run(main())
+    assert servicer.admission.topic2semaphore['bge_m3']._value == 7
+
+def test_stream_batch_embedding_splits_the_batch():
+    async def main():
+        broker_client = FakeBrokerClient()
+        servicer = make_servicer(broker_client)
+        request = strategies_pb2.TextBatchEmbeddingRequest(target_topic='bge_m3', texts=['a', 'bb', 'ccc'], return_dense=True, chunk_size=64)
+        return broker_client, await collect(servicer.streamTextBatchEmbedding(request, FakeContext()))
+
+    broker_client, stream_responses = asyncio.run(main())
+    assert sorted((stream_res.request_id, stream_res.response.embedding.dense_values[0]) for stream_res in stream_responses) == [('0', 1), ('1', 2), ('2', 3)]
+    assert { task_type for task_type, _ in broker_client.requests } == {b'TEXT'}
+    forwarded_req = strategies_pb2.TextEmbeddingRequest()
+    forwarded_req.ParseFromString(broker_client.requests[0][1])
+    assert forwarded_req.chunk_size == 64 and forwarded_req.priority == strategies_pb2.Priority.BULK
+
+def test_client_stream_iterators():
+    async def main():
+        server = grpc.aio.server()
+        strategies_pb2_grpc.add_TextEmbeddingServicer_to_server(make_servicer(FakeBrokerClient()), server)
+        port = server.add_insecure_port('127.0.0.1:0')
+        await server.start()
+        try:
+            client = AsyncEmbeddingClient(f'127.0.0.1:{port}')
+
+            async def async_texts():
+                for index in range(3):
+                    yield f'async-{index}', 'y' * (index + 1)
+
+            sync_results = await collect(client.stream_embeddings([('a', 'x'), ('b', 'xx')], target_topic='bge_m3'))
+            async_results = await collect(client.stream_embeddings(async_texts(), target_topic='bge_m3'))
+            batch_results = await collect(client.stream_batch_embedding(['x', 'xxx'], target_topic='bge_m3'))
+        finally:
+            await server.stop(grace=None)
+        return sync_results, async_results, batch_results
+
+    sync_results, async_results, batch_results = asyncio.run(main())
+    assert sorted((request_id, result['dense']) for request_id, result in sync_results) == [('a', [1.0]), ('b', [2.0])]
+    assert sorted((request_id, result['dense']) for request_id, result in async_results) == [ (f'async-{index}', [float(index + 1)]) for index in range(3) ]
+    assert sorted((position, result['dense']) for position, result in batch_results) == [(0, [1.0]), (1, [3.0])]
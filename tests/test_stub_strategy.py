@@ -0,0 +1,82 @@
+import pytest
+import numpy as np
+from time import perf_counter
+from unittest.mock import patch
+from pydantic import ValidationError
+
+from generic_vectorizer.strategies import StubStrategy
+from generic_vectorizer.typing import StubModelConfig
+from generic_vectorizer.codec import decode_dense
+from generic_vectorizer.grpc_server.interfaces.strategies_pb2 import TextEmbeddingRequest, TextBatchEmbeddingRequest, TextRerankScoresRequest, TextBatchRerankScoresRequest, RerankGroup, DenseEncoding, SparseFormat
+
+def embed(strategy, text, **kwargs):
+    request = TextEmbeddingRequest(text=text, return_dense=True, **kwargs)
+    return strategy.process(b'TEXT', request.SerializeToString())
+
+def test_stub_config_validation():
+    with pytest.raises(ValidationError):
+        StubModelConfig(dimension=0)
+    with pytest.raises(ValidationError):
+        StubModelConfig(delay_ms=-1)
+
+def test_vectors_are_deterministic():
+    strategy = StubStrategy({'dimension': 16})
+    response = embed(strategy, 'hello')
+    assert response.status
+    assert len(response.embedding.dense_values) == 16
+    assert np.linalg.norm(response.embedding.dense_values) == pytest.approx(1.0, abs=1e-5)
+    assert list(embed(StubStrategy({'dimension': 16}), 'hello').embedding.dense_values) == list(response.embedding.dense_values)
+    assert list(embed(strategy, 'other').embedding.dense_values) != list(response.embedding.dense_values)
+    assert list(embed(StubStrategy({'dimension': 16, 'seed': 1}), 'hello').embedding.dense_values) != list(response.embedding.dense_values)
+
+def test_encodings_and_sparse_formats():
+    strategy = StubStrategy({'dimension': 32, 'nb_sparse_tokens': 8})
+    float_list = np.array(embed(strategy, 'hello').embedding.dense_values, dtype=np.float32)
+    float16 = decode_dense(embed(strategy, 'hello', dense_encoding=DenseEncoding.FLOAT16).embedding)
+    assert np.allclose(float16, float_list, atol=1e-3)
+
+    weight_map = embed(strategy, 'hello', return_sparse=True).embedding.sparse_values
+    token_arrays = embed(strategy, 'hello', return_sparse=True, sparse_format=SparseFormat.TOKEN_ID_ARRAYS).embedding
+    assert 0 < len(weight_map) <= 8
+    assert sorted(weight_map.keys()) == sorted(str(token_id) for token_id in token_arrays.sparse_indices)
+
+def test_batch_and_rerank():
+    strategy = StubStrategy({'dimension': 8})
+    batch_response = strategy.process(b'TEXT_BATCH', TextBatchEmbeddingRequest(texts=['a', 'b', 'a'], return_dense=True).SerializeToString())
+    assert len(batch_response.embeddings) == 3
+    assert list(batch_response.embeddings[0].dense_values) == list(batch_response.embeddings[2].dense_values)
+
+    rerank_response = strategy.process(b'', TextRerankScoresRequest(query='q', corpus=['a', 'b']).SerializeToString())
+    assert rerank_response.status
+    assert len(rerank_response.scores) == 2
+    assert all(0 <= score < 1 for score in rerank_response.scores)
+    assert strategy.stats()['encoded_texts'] == 5
+
+    groups = [ RerankGroup(query='q', corpus=['a', 'b']), RerankGroup(query='r', corpus=['a']) ]
+    batch_rerank_response = strategy.process(b'RERANK_BATCH', TextBatchRerankScoresRequest(groups=groups).SerializeToString())
+    assert [ list(result.scores) for result in batch_rerank_response.results ][0] == list(rerank_response.scores)
+    assert len(batch_rerank_response.results[1].scores) == 1
+    assert strategy.stats()['encoded_texts'] == 8
+
+    top_k_response = strategy.process(b'', TextRerankScoresRequest(query='q', corpus=['a', 'b'], top_k=1).SerializeToString())
+    best_index = int(np.argmax(rerank_response.scores))
+    assert len(top_k_response.scores) == 0
+    assert [ (hit.index, hit.score) for hit in top_k_response.hits ] == [(best_index, rerank_response.scores[best_index])]
+
+def test_delay_is_paid_once_per_micro_batch():
+    strategy = StubStrategy({'dimension': 8, 'delay_ms': 50, 'per_text_delay_ms': 10})
+    tasks = [ (b'TEXT', TextEmbeddingRequest(text=f'text {index}', return_dense=True).SerializeToString()) for index in range(3) ]
+    start = perf_counter()
+    responses = strategy.process_batch(tasks + [(b'UNKNOWN', b'')])
+    duration = perf_counter() - start
+    assert 0.08 <= duration < 0.15  # 50ms for the call and 10ms for each of the 3 texts
+    assert [ response.status for response in responses ] == [True, True, True, False]
+    assert 'encode' in strategy.stage_timer.reset()
+
+def test_busy_wait_holds_the_cpu():
+    strategy = StubStrategy({'dimension': 8, 'delay_ms': 20, 'busy_wait': True})
+    with patch('generic_vectorizer.strategies.stub.stub.sleep') as mock_sleep:
+        start = perf_counter()
+        embed(strategy, 'hello')
+        assert perf_counter() - start >= 0.02
+    mock_sleep.assert_not_called()
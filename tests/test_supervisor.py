@@ -0,0 +1,159 @@
+from unittest.mock import MagicMock, patch
+
+from generic_vectorizer.background_workers.embedder import EmbedderPool, WorkerHandle
+from generic_vectorizer.typing import EmbedderModelConfig, EmbedderModelType, AutoscalerConfig
+
+
+def build_pool():
+    config = EmbedderModelConfig(embedder_model_type=EmbedderModelType.STUB_MODEL, target_topic='stub', nb_instances=2, options={})
+    pool = EmbedderPool([config], restart_backoff=1.0, max_restart_backoff=4.0, stable_after=60.0)
+    pool.worker_handles = [ WorkerHandle(worker_id=f'worker-{index:03d}', config=config) for index in range(2) ]
+    return pool
+
+
+def crash(handle, exitcode=-9):
+    handle.process = MagicMock(exitcode=exitcode)
+
+
+def test_crashed_worker_is_restarted_with_exponential_backoff():
+    pool = build_pool()
+    crashing, healthy = pool.worker_handles
+    crashing.started_at, healthy.started_at = 0.0, 0.0
+    healthy.process = MagicMock(exitcode=None)
+
+    with patch.object(EmbedderPool, 'start_worker', autospec=True) as start_worker, patch.object(EmbedderPool, 'notify_router', autospec=True) as notify_router:
+        start_worker.side_effect = lambda pool, handle: setattr(handle, 'process', MagicMock(exitcode=None))
+        restart_delays = []
+        now = 1.0
+        for _ in range(4):
+            crash(crashing)
+            pool.supervise_workers(now)
+            restart_delays.append(crashing.restart_at - now)
+            pool.supervise_workers(crashing.restart_at - 0.01)  # too early
+            assert crashing.process is None
+            now = crashing.restart_at
+            pool.supervise_workers(now)
+            crashing.started_at = now
+
+    assert restart_delays == [1.0, 2.0, 4.0, 4.0]
+    assert crashing.restarts == 4 and healthy.restarts == 0
+    assert start_worker.call_count == 4
+    assert all(call.args[1] is crashing for call in start_worker.call_args_list)
+    assert notify_router.call_count == 4
+    assert notify_router.call_args.args[2]['exitcode'] == -9
+    assert pool.restart_counts() == {'worker-000': 4, 'worker-001': 0}
+
+
+def test_stable_worker_restarts_without_backoff_history():
+    pool = build_pool()
+    handle = pool.worker_handles[0]
+    handle.consecutive_crashes = 3
+    handle.started_at = 0.0
+    crash(handle, exitcode=1)
+
+    with patch.object(EmbedderPool, 'notify_router', autospec=True):
+        pool.supervise_workers(120.0)  # crashed after running longer than stable_after
+
+    assert handle.consecutive_crashes == 1
+    assert handle.restart_at == 121.0
+
+
+def test_pickled_pool_leaves_supervisor_state_in_the_parent():
+    pool = build_pool()
+    pool.ctx = MagicMock()
+    state = pool.__getstate__()
+    assert 'worker_handles' not in state and 'ctx' not in state and 'topic2notifier' not in state
+    assert state['embedder_model_configs'] == pool.embedder_model_configs
+
+
+def build_autoscaled_pool(budget=None):
+    configs = [
+        EmbedderModelConfig(embedder_model_type=EmbedderModelType.STUB_MODEL, target_topic=topic, nb_instances=1, min_instances=1, max_instances=3, instance_cost=cost, options={})
+        for topic, cost in [('embedding', 1.0), ('rerank', 2.0)]
+    ]
+    pool = EmbedderPool(configs, autoscaler_config=AutoscalerConfig(interval=5, cooldown=10, budget=budget, scale_up_queue_depth=4, scale_up_utilisation=0.9, scale_down_utilisation=0.2))
+    for index, config in enumerate(configs):
+        pool.worker_handles.append(WorkerHandle(worker_id=f'worker-{index:03d}', config=config, process=MagicMock(exitcode=None)))
+    pool.next_worker_id = len(configs)
+    return pool
+
+
+def load_report(queue_depth, busy_seconds, idle=0, busy=1):
+    return {'queue_depth': queue_depth, 'idle': idle, 'busy': busy, 'busy_seconds': busy_seconds}
+
+
+def test_autoscaler_scales_on_queue_pressure_and_utilisation():
+    pool = build_autoscaled_pool()
+    # first report : no utilisation yet, only the queue depth counts
+    assert pool.plan_scaling(0.0, {'embedding': load_report(8, 0.0), 'rerank': load_report(0, 0.0, idle=1, busy=0)}) == {'embedding': 1}
+    # rerank was busy 95% of the window, embedding 10% with an empty queue but it is already at min_instances
+    assert pool.plan_scaling(10.0, {'embedding': load_report(0, 1.0), 'rerank': load_report(0, 9.5)}) == {'rerank': 1}
+
+
+def test_autoscaler_scales_down_idle_topics_within_bounds():
+    pool = build_autoscaled_pool()
+    config = pool.embedder_model_configs[0]
+    pool.worker_handles.append(WorkerHandle(worker_id='worker-002', config=config, process=MagicMock(exitcode=None)))
+    pool.plan_scaling(0.0, {'embedding': load_report(0, 0.0, idle=2, busy=0)})
+    assert pool.plan_scaling(10.0, {'embedding': load_report(0, 1.0, idle=2, busy=0)}) == {'embedding': -1}
+    # jobs are still queued : no scale down even if the workers look idle
+    assert pool.plan_scaling(20.0, {'embedding': load_report(1, 1.0, idle=2, busy=0)}) == {}
+
+
+def test_autoscaler_respects_the_budget_and_the_cooldown():
+    pool = build_autoscaled_pool(budget=4.0)  # 3.0 is used by the two initial workers
+    decisions = pool.plan_scaling(0.0, {'embedding': load_report(8, 0.0), 'rerank': load_report(20, 0.0)})
+    assert decisions == {'embedding': 1}  # rerank has more pressure but a rerank worker costs 2.0
+
+    pool.topic2scaled_at['embedding'] = 0.0
+    assert pool.plan_scaling(5.0, {'embedding': load_report(8, 5.0), 'rerank': load_report(0, 0.0, idle=1, busy=0)}) == {}
+
+
+def test_autoscale_spawns_and_retires_the_most_recent_worker():
+    pool = build_autoscaled_pool()
+    config = pool.embedder_model_configs[0]
+    pool.worker_handles.append(WorkerHandle(worker_id='worker-002', config=config, process=MagicMock(exitcode=None)))
+    pool.next_worker_id = 3
+    with patch.object(EmbedderPool, 'start_worker', autospec=True), patch.object(EmbedderPool, 'collect_load_reports', return_value={}), \
+         patch.object(EmbedderPool, 'plan_scaling', return_value={'embedding': -1, 'rerank': 1}), patch.object(EmbedderPool, 'notifier') as notifier:
+        pool.autoscale(100.0)
+
+    assert [ (handle.worker_id, handle.retiring) for handle in pool.worker_handles ] == [('worker-000', False), ('worker-001', False), ('worker-002', True), ('worker-003', False)]
+    assert pool.worker_handles[-1].config.target_topic == 'rerank'
+    notifier.return_value.send_multipart.assert_called_once()
+    assert notifier.return_value.send_multipart.call_args.args[0][1:3] == [b'RETIRE', b'worker-002']
+    assert pool.topic2scaled_at == {'embedding': 100.0, 'rerank': 100.0}
+
+    # the retired worker exits cleanly : it leaves the pool and is not restarted
+    pool.worker_handles[2].process = MagicMock(exitcode=0)
+    with patch.object(EmbedderPool, 'notify_router', autospec=True) as notify_router:
+        pool.supervise_workers(101.0)
+    notify_router.assert_not_called()
+    assert [ handle.worker_id for handle in pool.worker_handles ] == ['worker-000', 'worker-001', 'worker-003']
+
+
+def test_shared_weights_are_loaded_once_in_the_parent():
+    configs = [
+        EmbedderModelConfig(embedder_model_type=EmbedderModelType.STUB_MODEL, target_topic='shared', nb_instances=2, share_weights=True, options={}),
+        EmbedderModelConfig(embedder_model_type=EmbedderModelType.STUB_MODEL, target_topic='cuda', nb_instances=2, share_weights=True, options={'device': 'cuda:0'}),
+        EmbedderModelConfig(embedder_model_type=EmbedderModelType.STUB_MODEL, target_topic='private', nb_instances=2, options={}),
+        EmbedderModelConfig(embedder_model_type=EmbedderModelType.STUB_MODEL, target_topic='onnx', nb_instances=2, share_weights=True, options={'backend': 'onnxruntime'})
+    ]
+    pool = EmbedderPool(configs)
+    with patch('generic_vectorizer.background_workers.embedder.mp.get_start_method', return_value='fork'), patch('generic_vectorizer.background_workers.embedder.gc.freeze') as freeze:
+        pool.load_shared_strategies()
+    freeze.assert_called_once()
+    assert list(pool.topic2shared_strategy) == ['shared']  # cuda contexts and onnxruntime thread pools do not survive a fork
+
+    shared_strategy = pool.topic2shared_strategy['shared']
+    assert pool.load_strategy(configs[0]) is shared_strategy and pool.load_strategy(configs[0]) is shared_strategy
+    assert pool.load_strategy(configs[2]) is not pool.load_strategy(configs[2])
+    assert 'topic2shared_strategy' not in pool.__getstate__()
+
+
+def test_shared_weights_need_the_fork_start_method():
+    config = EmbedderModelConfig(embedder_model_type=EmbedderModelType.STUB_MODEL, target_topic='shared', share_weights=True, options={})
+    pool = EmbedderPool([config])
+    with patch('generic_vectorizer.background_workers.embedder.mp.get_start_method', return_value='spawn'):
+        pool.load_shared_strategies()
+    assert pool.topic2shared_strategy == {}
@@ -0,0 +1,109 @@
+import json
+import asyncio
+
+from time import sleep
+
+from generic_vectorizer.tracing import Trace, StageTimer, OTLPFileExporter
+
+def test_trace_round_trip_through_the_frames():
+    trace = Trace('getTextEmbedding')
+    trace.mark('admitted', at=trace.marks['received'] + 0.001)
+    encoded_trace = trace.encode()
+    assert json.loads(encoded_trace)['trace_id'] == trace.trace_id
+
+    # the router and the worker only annotate the encoded frame
+    encoded_trace = Trace.annotate(encoded_trace, marks={'enqueued': trace.marks['received'] + 0.002, 'dispatched': trace.marks['received'] + 0.005})
+    encoded_trace = Trace.annotate(encoded_trace, marks={'worker_received': trace.marks['received'] + 0.006, 'worker_sent': trace.marks['received'] + 0.016}, durations={'encode': 0.008})
+    assert Trace.annotate(b'', marks={'enqueued': 1.0}) == b''  # untraced jobs stay untouched
+
+    trace.merge(encoded_trace)
+    trace.merge(b'')
+    trace.mark('response_received', at=trace.marks['received'] + 0.017)
+    trace.mark('done', at=trace.marks['received'] + 0.020)
+
+    timings = trace.timings_ms()
+    assert timings['admission'] == 1.0
+    assert timings['broker'] == 1.0
+    assert timings['queue'] == 3.0
+    assert timings['dispatch'] == 1.0
+    assert timings['worker'] == 10.0
+    assert timings['response'] == 1.0
+    assert timings['parse'] == 3.0
+    assert timings['total'] == 20.0
+    assert timings['worker.encode'] == 8.0
+
+def test_timings_skip_missing_stages():
+    trace = Trace('getTextEmbedding')
+    trace.mark('done', at=trace.marks['received'] + 0.002)  # cache hit : the request never reached the broker
+    assert trace.timings_ms() == {'total': 2.0}
+
+def test_trace_continues_the_caller_traceparent():
+    trace = Trace.from_traceparent('getTextEmbedding', '00-0af7651916cd43dd8448eb211c80319c-b7ad6b7169203331-01')
+    assert trace.trace_id == '0af7651916cd43dd8448eb211c80319c'
+    assert trace.parent_span_id == 'b7ad6b7169203331'
+    assert trace.sampled
+    assert len(trace.span_id) == 16 and trace.span_id != trace.parent_span_id
+
+    assert not Trace.from_traceparent('getTextEmbedding', '00-0af7651916cd43dd8448eb211c80319c-b7ad6b7169203331-00').sampled
+    assert Trace.from_traceparent('getTextEmbedding', 'not-a-traceparent') is None
+    assert Trace.from_traceparent('getTextEmbedding', None) is None
+
+def test_stage_timer_accumulates_until_reset():
+    stage_timer = StageTimer()
+    for _ in range(2):
+        with stage_timer.stage('encode'):
+            sleep(0.01)
+    try:
+        with stage_timer.stage('aggregate'):
+            raise ValueError()
+    except ValueError:
+        pass
+
+    durations = stage_timer.reset()
+    assert durations['encode'] >= 0.02
+    assert 'aggregate' in durations
+    assert stage_timer.reset() == {}
+
+def test_otlp_file_exporter_writes_one_request_per_line(tmp_path):
+    export_path = tmp_path / 'traces.jsonl'
+    exporter = OTLPFileExporter(str(export_path))
+    trace = Trace.from_traceparent('getTextEmbedding', '00-0af7651916cd43dd8448eb211c80319c-b7ad6b7169203331-01')
+    received = trace.marks['received']
+    trace.mark('admitted', at=received + 0.001)
+    trace.merge(json.dumps({'marks': {'worker_received': received + 0.002, 'worker_sent': received + 0.004}, 'durations': {'encode': 0.0015}}).encode())
+    trace.mark('done', at=received + 0.005)
+    for _ in range(2):
+        exporter.export(trace, {'target_topic': 'bge_m3'})
+    exporter.close()
+
+    lines = export_path.read_text().splitlines()
+    assert len(lines) == 2
+    spans = json.loads(lines[0])['resourceSpans'][0]['scopeSpans'][0]['spans']
+    root_span, *stage_spans = spans
+    assert root_span['name'] == 'getTextEmbedding'
+    assert root_span['traceId'] == '0af7651916cd43dd8448eb211c80319c'
+    assert root_span['parentSpanId'] == 'b7ad6b7169203331'
+    assert root_span['kind'] == 2
+    assert int(root_span['endTimeUnixNano']) - int(root_span['startTimeUnixNano']) == int((received + 0.005) * 1e9) - int(received * 1e9)
+    assert root_span['attributes'] == [{'key': 'target_topic', 'value': {'stringValue': 'bge_m3'}}]
+
+    assert [ span['name'] for span in stage_spans ] == ['admission', 'worker']
+    assert all(span['parentSpanId'] == root_span['spanId'] and span['kind'] == 1 for span in stage_spans)
+    assert stage_spans[1]['attributes'] == [{'key': 'worker.encode_ms', 'value': {'doubleValue': 1.5}}]
+
+def test_otlp_file_exporter_batches_writes_off_the_event_loop(tmp_path):
+    export_path = tmp_path / 'traces.jsonl'
+    exporter = OTLPFileExporter(str(export_path))
+
+    async def main():
+        for _ in range(10):
+            trace = Trace('getTextEmbedding', sampled=True)
+            trace.mark('done')
+            exporter.export(trace)
+        return len(exporter.pending_requests), export_path.read_text()
+
+    pending_requests, written = asyncio.run(main())
+    assert pending_requests == 10 and written == ''  # queued until the delayed flush, nothing written on the request path
+    exporter.close()
+    assert len(export_path.read_text().splitlines()) == 10
+    exporter.close()